@@ -0,0 +1,153 @@
+''' Optional event loop web server (--server async) for the long lived web UI connections.
+	Under Flask every MJPEG viewer and every status log holds a thread of its own, all of them competing for the GIL with the
+	detection thread. Here /video_feed_frame, /status_text and /get_coord run on a single tornado event loop: a viewer holds no
+	thread, it awaits a Condition that the preview encoder and the status bus notify through one add_callback per new frame or
+	status, however many viewers there are.
+	All other routes are the Flask app, run by tornado's WSGI container.
+'''
+import asyncio
+import concurrent.futures
+import functools
+from tornado import locks, web
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+from tornado.wsgi import WSGIContainer
+from status_bus import sse_event
+from defaults import *
+
+class Notifier:
+	''' a tornado Condition that other threads can notify '''
+	def __init__(self, loop):
+		self.loop = loop
+		self.condition = locks.Condition()
+
+	def notify(self):
+		# called from the encoder or status thread: the waiters are woken on the loop
+		self.loop.add_callback(self.condition.notify_all)
+
+	def wait(self, timeout = None):
+		return self.condition.wait(None if timeout is None else self.loop.time() + timeout)
+
+
+class SourceHandler(web.RequestHandler):
+	def initialize(self, sources):
+		self.sources = sources # name: (source, preview Notifier, status Notifier)
+		self.gone = False
+		self.notifiers = ()
+
+	def source(self):
+		# the source a request is for (?source=name), the first one by default
+		name = self.get_argument('source', None)
+		if name is None:
+			name = next(iter(self.sources))
+		if name not in self.sources:
+			raise web.HTTPError(404, f'no such source {name}')
+		self.notifiers = self.sources[name][1:]
+		return self.sources[name]
+
+	def int_argument(self, name, default = 0):
+		try:
+			return int(self.get_argument(name, default))
+		except ValueError:
+			return default
+
+	def on_connection_close(self):
+		# wake the handler up to leave. the other viewers of the source check and wait again
+		self.gone = True
+		for notifier in self.notifiers:
+			notifier.condition.notify_all()
+
+
+class VideoFeedHandler(SourceHandler):
+	async def get(self):
+		source, frames, status = self.source()
+		hub = source.frame_hub
+		self.set_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+		hub.attach()
+		seen = None
+		try:
+			while not self.gone and not hub.closed:
+				count, jpeg = hub.latest(seen)
+				if jpeg is None or count == seen:
+					await frames.wait()
+					continue
+				seen = count
+				self.write(jpeg)
+				# a slow viewer waits here, then jumps to the newest frame
+				await self.flush()
+		except StreamClosedError:
+			pass
+		finally:
+			hub.detach()
+
+
+class StatusHandler(SourceHandler):
+	async def get(self):
+		source, frames, status = self.source()
+		bus = source.status_bus
+		self.set_header('Content-Type', 'text/event-stream')
+		self.set_header('Cache-Control', 'no-cache')
+		# EventSource sends the id of the last event it got when it reconnects
+		last_event_id = self.request.headers.get('Last-Event-ID', '')
+		cursor = bus.cursor(int(last_event_id) if last_event_id.isdigit() else None)
+		try:
+			while not self.gone:
+				events, cursor, check_again = bus.events_after(cursor)
+				if not events:
+					await status.wait(check_again) # a held back flip is due in check_again seconds
+					continue
+				self.write(''.join(sse_event(*event) for event in events))
+				await self.flush()
+		except StreamClosedError:
+			pass
+
+
+class CoordHandler(SourceHandler):
+	async def get(self):
+		source, frames, status = self.source()
+		x = self.int_argument('x')
+		y = self.int_argument('y')
+		self.set_header('Content-Type', 'text/html')
+		try:
+			# a detector process answers over a pipe, don't hold up the loop meanwhile
+			await IOLoop.current().run_in_executor(None, functools.partial(source.set_detect_rect, y, x, zone = self.get_argument('zone', None)))
+		except ValueError as e:
+			self.set_status(400)
+			self.finish(str(e))
+			return
+		self.finish('ok')
+
+
+def make_app(wsgi_app, sources):
+	''' sources maps names to (source, preview Notifier, status Notifier) '''
+	try:
+		container = WSGIContainer(wsgi_app, executor = concurrent.futures.ThreadPoolExecutor(DEFAULT_ASYNC_WSGI_THREADS))
+	except TypeError: # before tornado 6.3 WSGI requests run on the loop
+		container = WSGIContainer(wsgi_app)
+	routes = dict(sources = sources)
+	return web.Application([
+		(r'/video_feed_frame', VideoFeedHandler, routes),
+		(r'/status_text', StatusHandler, routes),
+		(r'/get_coord', CoordHandler, routes),
+		(r'.*', web.FallbackHandler, dict(fallback = container)),
+	])
+
+async def _serve(wsgi_app, sources, host, port, on_listen):
+	loop = IOLoop.current()
+	live = {}
+	for name, source in sources.items():
+		live[name] = (source, Notifier(loop), Notifier(loop))
+		source.frame_hub.add_listener(live[name][1].notify)
+		source.status_bus.add_listener(live[name][2].notify)
+	make_app(wsgi_app, live).listen(port, host)
+	print (f"running tornado on {host}:{port}")
+	if on_listen:
+		on_listen()
+	await asyncio.Event().wait()
+
+def serve(wsgi_app, sources, host, port, on_listen = None):
+	''' serves until interrupted. sources are MotionDetectors or SourceProcesses, by name. on_listen() is called once the port is open '''
+	try:
+		asyncio.run(_serve(wsgi_app, sources, host, port, on_listen))
+	except KeyboardInterrupt:
+		pass
@@ -0,0 +1,129 @@
+''' Background models for motion detection. A model turns the blurred grayscale detection square into a difference image
+	that FrameDetector thresholds. delta() returns None on the first frame after a reset, while the model takes its reference.
+	update() is called after every processed frame with whether motion was found in it and its motion mask (the thresholded
+	difference image), so adaptive models
+	can stop learning where a subject is, for at most max_freeze seconds, so a permanent scene change is eventually absorbed.
+	The running average does so per pixel: the rest of the scene keeps following the lighting while a bird sits in the zone.
+	The OpenCV subtractors only have a global learning rate, they freeze as a whole while there is motion anywhere.
+'''
+import cv2
+import numpy as np
+from defaults import *
+
+class StaticBackground:
+	''' the first frame after a reset is the reference until the next reset (the original timer-rebased behaviour) '''
+	adaptive = False
+
+	def __init__(self, **kwargs):
+		self.reference = None
+
+	def reset(self):
+		self.reference = None
+
+	def delta(self, gray):
+		if self.reference is None:
+			self.reference = gray
+			return None
+		return cv2.absdiff(self.reference, gray)
+
+	def update(self, gray, motion, thresh, frame_time):
+		pass
+
+
+class AdaptiveBackground:
+	adaptive = True
+
+	def __init__(self, alpha = DEFAULT_BACKGROUND_ALPHA, max_freeze = DEFAULT_BACKGROUND_MAX_FREEZE_SEC):
+		self.alpha = alpha
+		self.max_freeze = max_freeze
+		self.motion_since = None
+
+	def _learning(self, motion, frame_time):
+		# learn while the scene is still, freeze while something moves, unless it has not stopped moving for max_freeze seconds
+		if not motion:
+			self.motion_since = None
+			return True
+		if self.motion_since is None:
+			self.motion_since = frame_time
+		return frame_time - self.motion_since > self.max_freeze
+
+
+class RunningAverageBackground(AdaptiveBackground):
+	''' exponential running average of the scene (cv2.accumulateWeighted), updated incrementally on every frame, in the pixels
+		without motion, and in those that did not stop moving for max_freeze seconds '''
+	def __init__(self, **kwargs):
+		AdaptiveBackground.__init__(self, **kwargs)
+		self.reset()
+
+	def reset(self):
+		self.average = None
+		self.reference = None
+		self.still_at = None # per pixel frame time it was last seen without motion
+
+	def delta(self, gray):
+		if self.average is None or self.average.shape != gray.shape:
+			self.average = gray.astype(np.float32)
+			self.reference = gray.copy()
+			return None
+		return cv2.absdiff(self.reference, gray)
+
+	def update(self, gray, motion, thresh, frame_time):
+		if self.still_at is None or self.still_at.shape != gray.shape:
+			self.still_at = np.full(gray.shape, frame_time)
+		still = thresh == 0
+		self.still_at[still] = frame_time
+		learn = still | (frame_time - self.still_at > self.max_freeze)
+		mask = learn.view(np.uint8)
+		before = cv2.mean(self.average, mask)[0]
+		cv2.accumulateWeighted(gray, self.average, self.alpha, mask = mask)
+		if before and not learn.all():
+			# the frozen pixels follow the brightness change of the learning ones, so lighting drift under a bird doesn't leave its ghost
+			self.average[~learn] *= cv2.mean(self.average, mask)[0] / before
+		cv2.convertScaleAbs(self.average, dst = self.reference) # keep a uint8 copy so delta() is a plain absdiff
+
+
+# learning rate of a frozen subtractor. KNN derives its sample update periods from the rate, and with 0 it stops detecting at all
+FROZEN_RATE = {'mog2': 0, 'knn': 1e-6}
+KNN_WARMUP_FRAMES = 8 # times the reference frame is fed to a new KNN subtractor
+
+class SubtractorBackground(AdaptiveBackground):
+	''' OpenCV MOG2 / KNN background subtractors. their foreground mask is used as the difference image.
+		the subtractor learns inside apply(), so freezing follows the motion state of the previous frame.
+	'''
+	def __init__(self, kind, **kwargs):
+		AdaptiveBackground.__init__(self, **kwargs)
+		self.kind = kind
+		self.reset()
+
+	def reset(self):
+		self.subtractor = None
+		self.learn = True
+		self.motion_since = None
+
+	def delta(self, gray):
+		if self.subtractor is None:
+			if self.kind == 'mog2':
+				self.subtractor = cv2.createBackgroundSubtractorMOG2(detectShadows = False)
+				self.subtractor.apply(gray, learningRate = 1)
+			else:
+				# KNN needs several matching samples per pixel, a single frame leaves everything foreground
+				self.subtractor = cv2.createBackgroundSubtractorKNN(detectShadows = False)
+				for i in range(KNN_WARMUP_FRAMES):
+					self.subtractor.apply(gray, learningRate = 0.5)
+			return None
+		return self.subtractor.apply(gray, learningRate = self.alpha if self.learn else FROZEN_RATE[self.kind])
+
+	def update(self, gray, motion, thresh, frame_time):
+		self.learn = self._learning(motion, frame_time)
+
+
+BACKGROUND_MODELS = ('static', 'running-average', 'mog2', 'knn')
+
+def make_background(model = DEFAULT_BACKGROUND_MODEL, alpha = DEFAULT_BACKGROUND_ALPHA, max_freeze = DEFAULT_BACKGROUND_MAX_FREEZE_SEC):
+	if model == 'static':
+		return StaticBackground()
+	if model == 'running-average':
+		return RunningAverageBackground(alpha = alpha, max_freeze = max_freeze)
+	if model in ('mog2', 'knn'):
+		return SubtractorBackground(model, alpha = alpha, max_freeze = max_freeze)
+	raise ValueError(f'unknown background model {model}, expected one of {BACKGROUND_MODELS}')
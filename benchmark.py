@@ -0,0 +1,482 @@
+''' Benchmarks for the detection hot paths. Results are printed and appended as JSON lines to --out,
+	so runs on the Pi can be compared over time.
+	No hardware is needed: without clips the detection benchmarks run on a synthetic scene (synthetic_scene.py), and the camera
+	benchmarks on a FakeCamera (fake_camera.py). "all" runs every benchmark, and --compare fails the run when a timing got slower
+	than in a previous results file, so hot path regressions are caught before they reach the field.
+'''
+import argparse
+import collections
+from functools import reduce
+import functools
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+from multiprocessing import Pipe, Process
+from multiprocessing.managers import SyncManager
+from queue import PriorityQueue
+import time
+import cv2
+import imutils
+import numpy as np
+import yaml
+from camera_control import CameraConfig, CameraControlMsg, CameraControlManagerSubProcess, CommandChannel, capture_image, set_capture_target, CAPTURE_IMAGE
+from detection import FrameDetector, Zone, TriggerWindow, detect_rect, find_boxes, load_zones, BLUR_TYPES, TRIGGER_MODES
+from fake_camera import FakeCamera, GP_CAPTURE_IMAGE
+from frame_hub import FrameHub, compose_preview, preview_shape
+from motion_detector import MotionDetector
+from settings_store import SettingsStore
+from synthetic_scene import SyntheticScene
+from background import BACKGROUND_MODELS
+from sweep import decode_clip, load_labels, score
+from defaults import *
+
+def timing_stats(samples):
+	ms = np.asarray(samples) * 1000
+	return {'mean_ms': round(float(ms.mean()), 4), 'p50_ms': round(float(np.percentile(ms, 50)), 4), 'p95_ms': round(float(np.percentile(ms, 95)), 4)}
+
+def load_gray_clips(clips, center, side, frame_resize):
+	''' decode every clip once into memory as grayscale detection squares: {clip: (fps, [frames])} '''
+	decoded = {}
+	for clip in clips:
+		frames = decode_clip(clip, center, side, frame_resize)
+		fps = next(frames)[0]
+		decoded[clip] = (fps, list(frames))
+	return decoded
+
+def synthetic_clips(args):
+	''' the synthetic scene as a clip: grayscale detection squares around the perch, and the labels of the bird visits '''
+	scene = SyntheticScene(perch = args.center, seconds = args.seconds)
+	rect = detect_rect(*args.center, args.capture_square_side, scene.shape)
+	return {'synthetic': (scene.fps, [cv2.cvtColor(frame[rect], cv2.COLOR_BGR2GRAY) for frame in scene.frames()])}, {'synthetic': scene.labels()}
+
+def detector_for(args, shape, **settings):
+	# a single zone covering a whole pre-cropped detection square of the given shape
+	zone = Zone('bench', shape[0] // 2, shape[1] // 2, args.capture_square_side, args.triggered_area_percent, args.frames_to_trigger, args.retrigger_interval)
+	return FrameDetector([zone], shape, rebase_interval = args.rebase_interval, **settings)
+
+def bench_background(args, decoded, labels):
+	''' false-trigger rate and per-frame cost of each background model. "static" with the rebase interval is the original approach '''
+	results = []
+	for model in args.background_model:
+		samples, triggers, false_triggers, duration = [], 0, 0, 0
+		for clip, (fps, frames) in decoded.items():
+			det = detector_for(args, frames[0].shape, background_model = model)
+			fired = []
+			for i, gray in enumerate(frames):
+				t = i / fps
+				start = time.perf_counter()
+				if det.process_gray(gray, t).fired:
+					fired.append(t)
+				samples.append(time.perf_counter() - start)
+			tp, found = score(fired, labels.get(clip, []), args.tolerance)
+			triggers += len(fired)
+			false_triggers += len(fired) - tp
+			duration += len(frames) / fps
+		results.append(dict({'benchmark': 'background', 'model': model, 'frames': len(samples), 'triggers': triggers,
+			'false_triggers': false_triggers, 'false_triggers_per_hour': round(false_triggers * 3600 / duration, 2)}, **timing_stats(samples)))
+	return results
+
+def bench_scale(args, decoded, labels):
+	''' per-frame detection cost and triggers at each detection scale and blur type '''
+	results = []
+	for scene, (fps, frames) in decoded.items():
+		for scale in args.detection_scale:
+			for blur_type in args.blur_type:
+				det = detector_for(args, frames[0].shape, background_model = args.background_model[0], detection_scale = scale, blur_type = blur_type)
+				samples, fired = [], []
+				for i, gray in enumerate(frames):
+					t = i / fps
+					start = time.perf_counter()
+					if det.process_gray(gray, t).fired:
+						fired.append(t)
+					samples.append(time.perf_counter() - start)
+				tp, found = score(fired, labels.get(scene, []), args.tolerance)
+				results.append(dict({'benchmark': 'scale', 'scene': scene, 'detection_scale': scale, 'blur_type': blur_type, 'frames': len(samples),
+					'triggers': len(fired), 'false_triggers': len(fired) - tp if scene in labels else None}, **timing_stats(samples)))
+	return results
+
+def legacy_boxes(thresh, min_area):
+	# the contour loop FrameDetector used before find_boxes
+	cnts = imutils.grab_contours(cv2.findContours(thresh.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE))
+	return [cv2.boundingRect(c) for c in cnts if cv2.contourArea(c) >= min_area]
+
+def foliage_masks(count, side, seed = 0):
+	''' thresholded frames of wind-blown leaves: hundreds of small blobs, plus a bird-sized one every other frame '''
+	rng = np.random.default_rng(seed)
+	masks = []
+	for i in range(count):
+		mask = np.zeros((side, side), np.uint8)
+		mask[rng.integers(0, side, 400), rng.integers(0, side, 400)] = 255
+		mask = cv2.dilate(mask, None)
+		if i % 2:
+			cv2.circle(mask, (side // 2, side // 2), side // 6, 255, -1)
+		masks.append(mask)
+	return masks
+
+def bench_trigger(args, decoded, labels):
+	''' per-frame cost of the trigger window and of box filtering: the old deque reduce and contour loop against TriggerWindow and find_boxes '''
+	results = []
+	min_area = args.triggered_area_percent * args.capture_square_side ** 2
+	scenes = {'foliage': foliage_masks(500, args.capture_square_side)}
+	for clip, (fps, frames) in decoded.items():
+		# threshold images as FrameDetector produces them
+		reference = cv2.GaussianBlur(frames[0], (DEFAULT_BLUR_KERNEL, DEFAULT_BLUR_KERNEL), 0)
+		scenes[clip] = [cv2.dilate(cv2.threshold(cv2.absdiff(reference, cv2.GaussianBlur(f, (DEFAULT_BLUR_KERNEL, DEFAULT_BLUR_KERNEL), 0)), DEFAULT_DIFF_THRESHOLD, 255, cv2.THRESH_BINARY)[1], None, iterations=2) for f in frames]
+	for scene, masks in scenes.items():
+		for name, boxes in (('contours', legacy_boxes), ('connected-components', find_boxes)):
+			samples = []
+			for mask in masks:
+				start = time.perf_counter()
+				boxes(mask, min_area)
+				samples.append(time.perf_counter() - start)
+			results.append(dict({'benchmark': 'trigger', 'stage': 'boxes', 'scene': scene, 'method': name, 'frames': len(samples)}, **timing_stats(samples)))
+	detections = np.random.default_rng(0).random(20000) < 0.9
+	for window in sorted({args.frames_to_trigger, 8 * args.frames_to_trigger}):
+		last_detected = collections.deque(window*[0], window)
+		trigger_window = TriggerWindow([window])
+		for name in ('deque-reduce', 'trigger-window'):
+			samples = []
+			for d in detections:
+				start = time.perf_counter()
+				if name == 'deque-reduce':
+					last_detected.append(int(d))
+					reduce ((lambda x,y: x>0 and y>0), last_detected)
+				else:
+					trigger_window.update(np.array([d]))
+				samples.append(time.perf_counter() - start)
+			results.append(dict({'benchmark': 'trigger', 'stage': 'window', 'frames_to_trigger': window, 'method': name, 'frames': len(samples)}, **timing_stats(samples)))
+	return results
+
+def legacy_capture_image(camera, autofocus = True):
+	# capture_image before the config cache: the whole config tree is fetched and pushed on every shot
+	if autofocus:
+		conf = camera.get_config()
+		conf.get_child_by_name('actions').get_child_by_name('autofocusdrive').set_value(1)
+		camera.set_config(conf)
+	return camera.capture(GP_CAPTURE_IMAGE)
+
+def bench_camera(args, decoded, labels):
+	''' per-shot latency of an autofocus + capture on a mocked camera, without (legacy) and with the config cache.
+		cached-tree is a camera without single widget support, where the cached tree is pushed
+	'''
+	results = []
+	for method in ('legacy', 'cached-tree', 'cached-single'):
+		camera = FakeCamera(args.usb_round_trip_ms / 1000, args.usb_widget_ms / 1000, args.config_widgets, single_config = method == 'cached-single', capture_delay = 0)
+		start = time.perf_counter()
+		config = None if method == 'legacy' else CameraConfig(camera)
+		if config:
+			set_capture_target(camera, 1, config = config)
+		else:
+			camera.set_config(camera.get_config()) # the old set_capture_target
+		init = time.perf_counter() - start
+		samples = []
+		for i in range(args.shots):
+			start = time.perf_counter()
+			if config:
+				capture_image(camera, autofocus = True, config = config)
+			else:
+				legacy_capture_image(camera)
+			samples.append(time.perf_counter() - start)
+		results.append(dict({'benchmark': 'camera', 'method': method, 'shots': args.shots, 'init_ms': round(init * 1000, 2)}, **timing_stats(samples)))
+	return results
+
+class LegacyQueueManager(SyncManager):
+	# the camera command queue before CommandChannel: a PriorityQueue proxied through a manager process
+	pass
+
+LegacyQueueManager.register('PriorityQueue', PriorityQueue)
+
+def ipc_worker(commands, results, count):
+	# camera worker stand-in: how long after submit_task each command was received
+	latencies = []
+	for i in range(count):
+		msg = commands.get()
+		latencies.append(time.perf_counter() - msg.args)
+		commands.task_done()
+	results.send(latencies)
+
+def bench_ipc(args, decoded, labels):
+	''' camera command latency, from submit in the detection process to receipt in the camera worker process '''
+	results = []
+	for method in ('syncmanager-priorityqueue', 'pipe-channel'):
+		manager = None
+		if method == 'pipe-channel':
+			commands = CommandChannel()
+		else:
+			manager = LegacyQueueManager()
+			manager.start()
+			commands = manager.PriorityQueue()
+		reader, writer = Pipe(duplex = False)
+		worker = Process(target = ipc_worker, args = (commands, writer, args.messages))
+		worker.start()
+		submit = []
+		for i in range(args.messages):
+			start = time.perf_counter() # system wide monotonic clock, comparable in the worker
+			commands.put(CameraControlMsg(CAPTURE_IMAGE, start))
+			submit.append(time.perf_counter() - start)
+			time.sleep(0.002) # commands are sparse, the worker is waiting for each one
+		received = reader.recv()
+		commands.join()
+		worker.join()
+		if manager:
+			manager.shutdown()
+		results.append(dict({'benchmark': 'ipc', 'method': method, 'messages': args.messages},
+			**{'submit_' + k: v for k, v in timing_stats(submit).items()}, **{'receive_' + k: v for k, v in timing_stats(received).items()}))
+	return results
+
+# synthetic scenes isolating one thing a detector has to cope with
+SCENE_CONDITIONS = {
+	'still': dict(visits = 0, drift = 0, leaves = 0),
+	'birds': dict(drift = 0, leaves = 0),
+	'drift': dict(visits = 0, leaves = 0),
+	'foliage': dict(visits = 0, drift = 0),
+	'all': {},
+}
+
+def bench_detector(args, decoded, labels):
+	''' full frame detection cost (grayscale conversion, crop, blur, background, boxes, trigger, drawing) and false triggers
+		on synthetic scenes of each condition, with the first --background-model '''
+	results = []
+	for condition, settings in SCENE_CONDITIONS.items():
+		scene = SyntheticScene(perch = args.center, seconds = args.seconds, **settings)
+		frames = list(scene.frames())
+		zone = Zone('bench', *args.center, args.capture_square_side, args.triggered_area_percent, args.frames_to_trigger, args.retrigger_interval)
+		det = FrameDetector([zone], scene.shape, rebase_interval = args.rebase_interval, background_model = args.background_model[0])
+		samples, fired = [], []
+		for i, frame in enumerate(frames):
+			t = i / scene.fps
+			start = time.perf_counter()
+			if det.process(frame, t).fired:
+				fired.append(t)
+			samples.append(time.perf_counter() - start)
+		tp, found = score(fired, scene.labels(), args.tolerance)
+		results.append(dict({'benchmark': 'detector', 'condition': condition, 'model': args.background_model[0], 'frames': len(samples),
+			'triggers': len(fired), 'false_triggers': len(fired) - tp, 'visits_found': f'{found}/{len(scene.labels())}'}, **timing_stats(samples)))
+	return results
+
+def bench_shots(args, decoded, labels):
+	''' keeper rate of each --trigger-mode on a synthetic scene of long visits where the perched bird hops to the edge of the zone and
+		back: a shot is a keeper when the bird is still and within a quarter zone side of the perch at the frame it fires on.
+		with the default background model, which follows the scene's lighting drift '''
+	results = []
+	scene = SyntheticScene(perch = args.center, seconds = 45, visits = 3, visit_seconds = 10, hop_every = 1.5)
+	frames = list(scene.frames())
+	quarter = args.capture_square_side / 4
+	for mode in args.trigger_mode:
+		zone = Zone('bench', *args.center, args.capture_square_side, args.triggered_area_percent, args.frames_to_trigger, args.retrigger_interval)
+		det = FrameDetector([zone], scene.shape, rebase_interval = args.rebase_interval, trigger_mode = mode, shots_per_minute = args.shots_per_minute, min_trigger_score = args.min_trigger_score)
+		samples, shots, keepers, no_bird, scores = [], 0, 0, 0, []
+		for i, frame in enumerate(frames):
+			t = i / scene.fps
+			start = time.perf_counter()
+			detection = det.process(frame, t)
+			samples.append(time.perf_counter() - start)
+			for s in detection.fired_scores:
+				bird = scene.bird(t)
+				shots += 1
+				scores.append(s)
+				if bird is None:
+					no_bird += 1
+				elif bird[2] and abs(bird[0] - scene.perch[0]) <= quarter and abs(bird[1] - scene.perch[1]) <= quarter:
+					keepers += 1
+		results.append(dict({'benchmark': 'shots', 'trigger_mode': mode, 'shots_per_minute': args.shots_per_minute, 'frames': len(samples),
+			'shots': shots, 'keepers': keepers, 'keeper_rate': round(keepers / shots, 3) if shots else None, 'no_bird_shots': no_bird,
+			'mean_score': round(float(np.mean(scores)), 3) if scores else None}, **timing_stats(samples)))
+	return results
+
+def bench_encode(args, decoded, labels):
+	''' cost of one web UI preview frame, done once per encoded frame whatever the number of viewers: composition and JPEG encoding '''
+	results = []
+	scene = SyntheticScene(perch = args.center, seconds = 5)
+	zone = Zone('bench', *args.center, args.capture_square_side, args.triggered_area_percent, args.frames_to_trigger, args.retrigger_interval)
+	det = FrameDetector([zone], scene.shape)
+	previews = []
+	for i, frame in enumerate(scene.frames()):
+		detection = det.process(frame, i / scene.fps)
+		if detection.valid_cnts is not None:
+			previews.append((detection.frame, detection.thresh, detection.frameDelta, frame))
+	canvas = np.empty(preview_shape(previews[0]), np.uint8)
+	for quality in args.jpeg_quality:
+		hub = FrameHub(jpeg_quality = quality)
+		compose, encode, size = [], [], 0
+		for frames in previews:
+			start = time.perf_counter()
+			vis = compose_preview(frames, canvas)
+			compose.append(time.perf_counter() - start)
+			start = time.perf_counter()
+			size += len(hub._to_jpeg(vis))
+			encode.append(time.perf_counter() - start)
+		total = np.add(compose, encode)
+		results.append(dict({'benchmark': 'encode', 'jpeg_quality': quality, 'frames': len(previews), 'kb_per_frame': round(size / len(previews) / 1024, 1),
+			'frames_per_sec': round(len(total) / float(total.sum()), 1)}, **timing_stats(total), **{'compose_' + k: v for k, v in timing_stats(compose).items()},
+			**{'jpeg_' + k: v for k, v in timing_stats(encode).items()}))
+	return results
+
+def histogram_stats(snapshot, name, **labels):
+	''' mean and 95th percentile bucket bound of a histogram of a metrics snapshot '''
+	for series_labels, (buckets, total, count) in snapshot[name][2]:
+		if all(series_labels.get(k) == v for k, v in labels.items()) and count:
+			p95 = next(float(le) for le, c in buckets if c >= 0.95 * count)
+			return {'count': count, 'mean_ms': round(total / count * 1000, 2), 'p95_le_ms': round(p95 * 1000, 2)}
+	return {'count': 0}
+
+def bench_e2e(args, decoded, labels):
+	''' trigger to shutter latency through the whole live path: the synthetic scene played in real time as the webcam, MotionDetector,
+		the camera command channel and the camera worker process, on a FakeCamera with --capture-ms and --usb-mb-per-sec, for every
+		--transfer policy. Latencies are from the worker's histograms, so percentiles are bucket bounds. deferred is the number of
+		full size photos preview-first left on the camera at the end (--transfer-idle-sec) '''
+	results = []
+	with tempfile.TemporaryDirectory() as folder:
+		scene = SyntheticScene(perch = args.center, seconds = args.seconds)
+		video = os.path.join(folder, 'scene.avi')
+		scene.write(video)
+		settings = SettingsStore(os.path.join(folder, 'conf.yaml'), initial = {'zones': {'bench': {'x': args.center[0], 'y': args.center[1]}}})
+		camera = functools.partial(FakeCamera, args.usb_round_trip_ms / 1000, args.usb_widget_ms / 1000, args.config_widgets,
+			capture_delay = args.capture_ms / 1000, file_kb = args.file_kb, usb_mb_per_sec = args.usb_mb_per_sec)
+		for transfer in args.transfer:
+			photos = os.path.join(folder, transfer)
+			with MotionDetector(video, settings = settings, download_photo_folder = photos, event_log = '', capture_square_side = args.capture_square_side,
+					triggered_area_percent = args.triggered_area_percent, frames_to_trigger = args.frames_to_trigger, retrigger_interval = args.retrigger_interval) as md:
+				with CameraControlManagerSubProcess('bench', target_folder = photos, metrics = md.metrics, camera_factory = camera,
+						transfer = transfer, transfer_idle_sec = args.transfer_idle_sec) as camCtl:
+					md.stream(camCtl)
+				# the worker saved every preview, and with immediate transferred every photo, before it exited
+				snapshot = md.metrics.snapshot()
+			result = {'benchmark': 'e2e', 'transfer': transfer, 'capture_ms': args.capture_ms, 'file_kb': args.file_kb, 'usb_mb_per_sec': args.usb_mb_per_sec,
+				'seconds': args.seconds, 'deferred': camCtl.download_backlog()}
+			for key, name, labels in (('trigger_to_shutter', 'birdwatcher_trigger_to_shutter_seconds', {}), ('autofocus', 'birdwatcher_camera_seconds', {'op': 'autofocus'}),
+					('capture', 'birdwatcher_camera_seconds', {'op': 'capture'}), ('preview', 'birdwatcher_camera_seconds', {'op': 'preview'}),
+					('download', 'birdwatcher_camera_seconds', {'op': 'download'}), ('frame_latency', 'birdwatcher_frame_latency_seconds', {})):
+				result.update({f'{key}_{k}': v for k, v in histogram_stats(snapshot, name, **labels).items()})
+			results.append(result)
+	return results
+
+def bench_startup(args, decoded, labels):
+	''' cold start of motion_detector_app.py on the synthetic scene, --starts times: seconds from process start to each phase of its
+		startup report (startup.py), read from its output. first_detection is the first processed frame, ready adds the web server '''
+	phases = collections.defaultdict(list)
+	with tempfile.TemporaryDirectory() as folder:
+		SyntheticScene(perch = args.center, seconds = 10).write(os.path.join(folder, 'scene.avi'))
+		os.makedirs(os.path.join(folder, os.path.dirname(CONF_FILE)))
+		SettingsStore(os.path.join(folder, CONF_FILE), initial = {'zones': {'bench': {'x': args.center[0], 'y': args.center[1]}}}).close()
+		app_args = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'motion_detector_app.py'), '-v', 'scene.avi',
+			'--ui-port', str(DEFAULT_UI_PORT + 2), '--event-log', '', '--download-photo-folder', folder]
+		for i in range(args.starts):
+			app = subprocess.Popen(app_args, cwd = folder, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, text = True,
+				env = dict(os.environ, PYTHONUNBUFFERED = '1'), start_new_session = True)
+			timeout = threading.Timer(60, os.killpg, (app.pid, signal.SIGKILL))
+			timeout.start()
+			for line in app.stdout:
+				if line.startswith('startup: '): # startup: <phase> after <seconds> s
+					phase, _, t = line.split()[1:4]
+					phases[phase].append(float(t))
+					if phase == 'ready':
+						break
+			timeout.cancel()
+			os.killpg(app.pid, signal.SIGINT)
+			app.communicate(timeout = 15)
+	result = {'benchmark': 'startup', 'starts': args.starts}
+	for phase, times in phases.items():
+		result.update({f'{phase}_{k}': v for k, v in timing_stats(times).items() if k != 'p50_ms'})
+	return [result]
+
+# what tells results of the same benchmark apart, for --compare
+CASE_KEYS = ('benchmark', 'stage', 'scene', 'condition', 'model', 'method', 'trigger_mode', 'frames_to_trigger', 'detection_scale', 'blur_type', 'jpeg_quality', 'capture_ms', 'transfer')
+
+def case_of(result):
+	return tuple((k, result[k]) for k in CASE_KEYS if k in result)
+
+def regressions(results, baseline_file, tolerance_pct):
+	''' timings (mean and 95th percentile) of results more than tolerance_pct slower than the latest result of the same case in baseline_file '''
+	baseline = {}
+	with open(baseline_file) as f:
+		for line in f:
+			r = json.loads(line)
+			baseline[case_of(r)] = r
+	found = []
+	for r in results:
+		old = baseline.get(case_of(r))
+		if old is None:
+			continue
+		for k, v in r.items():
+			# 0.01 ms of slack, timings that small are noise
+			if k.endswith(('mean_ms', 'p95_ms', 'p95_le_ms')) and isinstance(old.get(k), (int, float)) and v > old[k] * (1 + tolerance_pct / 100) + 0.01:
+				found.append(f'{dict(case_of(r))} {k}: {old[k]} -> {v}')
+	return found
+
+BENCHMARKS = {
+	'background': bench_background,
+	'trigger': bench_trigger,
+	'camera': bench_camera,
+	'ipc': bench_ipc,
+	'scale': bench_scale,
+	'detector': bench_detector,
+	'shots': bench_shots,
+	'encode': bench_encode,
+	'e2e': bench_e2e,
+	'startup': bench_startup,
+}
+
+if __name__ == "__main__":
+	ap = argparse.ArgumentParser(
+		   formatter_class=lambda prog: argparse.ArgumentDefaultsHelpFormatter(
+				prog, max_help_position=80, width=150))
+	ap.add_argument("benchmark", choices=list(BENCHMARKS) + ['all'])
+	ap.add_argument("clips", nargs='*', help="recorded video files")
+	ap.add_argument("--labels", default=None, help="YAML/JSON file mapping each clip to [start_sec, end_sec] intervals where a bird is present. triggers outside them are false")
+	ap.add_argument("-x", "--capture-center-x", type=int, default=None, help="x coordinate - center of capture square. defaults to the first zone in the conf file")
+	ap.add_argument("-y", "--capture-center-y", type=int, default=None, help="y coordinate - center of capture square. defaults to the first zone in the conf file")
+	ap.add_argument("--triggered-area-percent", type=float, default=DEFAULT_TRIGGERED_AREA_PERCENT)
+	ap.add_argument("--capture-square-side", type=int, default=DEFAULT_CAPTURE_RECT_SIDE)
+	ap.add_argument("--frames-to-trigger", type=int, default=DEFAULT_FRAMES_TO_TRIGGER)
+	ap.add_argument("--retrigger-interval", type=int, default=DEFFAULT_RETRIGGER_INTERVAL_SEC)
+	ap.add_argument("--rebase-interval", type=int, default=REBASE_INTERVAL)
+	ap.add_argument("--frame-resize", type=int, default=DEFAULT_FRAME_RESIZE)
+	ap.add_argument("--tolerance", type=float, default=0.0, help="seconds around a labeled interval in which a trigger still counts as a hit")
+	ap.add_argument("--background-model", nargs='+', choices=BACKGROUND_MODELS, default=[DEFAULT_BACKGROUND_MODEL] + [m for m in BACKGROUND_MODELS if m != DEFAULT_BACKGROUND_MODEL], help="background: models to compare. detector runs the first, the app's default unless given")
+	ap.add_argument("--detection-scale", type=float, nargs='+', default=[1, 0.5, 0.25], help="scale: detection scales to compare")
+	ap.add_argument("--blur-type", nargs='+', choices=BLUR_TYPES, default=list(BLUR_TYPES), help="scale: blur types to compare")
+	ap.add_argument("--shots", type=int, default=20, help="camera: captures per method")
+	ap.add_argument("--usb-round-trip-ms", type=float, default=30, help="camera: mocked cost of one config call")
+	ap.add_argument("--usb-widget-ms", type=float, default=1, help="camera: mocked transfer cost per widget when the whole config tree is fetched or pushed")
+	ap.add_argument("--config-widgets", type=int, default=300, help="camera: widgets in the mocked config tree")
+	ap.add_argument("--messages", type=int, default=2000, help="ipc: commands sent per method")
+	ap.add_argument("--seconds", type=float, default=20, help="length of the synthetic scene, used when no clips are given (e2e plays it in real time)")
+	ap.add_argument("--trigger-mode", nargs='+', choices=TRIGGER_MODES, default=list(TRIGGER_MODES), help="shots: trigger modes to compare")
+	ap.add_argument("--shots-per-minute", type=float, default=DEFAULT_SHOTS_PER_MINUTE, help="shots: shot budget of every trigger mode")
+	ap.add_argument("--min-trigger-score", type=float, default=DEFAULT_MIN_TRIGGER_SCORE, help="shots: min score of a peak mode shot")
+	ap.add_argument("--jpeg-quality", type=int, nargs='+', default=[DEFAULT_PREVIEW_JPEG_QUALITY, 50], help="encode: preview JPEG qualities to compare")
+	ap.add_argument("--capture-ms", type=float, default=300, help="e2e: fake camera capture time")
+	ap.add_argument("--file-kb", type=int, default=8000, help="e2e: size of the fake camera's photos")
+	ap.add_argument("--usb-mb-per-sec", type=float, default=20, help="e2e: fake camera transfer rate")
+	ap.add_argument("--transfer", nargs='+', choices=('immediate', 'preview-first'), default=['immediate', 'preview-first'], help="e2e: photo transfer policies to compare")
+	ap.add_argument("--transfer-idle-sec", type=float, default=DEFAULT_TRANSFER_IDLE_SEC, help="e2e: idle seconds before preview-first transfers the full size photos")
+	ap.add_argument("--starts", type=int, default=5, help="startup: cold starts of the app to average")
+	ap.add_argument("--compare", default=None, help="results file of an earlier run: exit with an error if a timing is more than --regression-pct slower than there")
+	ap.add_argument("--regression-pct", type=float, default=20)
+	ap.add_argument("--out", default='benchmark.jsonl', help="JSON lines file the results are appended to")
+	args = ap.parse_args()
+
+	# the first zone of the conf file, if there is one. the synthetic scene's birds fly to it
+	zone = load_zones(yaml.safe_load(open(CONF_FILE)))[0] if os.path.exists(CONF_FILE) else Zone('default', 240, 320)
+	args.center = (args.capture_center_x or zone.x, args.capture_center_y or zone.y)
+	if args.clips:
+		decoded, labels = load_gray_clips(args.clips, args.center, args.capture_square_side, args.frame_resize), load_labels(args.labels)
+	else:
+		decoded, labels = synthetic_clips(args)
+	results = []
+	for name in (BENCHMARKS if args.benchmark == 'all' else [args.benchmark]):
+		results += BENCHMARKS[name](args, decoded, labels)
+	found = regressions(results, args.compare, args.regression_pct) if args.compare else []
+	with open(args.out, 'a') as f:
+		for r in results:
+			r['timestamp'] = time.strftime("%y-%m-%d %H:%M:%S")
+			print (r)
+			f.write(json.dumps(r) + '\n')
+	if found:
+		print ('regressions:\n' + '\n'.join(found))
+		sys.exit(1)
@@ -1,26 +1,25 @@
-import io
-import logging
 import os
-import subprocess
 import sys
+import json
 import time
 import cv2
-import gphoto2 as gp
-import imutils
 import numpy as np
-from PIL import Image
-import asyncio
-import concurrent.futures
+import collections
+import heapq
+import queue
 import threading
 import traceback
-from multiprocessing import Process
-from multiprocessing.managers import SyncManager
-from queue import PriorityQueue
-from enum import Enum
+from multiprocessing import Process, Value, Pipe, Condition, Event
 from dataclasses import dataclass, field
 from typing import Any
+from metrics import Metrics, CAMERA_BUCKETS
+from event_log import EventLog
+from lazy_import import lazy_import
 from defaults import *
 
+gp = lazy_import('gphoto2') # loaded by the camera worker process on first use, the detector and web server never need it
+imutils = lazy_import('imutils')
+
 RELEASE_CAMERA = 10
 INIT_CAMERA = 20
 CAPTURE_IMAGE = 30
@@ -32,22 +31,120 @@ class CameraControlMsg:
     args: Any=field(compare=False)
 
 
-class CameraControlManagerSubProcess(SyncManager):
+class CommandChannel:
+    ''' Priority command queue from the main process to the camera worker process, over a pipe.
+        put() sends straight to the worker. The worker's get() drains the pipe into a local heap, so lower cmd values
+        (release, init, capture) are served first and equal ones in submission order. The worker requeues with put_local().
+        Unfinished tasks are counted in shared memory for task_done() / join(), with the semantics of queue.Queue.
+    '''
+    def __init__(self):
+        self.reader, self.writer = Pipe(duplex = False)
+        self.send_lock = threading.Lock() # the detection loop and the main thread both submit
+        self.all_done = Condition()
+        self.unfinished = Value('i', 0, lock = False) # guarded by all_done
+        self.heap = [] # worker side
+        self.seq = 0
+
+    def put(self, msg):
+        with self.all_done:
+            self.unfinished.value += 1
+        with self.send_lock:
+            self.writer.send(msg)
+
+    def put_local(self, msg):
+        ''' queue msg from the worker itself '''
+        with self.all_done:
+            self.unfinished.value += 1
+        self._push(msg)
+
+    def _push(self, msg):
+        heapq.heappush(self.heap, (msg.cmd, self.seq, msg))
+        self.seq += 1
+
+    def get(self, block = True, timeout = None):
+        ''' worker side. the most urgent waiting command. raises queue.Empty if there is none and block is False,
+            or if none came within timeout seconds '''
+        if block and not self.heap:
+            self.reader.poll(timeout)
+        while self.reader.poll():
+            self._push(self.reader.recv())
+        if not self.heap:
+            raise queue.Empty
+        return heapq.heappop(self.heap)[2]
+
+    def discard(self):
+        ''' worker side. drops every waiting command, marking it done. returns the dropped commands '''
+        dropped = []
+        while True:
+            try:
+                dropped.append(self.get(block = False))
+            except queue.Empty:
+                break
+            self.task_done()
+        return dropped
+
+    def task_done(self):
+        with self.all_done:
+            self.unfinished.value -= 1
+            if self.unfinished.value <= 0:
+                self.all_done.notify_all()
+
+    def join(self, timeout = None):
+        ''' waits until every command is done. False on timeout '''
+        with self.all_done:
+            return self.all_done.wait_for(lambda: self.unfinished.value <= 0, timeout)
+
+    def qsize(self):
+        ''' commands submitted and not done yet '''
+        return self.unfinished.value
+
+    def empty(self):
+        return self.unfinished.value == 0
+
+
+class CameraControlManagerSubProcess:
     ''' Camera control using a subprocess to avoid blocking of main event loop (threads are not enough)
-        Implements communication using a shared process priority queue, so that capturing events will take priority over downloading, which will
-        occur in the backgroud while no other task is being processed
+        Implements communication using a priority command channel (capture, init, release) over a pipe, see CommandChannel.
+        Photo transfers are scheduled separately by the worker: a capture queues its file as a ChunkedDownload, and files are
+        transferred one chunk at a time, only while no command is waiting. A capture therefore waits for at most one chunk,
+        never for a whole transfer. A capture with 'frames' > 1 is a burst: all frames are shot back to back and transferred afterwards.
+        The number of files waiting to be transferred is kept in shared memory (download_backlog()).
+        transfer 'preview-first' defers the full size files: the camera's thumbnail of each photo is saved in the preview folder
+        right away, and full size transfers only run after transfer_idle_sec without a capture, or between the local hours
+        transfer_hours (from, to). Pending transfers are listed in a TransferManifest, so they survive a restart or a crash.
+        delete_after_transfer deletes each photo from the camera once its copy has the size the camera reported.
+        port selects one of several connected cameras by its gphoto2 port (e.g. usb:001,005), by default the first one found.
+        With event_log (a folder) every completed transfer is recorded there, with the trigger time of its capture.
+        camera_factory makes the camera object, gp.Camera by default. fake_camera.FakeCamera runs the worker without a DSLR.
     '''
-    def __init__(self, name, target_folder = DEFAULT_DOWNLOAD_PHOTO_FOLDER, capture_target = DEFAULT_CAPTURE_TARGET):
-        SyncManager.__init__(self) 
-        CameraControlManagerSubProcess.register("PriorityQueue", PriorityQueue)  # Register a shared PriorityQueue
+    def __init__(self, name, target_folder = DEFAULT_DOWNLOAD_PHOTO_FOLDER, capture_target = DEFAULT_CAPTURE_TARGET, metrics = None,
+                 download_chunk_kb = DEFAULT_DOWNLOAD_CHUNK_KB, port = None, event_log = None, camera_factory = None,
+                 transfer = DEFAULT_TRANSFER, transfer_idle_sec = DEFAULT_TRANSFER_IDLE_SEC, transfer_hours = None, delete_after_transfer = False):
         self.name=name
+        self.port = port
+        self.camera_factory = camera_factory
+        self.event_log_folder = event_log
         self.target_folder = target_folder
         self.capture_target=capture_target
+        self.download_chunk_kb = download_chunk_kb
+        self.transfer = transfer
+        self.transfer_idle_sec = transfer_idle_sec
+        self.transfer_hours = transfer_hours
+        self.delete_after_transfer = delete_after_transfer
+        self.backlog = Value('i', 0, lock = False) # written by the worker only
+        self.camera_ready = Event() # set by the worker once its camera is initialized
+        # histograms are written by the worker process, so they are kept in shared memory allocated before it starts
+        self.metrics = metrics or Metrics(False)
+        self.timings = {op: self.metrics.histogram('birdwatcher_camera_seconds', 'duration of DSLR operations', CAMERA_BUCKETS, shared = True, camera = name, op = op)
+            for op in ('init', 'autofocus', 'capture', 'preview', 'download')}
+        self.trigger_to_shutter = self.metrics.histogram('birdwatcher_trigger_to_shutter_seconds',
+            'from capture of the webcam frame that triggered to the DSLR capture returning', CAMERA_BUCKETS, shared = True, camera = name)
+        self.metrics.gauge('birdwatcher_download_backlog', 'photos captured but not yet transferred from the camera', self.download_backlog, camera = name)
 
     def __enter__(self):
         print ('in __init__')
-        self.start()
-        self.pq = self.PriorityQueue()
+        self.pq = CommandChannel()
+        self.metrics.gauge('birdwatcher_camera_queue_depth', 'camera tasks waiting in the priority queue', self.pq.qsize, camera = self.name)
         self.worker_process = Process(target = self.worker, args = (), daemon=False)
         self.worker_process.start()       
         self.submit_task(CameraControlMsg(INIT_CAMERA, self.capture_target))
@@ -57,43 +154,204 @@ class CameraControlManagerSubProcess(SyncManager):
     def __exit__(self, type, value, traceback):
         print ('in __exit__')          
         self.submit_task(CameraControlMsg(RELEASE_CAMERA, None))
-        self.pq.join()
+        while not self.pq.join(timeout = 1):
+            if not self.worker_process.is_alive(): # e.g. Ctrl-C reached it first
+                print (f'worker {self.name} is gone')
+                break
 
 
     def worker(self):
         print ('worker running')
-        camera = None
+        self.camera = None
+        self.config = None # CameraConfig of the current camera session
+        self.downloads = collections.deque() # ChunkedDownload, oldest first
+        self.previews = collections.deque() # (folder, name) of photos whose thumbnail is still to be saved
+        self.chunk = memoryview(bytearray(self.download_chunk_kb * 1024))
+        self.releasing = False
+        self.last_capture = time.monotonic()
+        self.event_log = EventLog(self.event_log_folder) if self.event_log_folder else None # its writer thread belongs to this process
+        os.makedirs(self.target_folder, exist_ok = True)
+        self.manifest = TransferManifest(os.path.join(self.target_folder, f'transfers-{self.name}.json'))
+        for entry in self.manifest.entries: # left over from the last run
+            self._queue_download(f"{entry['folder']}/{entry['name']}", entry['trigger_time'], save = False)
+        if self.manifest.entries:
+            print (f'{len(self.manifest.entries)} photos of the last run still to be transferred')
         while True:
-            camMsg = self.pq.get()
+            try:
+                # commands first. only when none is waiting, save the next thumbnail or transfer the next chunk of the oldest pending photo
+                wait = self._transfer_wait()
+                camMsg = self.pq.get(block = wait != 0, timeout = wait)
+            except queue.Empty:
+                self._transfer_step()
+                continue
             try:
                 print ('got task',camMsg)
                 if INIT_CAMERA == camMsg.cmd:
-                    camera = init_camera(capture_target = camMsg.args)
+                    with self.timings['init'].time():
+                        self.camera, self.config = init_camera(capture_target = camMsg.args, port = self.port, camera_factory = self.camera_factory)
+                    self.camera_ready.set()
 
                 elif CAPTURE_IMAGE == camMsg.cmd:
-                    file_path = capture_image(camera, **camMsg.args)
-                    file_path = os.path.join(file_path.folder, file_path.name)
-                    self.submit_task(CameraControlMsg(DOWNLOAD_IMAGE, {'file_path': file_path}))
+                    self._capture(camMsg)
 
                 elif DOWNLOAD_IMAGE == camMsg.cmd:
-                    download_image(camera,target_folder = self.target_folder, **camMsg.args)
+                    self._queue_download(camMsg.args['file_path'])
 
                 elif RELEASE_CAMERA == camMsg.cmd:
-                    release_camera(camera)
+                    self.releasing = True
+                    # don't leave photos behind. deferred ones stay on the camera, they are in the manifest for the next start
+                    while self.camera and (self.previews or (self.downloads and self.transfer == 'immediate')):
+                        self._transfer_step()
+                    if self.downloads:
+                        print (f'{len(self.downloads)} photos left on the camera, listed in {self.manifest.path} for the next start')
+                    release_camera(self.camera)
+                    if self.event_log:
+                        self.event_log.close()
+                    # commands behind the release (e.g. requeued after an error) will never run, don't let join() wait for them
+                    for dropped in self.pq.discard():
+                        print ('dropped on release:', dropped)
                     break
             except gp.GPhoto2Error as ge2:
-                print (f'got gphoto2.GPhoto2Error error {ge2}. trying to re-init')
-                release_camera(camera) 
-                time.sleep(5) #give the situation some time to sink in...
-                if INIT_CAMERA != camMsg.cmd: # this is so that we won't send INIT twice when original message was INIT.
-                    self.submit_task(CameraControlMsg(INIT_CAMERA, self.capture_target))
-                self.submit_task(camMsg)
+                self._reinit(ge2, camMsg)
             except Exception as e:
                 traceback.print_exc(file=sys.stdout)
                 print (f'Error in worker {self.name} loop: {e}, cmd:{camMsg}')
             finally:
                 self.pq.task_done()
         print ('worker exit')
+
+    def _capture(self, camMsg):
+        args = dict(camMsg.args)
+        trigger_time = args.pop('trigger_time', None)
+        frames = args.pop('frames', 1)
+        self.last_capture = time.monotonic()
+        if args.pop('autofocus', True):
+            with self.timings['autofocus'].time():
+                set_autofocus(self.camera, True, config = self.config)
+        try:
+            for i in range(frames):
+                with self.timings['capture'].time():
+                    try:
+                        file_path = capture_image(self.camera, autofocus = False, config = self.config, **args)
+                    except gp.GPhoto2Error:
+                        camMsg.args = dict(camMsg.args, frames = frames - i) # retry only the frames not taken yet
+                        raise
+                if trigger_time and i == 0:
+                    self.trigger_to_shutter.observe(time.time() - trigger_time)
+                self._queue_download(file_path, trigger_time, save = False)
+        finally:
+            self.manifest.save() # once per burst, not between its frames
+
+    def _queue_download(self, file_path, trigger_time = None, save = True):
+        download = ChunkedDownload(file_path, self.target_folder, trigger_time)
+        self.downloads.append(download)
+        self.backlog.value = len(self.downloads)
+        if self.transfer == 'preview-first' and not os.path.exists(preview_path(self.target_folder, download.name)):
+            self.previews.append((download.folder, download.name))
+        self.manifest.add(download, save = save)
+
+    def _transfers_due(self):
+        ''' whether full size transfers may run now. with preview-first only when the camera is idle or in transfer hours '''
+        if self.transfer == 'immediate':
+            return True
+        if self.transfer_hours:
+            start, end = self.transfer_hours
+            hour = time.localtime().tm_hour
+            if (start <= hour < end) if start <= end else (hour >= start or hour < end): # e.g. 22 6 is over midnight
+                return True
+        return bool(self.transfer_idle_sec) and time.monotonic() - self.last_capture >= self.transfer_idle_sec
+
+    def _transfer_wait(self):
+        ''' seconds to wait for a command before the next transfer step: 0 when one is due, None with nothing due until a command comes '''
+        if not self.camera: # not initialized yet, or re-initializing
+            return None
+        if self.previews or (self.downloads and self._transfers_due()):
+            return 0
+        if not self.downloads:
+            return None
+        wait = TRANSFER_CHECK_SEC if self.transfer_hours else None
+        if self.transfer_idle_sec:
+            idle = max(self.transfer_idle_sec - (time.monotonic() - self.last_capture), 0.01)
+            wait = min(wait or idle, idle)
+        return wait
+
+    def _transfer_step(self):
+        if self.previews:
+            self._save_preview()
+        elif self.downloads and self._transfers_due():
+            self._download_chunk()
+
+    def _save_preview(self):
+        folder, name = self.previews[0]
+        target = preview_path(self.target_folder, name)
+        try:
+            with self.timings['preview'].time():
+                os.makedirs(os.path.dirname(target), exist_ok = True)
+                self.camera.file_get(folder, name, gp.GP_FILE_TYPE_PREVIEW).save(target + '.part')
+                os.replace(target + '.part', target)
+            self.previews.popleft()
+            print (f'saved preview {target}')
+        except gp.GPhoto2Error as ge2:
+            if ge2.code in (gp.GP_ERROR_NOT_SUPPORTED, gp.GP_ERROR_FILE_NOT_FOUND): # no thumbnail of this one, the full file will do
+                print (f'no preview of {name}: {ge2}')
+                self.previews.popleft()
+                return
+            self._reinit(ge2, None)
+        except Exception as e:
+            traceback.print_exc(file=sys.stdout)
+            print (f'Error in worker {self.name} saving the preview of {name}: {e}. dropping it')
+            self.previews.popleft()
+
+    def _download_chunk(self):
+        download = self.downloads[0]
+        try:
+            if download.step(self.camera, self.chunk):
+                self._downloaded(download)
+        except gp.GPhoto2Error as ge2:
+            download.restart()
+            if ge2.code == gp.GP_ERROR_FILE_NOT_FOUND: # e.g. a manifest entry of a card that was swapped since
+                print (f'{download.name} is not on the camera anymore. dropping it')
+                self._drop_download()
+                return
+            self._reinit(ge2, None)
+        except Exception as e:
+            traceback.print_exc(file=sys.stdout)
+            print (f'Error in worker {self.name} downloading {download.name}: {e}. dropping it')
+            self._drop_download()
+
+    def _downloaded(self, download):
+        self._drop_download()
+        self.timings['download'].observe(download.elapsed)
+        if self.event_log:
+            self.event_log.download(time.time(), download.trigger_time, download.name)
+        print (f'downloaded {download.target}, {len(self.downloads)} in backlog')
+        if self.delete_after_transfer:
+            size = os.path.getsize(download.target)
+            if size == download.size: # the copy is complete, the camera's one can go
+                try:
+                    self.camera.file_delete(download.folder, download.name)
+                except gp.GPhoto2Error as e: # the photo is safe, a broken session shows on the next command
+                    print (f'could not delete {download.name} from the camera: {e}')
+            else:
+                print (f'{download.target} has {size} bytes, the camera reported {download.size}. keeping it on the camera')
+
+    def _drop_download(self):
+        download = self.downloads.popleft()
+        self.backlog.value = len(self.downloads)
+        self.manifest.remove(download)
+
+    def _reinit(self, ge2, camMsg):
+        print (f'got gphoto2.GPhoto2Error error {ge2}. trying to re-init')
+        release_camera(self.camera) 
+        self.camera = None
+        self.config = None # widget handles belong to the old session, re-fetched on INIT
+        if self.releasing: # shutting down, no retries
+            return
+        time.sleep(5) #give the situation some time to sink in...
+        if camMsg is None or INIT_CAMERA != camMsg.cmd: # this is so that we won't send INIT twice when original message was INIT.
+            self.pq.put_local(CameraControlMsg(INIT_CAMERA, self.capture_target))
+        if camMsg is not None:
+            self.pq.put_local(camMsg)
     
     def submit_task(self, msg:CameraControlMsg):
         print ('submitting task',msg)
@@ -102,45 +360,183 @@ class CameraControlManagerSubProcess(SyncManager):
     def empty(self):
         return self.pq.empty()
 
+    def wait_ready(self, timeout = None):
+        ''' blocks until the camera was initialized, True if it was '''
+        return self.camera_ready.wait(timeout)
+
+    def download_backlog(self):
+        ''' photos captured but not yet transferred '''
+        return self.backlog.value
+
+
+class TransferManifest:
+    ''' the photos captured and not transferred yet, as a JSON list of {folder, name, trigger_time} in path.
+        It is written on every change as a temporary file synced to disk and renamed over the old one, so it is never half written,
+        and the camera worker transfers what it lists when it starts: a crash or a restart loses no photo that is still on the camera '''
+    def __init__(self, path):
+        self.path = path
+        self.entries = []
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            print (f'ignoring unreadable transfer manifest {path}: {e}')
+
+    def add(self, download, save = True):
+        entry = {'folder': download.folder, 'name': download.name, 'trigger_time': download.trigger_time}
+        if entry not in self.entries:
+            self.entries.append(entry)
+        if save:
+            self.save()
+
+    def remove(self, download):
+        self.entries = [e for e in self.entries if (e['folder'], e['name']) != (download.folder, download.name)]
+        self.save()
+
+    def save(self):
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(self.entries, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + '.tmp', self.path)
+
+
+class ChunkedDownload:
+    ''' a photo transfer from the camera, done chunk by chunk so captures can run in between.
+        written to a .part file that is renamed once complete '''
+    def __init__(self, file_path, target_folder, trigger_time = None):
+        self.folder, self.name = camera_path(file_path)
+        self.trigger_time = trigger_time
+        self.target = os.path.join(target_folder, self.name)
+        self.elapsed = 0 # seconds spent transferring, without the captures in between
+        self.out = None
+        self.restart()
+
+    def restart(self):
+        # the camera session ended mid-transfer, start over
+        if self.out:
+            self.out.close()
+        self.out = None
+        self.size = None
+        self.offset = 0
+
+    def step(self, camera, chunk):
+        ''' transfers the next chunk. returns True once the whole file was saved '''
+        start = time.perf_counter()
+        if self.size is None:
+            self.size = camera.file_get_info(self.folder, self.name).file.size
+            self.out = open(self.target + '.part', 'wb')
+        try:
+            n = camera.file_read(self.folder, self.name, gp.GP_FILE_TYPE_NORMAL, self.offset, chunk)
+            self.out.write(chunk[:n])
+        except gp.GPhoto2Error as e:
+            if e.code != gp.GP_ERROR_NOT_SUPPORTED:
+                raise
+            # no partial reads on this camera, fall back to one transfer of the whole file
+            self.out.close()
+            camera.file_get(self.folder, self.name, gp.GP_FILE_TYPE_NORMAL).save(self.target + '.part')
+            n = 0
+        self.offset += n
+        self.elapsed += time.perf_counter() - start
+        if n and self.offset < self.size:
+            return False
+        self.out.close()
+        self.out = None
+        os.replace(self.target + '.part', self.target)
+        return True
+
 
 '''
     Generic Control Methods
 '''
 
-def init_camera(capture_target = DEFAULT_CAPTURE_TARGET):  
-    camera = gp.Camera()
+class CameraConfig:
+    ''' The camera's config tree, fetched once per camera session instead of on every shot.
+        Widgets are looked up by name once. Values are only pushed when they changed (actions such as autofocusdrive are always pushed),
+        as a single widget when libgphoto2 supports it, otherwise as the cached tree, in which only changed widgets are applied.
+        A session ends with any GPhoto2Error, after which the worker re-inits the camera and builds a new CameraConfig.
+    '''
+    def __init__(self, camera):
+        self.camera = camera
+        self.tree = camera.get_config()
+        self.widgets = {}
+        self.values = {}
+        self.single = True # camera.set_single_config works, until proven otherwise
+
+    def widget(self, name):
+        if name not in self.widgets:
+            self.widgets[name] = self.tree.get_child_by_name(name)
+        return self.widgets[name]
+
+    def set(self, name, value, action = False):
+        ''' set widget name to value. returns False if it already had that value and nothing was sent to the camera '''
+        if not action and self.values.get(name) == value:
+            return False
+        widget = self.widget(name)
+        if not action and name not in self.values and widget.get_value() == value:
+            self.values[name] = value
+            return False
+        widget.set_value(value)
+        self._push(name, widget)
+        self.values[name] = value
+        return True
+
+    def _push(self, name, widget):
+        if self.single:
+            try:
+                self.camera.set_single_config(name, widget)
+                return
+            except gp.GPhoto2Error as e:
+                if e.code != gp.GP_ERROR_NOT_SUPPORTED:
+                    raise
+                self.single = False
+        self.camera.set_config(self.tree)
+
+
+def init_camera(capture_target = DEFAULT_CAPTURE_TARGET, port = None, camera_factory = None):  
+    camera = (camera_factory or gp.Camera)()
+    if port: # one of several cameras, by its gphoto2 port. see gphoto2 --auto-detect
+        port_info_list = gp.PortInfoList()
+        port_info_list.load()
+        camera.set_port_info(port_info_list[port_info_list.lookup_path(port)])
     camera.init()   
-    set_capture_target(camera, capture_target)
-    return camera
+    config = CameraConfig(camera)
+    set_capture_target(camera, capture_target, config = config)
+    return camera, config
 
 def release_camera(camera):
     if camera:
         camera.exit()
 
-def capture_image(camera, autofocus=True):
+def capture_image(camera, autofocus=True, config=None):
 
     if autofocus:
-        set_autofocus(camera, autofocus)
+        set_autofocus(camera, autofocus, config = config)
     print('Capturing image')
     file_path = camera.capture(gp.GP_CAPTURE_IMAGE)
     print('Camera file path: {0}/{1}'.format(file_path.folder, file_path.name))
 
     return file_path
 
-def set_autofocus(camera, on=True):
-    conf=camera.get_config()
-    actions = conf.get_child_by_name('actions')
-    actions.get_child_by_name('autofocusdrive').set_value(1 if on else 0)
-    camera.set_config(conf)        
+def set_autofocus(camera, on=True, config=None):
+    config = config or CameraConfig(camera)
+    config.set('autofocusdrive', 1 if on else 0, action = True)
+
+def camera_path(file_path):
+    ''' (folder, name) of a file on the camera, given as a CameraFilePath or a path string '''
+    if isinstance(file_path, str):
+        return os.path.dirname(file_path), os.path.basename(file_path)
+    return file_path.folder, file_path.name
+
+def preview_path(target_folder, name):
+    ''' where the camera's thumbnail of photo name is saved '''
+    return os.path.join(target_folder, DEFAULT_PREVIEW_FOLDER, os.path.splitext(name)[0] + '.jpg')
 
 def download_image (camera, file_path, target_folder = DEFAULT_DOWNLOAD_PHOTO_FOLDER):
     print (file_path)
-    if type(file_path) == gp.camera.CameraFilePath:
-        file_name = file_path.folder
-        file_folder = file_path.name
-    else:
-        file_name = os.path.basename(file_path)
-        file_folder = os.path.dirname(file_path)
+    file_folder, file_name = camera_path(file_path)
     print ('___join:',target_folder, file_name)
     target = os.path.join(target_folder, file_name)
     print('Copying image from',file_path,'to', target)
@@ -204,22 +600,17 @@ def preview_image():
     # return image
 
 
-def set_capture_target(camera, value:int):
-    config = gp.check_result(gp.gp_camera_get_config(camera))
+def set_capture_target(camera, value:int, config=None):
+    config = config or CameraConfig(camera)
     # find the capture target config item
-    capture_target = gp.check_result(gp.gp_widget_get_child_by_name(config, 'capturetarget'))
+    capture_target = config.widget('capturetarget')
     # check value in range
-    count = gp.check_result(gp.gp_widget_count_choices(capture_target))
+    count = capture_target.count_choices()
     if value < 0 or value >= count:
         print('Parameter out of range')
         return 1
-    # set value
-    value = gp.check_result(gp.gp_widget_get_choice(capture_target, value))
-    gp.check_result(gp.gp_widget_set_value(capture_target, value))
-    # set config
-    gp.check_result(gp.gp_camera_set_config(camera, config))
-    # clean up
-    # gp.check_result(gp.gp_camera_exit(camera))
+    # set value, only sent to the camera if it changed
+    config.set('capturetarget', capture_target.get_choice(value))
     return 0
 
 
@@ -1,13 +1,53 @@
 DEFAULT_TRIGGERED_AREA_PERCENT = 0.05
 DEFAULT_FRAMES_TO_TRIGGER = 32
+DEFAULT_FRAMES_REQUIRED = None # frames with motion needed within the last frames-to-trigger frames. None means all of them
 DEFFAULT_RETRIGGER_INTERVAL_SEC = 3
+DEFAULT_TRIGGER_MODE = 'window' # window (fire once the trigger window is full, then every retrigger interval) | peak (fire at motion score peaks)
+DEFAULT_SHOTS_PER_MINUTE = 0 # max DSLR shots per minute of a detector, all zones together. 0 is no limit
+DEFAULT_MIN_TRIGGER_SCORE = 0.7 # peak mode: min motion score of a shot. the bar rises towards 1 as the shots per minute budget is used up
+SCORE_WEIGHTS = (0.4, 0.3, 0.3) # motion score: weights of subject area, centrality and stillness
+SCORE_FULL_AREA = 0.25 # motion covering this fraction of the zone gets the full area score, down to none over the whole zone
+SCORE_BLUR_MOVE = 0.05 # motion centroid moving this fraction of the zone side between two frames gets no stillness score
+DEFAULT_GLOBAL_RETRIGGER_INTERVAL_SEC = 3 # with several sources: min seconds between two shots of the same DSLR, whichever source triggered
 DEFAULT_FRAME_RESIZE = None
 DEFAULT_CAPTURE_RECT_SIDE = 100
-TARGET_FPS = 32 #camera max is 32, allowing max sampling considering computation time
+DEFAULT_TARGET_FPS = 32 #camera max is 32, allowing max sampling considering computation time
+DEFAULT_CAMERA_BACKEND = 'opencv' # opencv | v4l2 | picamera2
+DEFAULT_PICAMERA_SIZE = (640, 480) # picamera2 frame size
 CONF_FILE = 'conf/conf.yaml'
+DEFAULT_SETTINGS_WRITE_DELAY_SEC = 2 # conf file changes are collected for this long, then written once
 REBASE_INTERVAL = 60
+DEFAULT_DIFF_THRESHOLD = 25 # min gray level difference from the reference frame for a pixel to count as moving
+DEFAULT_BLUR_KERNEL = 21 # gaussian blur kernel side at full resolution, must be odd
+DEFAULT_BLUR_TYPE = 'gaussian' # gaussian | box
+DEFAULT_DETECTION_SCALE = 1.0 # detection runs on the zones downscaled by this factor
+DEFAULT_BACKGROUND_MODEL = 'running-average' # static | running-average | mog2 | knn
+DEFAULT_BACKGROUND_ALPHA = 0.02 # background learning rate per frame of the adaptive models
+DEFAULT_BACKGROUND_MAX_FREEZE_SEC = 30 # adaptive models stop learning where motion is present, but for no longer than this
+DEFAULT_PREVIEW_FPS = 10 # web UI preview frames encoded per second, shared by all viewers
+DEFAULT_PREVIEW_JPEG_QUALITY = 80
+DEFAULT_STATUS_HISTORY = 256 # status events kept for web UI clients that reconnect
+DEFAULT_STATUS_COALESCE_SEC = 1 # movement/undetected flips closer than this are merged into the latest one
 
 DEFAULT_DOWNLOAD_PHOTO_FOLDER='./photos'
 DEFAULT_CAPTURE_TARGET = 1 # 0=internal memory (faster) 1=SDCARD
 DEFAULT_AUTOFOCUS_BEFORE_TRIGGER = True
-DEFAULT_UI_PORT = 8080
\ No newline at end of file
+DEFAULT_BURST_FRAMES = 1 # DSLR frames shot back to back per trigger, transferred afterwards
+DEFAULT_DOWNLOAD_CHUNK_KB = 1024 # photos are transferred in chunks of this size; a capture waits for at most one chunk
+DEFAULT_TRANSFER = 'immediate' # immediate | preview-first (thumbnail right away, the full file when the camera is idle or in transfer hours)
+DEFAULT_TRANSFER_IDLE_SEC = 60 # preview-first: full size transfers start after this long without a capture. 0 only transfers in transfer hours
+TRANSFER_CHECK_SEC = 60 # preview-first: how often the worker looks whether transfer hours began, while waiting for commands
+DEFAULT_PREVIEW_FOLDER = 'previews' # sub folder of the download folder the camera's thumbnails are saved in
+DEFAULT_UI_PREVIEWS = 12 # latest photo thumbnails listed in the web UI
+DEFAULT_PREROLL_SEC = 0 # seconds of webcam frames before each trigger saved next to the photos. 0 disables the pre-trigger buffer
+DEFAULT_POSTROLL_SEC = 1 # seconds of webcam frames after each trigger added to the pre-trigger clip
+DEFAULT_PREROLL_FORMAT = 'jpg' # jpg (burst of JPEG files) | avi (MJPG clip)
+DEFAULT_EVENT_LOG_FOLDER = './events' # binary activity / trigger / download log. empty to turn it off
+DEFAULT_EVENT_LOG_FLUSH_SEC = 5 # event log records are collected in memory and written this often
+DEFAULT_EVENT_LOG_DOWNLOAD_WINDOW_SEC = 600 # a photo downloaded up to this long after its trigger is still listed with it
+DEFAULT_PREROLL_SLACK_SEC = 2 # extra buffered seconds the clip writer may lag behind before frames are lost
+DEFAULT_UI_PORT = 8080
+DEFAULT_UI_SERVER = 'flask' # flask (a thread per connection) | async (tornado event loop for the preview and status streams)
+DEFAULT_ASYNC_WSGI_THREADS = 4 # threads running the other flask routes under the async server (tornado 6.3+)
+DEFAULT_SOURCE_NAME = 'main' # the video source when there is only one
+DEFAULT_METRICS = True # per-stage latency histograms served on /metrics
\ No newline at end of file
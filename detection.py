@@ -0,0 +1,329 @@
+from dataclasses import dataclass, asdict, field
+import collections
+import math
+import threading
+from typing import Any
+import cv2
+import numpy as np
+from background import make_background
+from metrics import NO_TIMER
+from defaults import *
+
+def detect_rect(x, y, side, frame_dim):
+	''' slices of a side*side square centered at (x,y), clipped to the frame. x is the row, y the column '''
+	drl = int (side / 2)
+	return ( slice(
+		max(x - drl, 0),
+		min(x + drl, frame_dim[0])),
+	slice(
+		max(y - drl, 0),
+		min(y + drl, frame_dim[1]))
+	)
+
+def local_rect(rect, union):
+	# rect is in frame coordinates, return it relative to the union crop
+	return tuple(slice(r.start - u.start, r.stop - u.start) for r, u in zip(rect, union))
+
+@dataclass
+class Zone:
+	''' a named detection square with its own size, sensitivity and trigger timing '''
+	name: str
+	x: int
+	y: int
+	side: int = DEFAULT_CAPTURE_RECT_SIDE
+	triggered_area_percent: float = DEFAULT_TRIGGERED_AREA_PERCENT
+	frames_to_trigger: int = DEFAULT_FRAMES_TO_TRIGGER
+	retrigger_interval: float = DEFFAULT_RETRIGGER_INTERVAL_SEC
+	frames_required: int = None # motion must be seen in this many of the last frames_to_trigger frames. None means all of them
+
+def load_zones(conf, **zone_defaults):
+	''' zones from the conf file. a conf with only the single legacy 'coordinates' entry becomes one zone named 'default' '''
+	if conf.get('zones'):
+		return [Zone(name, **dict(zone_defaults, **z)) for name, z in conf['zones'].items()]
+	return [Zone('default', conf['coordinates']['x'], conf['coordinates']['y'], **zone_defaults)]
+
+def dump_zones(zones, **zone_defaults):
+	''' zones as a conf file mapping. settings equal to the given defaults are left out, so they keep following the command line '''
+	return {z.name: {k: v for k, v in asdict(z).items() if k != 'name' and (k not in zone_defaults or zone_defaults[k] != v)} for z in zones}
+
+NO_BOXES = np.zeros((0, 5), np.int32)
+
+def find_boxes(thresh, min_area):
+	''' bounding boxes (x, y, w, h, area) of the connected components of a binary image that are at least min_area pixels.
+		area is the component's pixel count, a little more than the contour area the old contour loop compared (its outline counts too).
+		labeling costs about the same whatever the mask: a single bird blob costs more than findContours did (0.06 vs 0.02 ms for a
+		100 px zone), hundreds of leaf specks far less (0.09 vs 0.3-0.4 ms). the worst case is what holds up the frame, so labeling it is
+	'''
+	if cv2.countNonZero(thresh) < min_area: # no component can be large enough, skip labeling (the common case of a still scene)
+		return NO_BOXES
+	# 16 bit labels are cheaper to write. an 8-connected image has at most a quarter as many components as pixels
+	ltype = cv2.CV_16U if thresh.size < 4 * 65535 else cv2.CV_32S
+	n, labels, stats, centroids = cv2.connectedComponentsWithStats(thresh, connectivity = 8, ltype = ltype)
+	# ignore the background label and components that are too small
+	return stats[1:][stats[1:, cv2.CC_STAT_AREA] >= min_area]
+
+def motion_score(boxes, zone, last_centroid = None):
+	''' (score, centroid) of a zone's motion boxes (x, y, w, h, area in full frame coordinates). the score, in [0, 1], is the SCORE_WEIGHTS sum of
+		- area: the moving area, full at SCORE_FULL_AREA of the zone. motion over the whole zone is rather light than a bird, it gets none
+		- centrality: closeness of the area weighted centroid of the boxes to the zone center, none at the zone's edge
+		- stillness: how little the centroid moved since last_centroid (the previous frame's), none when it moved SCORE_BLUR_MOVE of the
+		  side or there was no motion on the previous frame. a subject moving fast comes out blurred
+		plain python, for the same reason as TriggerWindow: there are only a few boxes
+	'''
+	area = cx = cy = 0
+	for x, y, w, h, a in boxes.tolist():
+		area += a
+		cx += (x + w / 2) * a
+		cy += (y + h / 2) * a
+	if not area:
+		return 0.0, None
+	cx, cy = cx / area, cy / area
+	side = zone.side
+	share = area / (side * side)
+	area_score = share / SCORE_FULL_AREA if share < SCORE_FULL_AREA else max(1 - (share - SCORE_FULL_AREA) / (1 - SCORE_FULL_AREA), 0)
+	center_score = 1 - min(math.hypot(cx - zone.y, cy - zone.x) / (side / 2), 1) # zone.x is the row
+	still_score = 0 if last_centroid is None else 1 - min(math.hypot(cx - last_centroid[0], cy - last_centroid[1]) / (SCORE_BLUR_MOVE * side), 1)
+	wa, wc, ws = SCORE_WEIGHTS
+	return wa * area_score + wc * center_score + ws * still_score, (cx, cy)
+
+class TriggerWindow:
+	''' per zone "motion in frames_required of the last frames_to_trigger frames", updated in O(1) per frame.
+		each zone keeps a ring of its recent detections and a running count of the detections in it.
+		plain python state, since numpy's per-call overhead dominates for a handful of zones
+	'''
+	def __init__(self, frames_to_trigger, frames_required = None):
+		self.frames_to_trigger = [int(n) for n in frames_to_trigger]
+		self.frames_required = self.frames_to_trigger if frames_required is None else [min(int(r), n) for r, n in zip(frames_required, self.frames_to_trigger)]
+		self.rings = [bytearray(n) for n in self.frames_to_trigger]
+		self.counts = [0] * len(self.frames_to_trigger)
+		self.pos = [0] * len(self.frames_to_trigger)
+		self.triggered = np.zeros(len(self.frames_to_trigger), bool)
+
+	def update(self, detected):
+		''' adds this frame's per zone detections, returns which zones are triggered '''
+		for z, d in enumerate(detected.tolist()):
+			ring, p = self.rings[z], self.pos[z]
+			count = self.counts[z] + d - ring[p] # the detection at p falls out of the window
+			ring[p] = d
+			self.counts[z] = count
+			self.pos[z] = p + 1 if p + 1 < self.frames_to_trigger[z] else 0
+			self.triggered[z] = count >= self.frames_required[z]
+		return self.triggered.copy()
+
+@dataclass
+class Detection:
+	text: str
+	valid_cnts: Any = None # connected components large enough to count, per zone. None while the reference frame is being (re)taken
+	fired: list = field(default_factory = list) # (zone name, 'triggered' or 're-triggered') for every zone that fires the camera on this frame
+	frame: Any = None # union of all zones, with contour bounding boxes drawn on it
+	thresh: Any = None
+	frameDelta: Any = None
+	boxes: list = None # per zone (x, y, w, h, area) of each motion box, in full frame coordinates
+	scores: Any = None # per zone motion score of this frame (motion_score)
+	fired_scores: list = field(default_factory = list) # score of the frame each fired zone was shot for
+
+
+# stages timed by FrameDetector's timer, plus the ones MotionDetector times around it
+BLUR_TYPES = ('gaussian', 'box')
+
+TRIGGER_MODES = ('window', 'peak')
+
+DETECTION_STAGES = ('read', 'preroll', 'crop', 'cvtcolor', 'scale', 'blur', 'absdiff', 'threshold', 'contours', 'background', 'trigger', 'draw')
+
+class FrameDetector:
+	''' Camera-free per-frame motion detection and trigger state machine for a set of detection zones.
+		Used by MotionDetector for the live feed and replay, and by the parameter sweep, which feeds it pre-cropped grayscale frames.
+		Grayscale conversion, blur, background model, threshold and dilation run once over the bounding box of all zones;
+		only connected component counting is per zone. Per-zone trigger state is kept in arrays indexed like self.zones,
+		with a running count of detections inside each zone's window so the trigger decision is O(1) per frame.
+		The background model decides what each frame is compared against. With the static model and rebase_interval set,
+		the reference frame is retaken every rebase_interval seconds of frame_time, otherwise only when rebase() is called.
+		Every frame gets a motion score per zone (motion_score). trigger_mode 'window' fires once the trigger window is full, then every
+		retrigger interval while it stays full. 'peak' waits for the window too, then fires at local maxima of the score (one frame
+		after the peak, when the score drops) that reach min_trigger_score, at most every retrigger interval per zone.
+		shots_per_minute caps the shots of all zones together in any minute of frame_time; in peak mode the score a shot needs also
+		rises from min_trigger_score towards 1 as the budget is used up, so the best frames get the shots that are left.
+		With detection_scale < 1 everything after grayscale conversion runs on the zones downscaled by that factor, with the blur
+		kernel and minimum areas scaled to match; bounding boxes are mapped back to full resolution for drawing.
+		blur_type 'box' replaces the gaussian blur with a box filter, whose cost doesn't grow with the kernel size.
+		Frames may also arrive already grayscale (2-d, e.g. the Y plane of a YUV camera), then no conversion is done.
+	'''
+	def __init__(self, zones = (), frame_dim = None,
+				threshold = DEFAULT_DIFF_THRESHOLD,
+				blur_kernel = DEFAULT_BLUR_KERNEL,
+				rebase_interval = None,
+				background_model = DEFAULT_BACKGROUND_MODEL,
+				background_alpha = DEFAULT_BACKGROUND_ALPHA,
+				background_max_freeze = DEFAULT_BACKGROUND_MAX_FREEZE_SEC,
+				detection_scale = DEFAULT_DETECTION_SCALE,
+				blur_type = DEFAULT_BLUR_TYPE,
+				trigger_mode = DEFAULT_TRIGGER_MODE,
+				shots_per_minute = DEFAULT_SHOTS_PER_MINUTE,
+				min_trigger_score = DEFAULT_MIN_TRIGGER_SCORE,
+				timer = NO_TIMER):
+		if blur_type not in BLUR_TYPES:
+			raise ValueError(f'unknown blur type {blur_type}, expected one of {BLUR_TYPES}')
+		if trigger_mode not in TRIGGER_MODES:
+			raise ValueError(f'unknown trigger mode {trigger_mode}, expected one of {TRIGGER_MODES}')
+		self.trigger_mode = trigger_mode
+		self.shots_per_minute = shots_per_minute
+		self.min_trigger_score = min_trigger_score
+		self.shot_times = collections.deque() # frame times of the shots of the last minute, all zones
+		self.threshold = threshold
+		self.detection_scale = detection_scale
+		self.blur_type = blur_type
+		self.timer = timer # metrics.StageTimer, laps once per stage (see DETECTION_STAGES)
+		self.blur_kernel = blur_kernel
+		self.rebase_interval = rebase_interval
+		self.rebase_time = None
+		self.background = make_background(background_model, background_alpha, background_max_freeze)
+		self.lock = threading.Lock() # zones are changed from the web UI thread while frames are processed
+		self.set_zones(zones, frame_dim)
+
+	def set_zones(self, zones, frame_dim, detection_scale = None):
+		''' replaces all zones, optionally changing the detection scale. resets trigger state and the background, since the processed area changes '''
+		with self.lock:
+			self.zones = list(zones)
+			if detection_scale is not None:
+				self.detection_scale = detection_scale
+			self.frame_dim = frame_dim
+			if not self.zones or frame_dim is None:
+				return
+			self.zone_rects = [detect_rect(z.x, z.y, z.side, frame_dim) for z in self.zones]
+			self.union = (slice(min(r[0].start for r in self.zone_rects), max(r[0].stop for r in self.zone_rects)),
+				slice(min(r[1].start for r in self.zone_rects), max(r[1].stop for r in self.zone_rects)))
+			self.zone_slices = [local_rect(r, self.union) for r in self.zone_rects]
+			# the same in detection resolution
+			scale = self.detection_scale
+			self.scaled_size = tuple(max(int((u.stop - u.start) * scale), 1) for u in reversed(self.union)) # (width, height) for cv2.resize
+			self.scaled_slices = [tuple(slice(int(s.start * scale), int(s.stop * scale)) for s in zs) for zs in self.zone_slices]
+			self.min_triggered_area = np.array([z.triggered_area_percent * (z.side * scale) ** 2 for z in self.zones])
+			self.trigger_window = TriggerWindow([z.frames_to_trigger for z in self.zones], [z.frames_required or z.frames_to_trigger for z in self.zones])
+			self.retrigger_interval = np.array([z.retrigger_interval for z in self.zones], np.float64)
+			self.prev_triggered = np.zeros(len(self.zones), bool)
+			self.triggered_time = np.zeros(len(self.zones))
+			# score state of peak mode: the previous frame's score and centroid, whether the score was rising, whether the zone shot since its window filled
+			self.last_scores = np.zeros(len(self.zones))
+			self.centroids = [None] * len(self.zones)
+			self.rising = np.zeros(len(self.zones), bool)
+			self.shot_in_visit = np.zeros(len(self.zones), bool)
+			self.background.reset()
+
+	def rebase(self):
+		self.background.reset() #need to retake the base image
+
+	def process(self, frame, frame_time, draw = True):
+		with self.lock:
+			# slice the frame to the bounding box of all zones.
+			frame = frame[self.union]
+			self.timer.lap('crop')
+			# convert frame to grayscale, unless the camera already delivers it
+			gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+			self.timer.lap('cvtcolor')
+			detection = self._process_gray(gray, frame_time, frame if draw else None)
+			detection.frame = frame
+			return detection
+
+	def process_gray(self, gray, frame_time, frame = None):
+		''' runs detection on an already cropped grayscale union of the zones. bounding boxes are drawn on frame when given '''
+		with self.lock:
+			return self._process_gray(gray, frame_time, frame)
+
+	def _process_gray(self, gray, frame_time, frame):
+		if self.rebase_interval and not self.background.adaptive and self.rebase_time is not None and frame_time - self.rebase_time >= self.rebase_interval:
+			self.rebase()
+		timer = self.timer
+		scale = self.detection_scale
+		if scale != 1:
+			gray = cv2.resize(gray, self.scaled_size, interpolation = cv2.INTER_AREA)
+			timer.lap('scale')
+		kernel = max(int(self.blur_kernel * scale) | 1, 1) # odd
+		if self.blur_type == 'box':
+			gray = cv2.blur(gray, (kernel, kernel))
+		else:
+			gray = cv2.GaussianBlur(gray, (kernel, kernel), 0)
+		timer.lap('blur')
+
+		# compute the absolute difference between the current frame and the background. None while the model takes its reference
+		frameDelta = self.background.delta(gray)
+		timer.lap('absdiff')
+		if frameDelta is None:
+			self.prev_triggered[:] = False
+			self.last_scores[:] = 0
+			self.rising[:] = False
+			self.centroids = [None] * len(self.zones)
+			self.rebase_time = frame_time
+			return Detection('rebasing reference frame')
+
+		thresh = cv2.threshold(frameDelta, self.threshold, 255, cv2.THRESH_BINARY)[1]
+		# dilate the thresholded image to fill in holes, then find connected components on thresholded image of every zone
+		thresh = cv2.dilate(thresh, None, iterations=2)
+		timer.lap('threshold')
+		valid_cnts = np.zeros(len(self.zones), np.int32)
+		zone_boxes = [NO_BOXES] * len(self.zones)
+		scores = np.zeros(len(self.zones))
+		for i, zs in enumerate(self.scaled_slices):
+			boxes = find_boxes(thresh[zs], self.min_triggered_area[i])
+			valid_cnts[i] = len(boxes)
+			centroid = None
+			if len(boxes):
+				zone_boxes[i] = full = (boxes / (scale, scale, scale, scale, scale * scale)).astype(np.int32)
+				full[:, 0] += self.zone_rects[i][1].start
+				full[:, 1] += self.zone_rects[i][0].start
+				scores[i], centroid = motion_score(full, self.zones[i], self.centroids[i])
+			self.centroids[i] = centroid
+			# draw the bounding boxes on the full resolution frame
+			if frame is not None:
+				for (x, y, w, h, area) in boxes:
+					cv2.rectangle(frame[self.zone_slices[i]], (int(x / scale), int(y / scale)), (int((x + w) / scale), int((y + h) / scale)), (0, 255, 0), 2)
+		timer.lap('contours')
+		detected = valid_cnts > 0
+		self.background.update(gray, detected.any(), thresh, frame_time)
+		timer.lap('background')
+
+		# Trigger handling: if motion was detected in frames_required of the last frames_to_trigger frames and then continously for retrigger_interval seconds, per zone
+		triggered = self.trigger_window.update(detected)
+		if self.trigger_mode == 'peak':
+			# the previous frame was a peak if the score rose to it and dropped after it
+			self.shot_in_visit &= triggered
+			first = ~self.shot_in_visit
+			candidates = triggered & self.rising & (scores < self.last_scores) & (first | (frame_time - self.triggered_time > self.retrigger_interval))
+			shot_scores = self.last_scores
+			self.rising = np.where(scores != self.last_scores, scores > self.last_scores, self.rising)
+			self.last_scores = scores
+		else:
+			first = triggered & ~self.prev_triggered
+			candidates = first | (triggered & self.prev_triggered & (frame_time - self.triggered_time > self.retrigger_interval))
+			shot_scores = scores
+		self.prev_triggered = triggered
+		fired, fired_scores = [], []
+		for i in np.flatnonzero(candidates):
+			if not self._spend_shot(frame_time, shot_scores[i]):
+				continue
+			self.triggered_time[i] = frame_time #(re-)Setting base time for retrigger
+			self.shot_in_visit[i] = True
+			fired.append((self.zones[i].name, 'triggered' if first[i] else 're-triggered'))
+			fired_scores.append(round(float(shot_scores[i]), 3))
+
+		if fired:
+			text = fired[0][1] + '!!! [' + ', '.join(name for name, kind in fired) + ']'
+		elif detected.any():
+			text = 'Movement Detected [' + ', '.join(self.zones[i].name for i in np.flatnonzero(detected)) + ']'
+		else:
+			text = 'Undetected'
+		timer.lap('trigger')
+		return Detection(text, valid_cnts, fired, None, thresh, frameDelta, zone_boxes, scores, fired_scores)
+
+	def _spend_shot(self, frame_time, score):
+		''' whether the shots per minute budget leaves a shot of this score, which is then counted '''
+		shots = self.shot_times
+		while shots and frame_time - shots[0] >= 60:
+			shots.popleft()
+		if self.shots_per_minute and len(shots) >= self.shots_per_minute:
+			return False
+		if self.trigger_mode == 'peak':
+			used = len(shots) / self.shots_per_minute if self.shots_per_minute else 0
+			if score < self.min_trigger_score + (1 - self.min_trigger_score) * used:
+				return False
+		shots.append(frame_time)
+		return True
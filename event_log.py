@@ -0,0 +1,239 @@
+''' Append-only binary log of what the detector saw, for "what happened today" queries that don't look at a single photo.
+	Records are fixed size numpy structured arrays, appended in time order to one file per kind and local day
+	(<kind>-YYYYMMDD.bin). The file name is the coarse time index, a binary search on the time column the fine one,
+	so a query reads only the days it covers and slices them without a scan.
+	- activity: per zone and second with motion: frames seen, frames with motion and the largest moving area (fraction of the zone)
+	- trigger: every capture trigger, with its zone and the bounding box of the motion in it, in full frame coordinates
+	- download: every photo transferred from the DSLR, with the trigger it belongs to. written by the camera process
+	Zone names are stored once, in zones.json, records refer to them by number.
+	The detection loop only adds records and new zone names to in-memory lists; a writer thread appends them to the files every
+	flush_interval seconds.
+'''
+import argparse
+import datetime
+import json
+import os
+import threading
+import time
+import numpy as np
+from defaults import *
+
+ACTIVITY = np.dtype([('t', '<u4'), ('zone', '<u2'), ('frames', 'u1'), ('motion_frames', 'u1'), ('area', '<f4')])
+TRIGGER = np.dtype([('t', '<f8'), ('zone', '<u2'), ('boxes', '<u2'), ('x', '<i2'), ('y', '<i2'), ('w', '<i2'), ('h', '<i2')])
+DOWNLOAD = np.dtype([('t', '<f8'), ('trigger_time', '<f8'), ('file', 'S64')])
+KINDS = {'activity': ACTIVITY, 'trigger': TRIGGER, 'download': DOWNLOAD}
+
+def day_of(t):
+	return time.strftime('%Y%m%d', time.localtime(t))
+
+class EventLog:
+	''' the writing side. frame() and trigger() are called by the detection loop, download() by the camera worker '''
+	def __init__(self, folder, flush_interval = DEFAULT_EVENT_LOG_FLUSH_SEC):
+		self.folder = folder
+		self.flush_interval = flush_interval
+		os.makedirs(folder, exist_ok = True)
+		self.zone_names = load_zone_names(folder)
+		self.zone_ids = {name: i for i, name in enumerate(self.zone_names)}
+		self.zones_changed = False
+		self.pending = {kind: [] for kind in KINDS}
+		self.lock = threading.Lock()
+		self.write_lock = threading.Lock() # flush() runs on the writer thread and on close()
+		self.closed = threading.Event()
+		# activity of the current second, per zone id: [frames with motion, largest area]
+		self.second = None
+		self.frames = 0
+		self.motion = {}
+		self.writer = threading.Thread(target = self._write_loop, name = 'event-log-writer', daemon = True)
+		self.writer.start()
+
+	def zone_id(self, name):
+		zone_id = self.zone_ids.get(name)
+		if zone_id is None: # first time this zone is seen. zones.json is written with the next flush, before the records using it
+			with self.lock:
+				zone_id = self.zone_ids[name] = len(self.zone_names)
+				self.zone_names.append(name)
+				self.zones_changed = True
+		return zone_id
+
+	def _add(self, kind, record):
+		with self.lock:
+			self.pending[kind].append(record)
+
+	def frame(self, frame_time, detection, zones):
+		''' called by the detection loop for every frame. collects per second activity '''
+		second = int(frame_time)
+		if second != self.second:
+			self._end_second()
+			self.second = second
+		self.frames += 1
+		if detection.valid_cnts is None or len(detection.valid_cnts) != len(zones): # reference frame, or the zones just changed
+			return
+		for i in np.flatnonzero(detection.valid_cnts):
+			z = zones[i]
+			area = float(detection.boxes[i][:, 4].sum()) / z.side ** 2
+			entry = self.motion.setdefault(self.zone_id(z.name), [0, 0.0])
+			entry[0] += 1
+			entry[1] = max(entry[1], area)
+
+	def _end_second(self):
+		for zone_id, (motion_frames, area) in self.motion.items():
+			self._add('activity', (self.second, zone_id, min(self.frames, 255), min(motion_frames, 255), area))
+		self.frames = 0
+		self.motion = {}
+
+	def trigger(self, frame_time, detection, zones):
+		''' one record per zone that fired on this frame. a zone can fire on a frame without motion in it (a k of N window
+			retriggering, peak mode shooting on the frame after the peak), its record has no boxes and a zero box '''
+		index = {z.name: i for i, z in enumerate(zones)}
+		for name, kind in detection.fired:
+			i = index.get(name)
+			if i is None or i >= len(detection.boxes): # the zones just changed
+				continue
+			boxes = detection.boxes[i]
+			if len(boxes):
+				x, y = boxes[:, 0].min(), boxes[:, 1].min()
+				w, h = (boxes[:, 0] + boxes[:, 2]).max() - x, (boxes[:, 1] + boxes[:, 3]).max() - y
+			else:
+				x = y = w = h = 0
+			self._add('trigger', (frame_time, self.zone_id(name), len(boxes), x, y, w, h))
+
+	def download(self, t, trigger_time, file_name):
+		self._add('download', (t, trigger_time or 0, file_name.encode()[:64]))
+
+	def flush(self):
+		with self.write_lock:
+			with self.lock:
+				pending, self.pending = self.pending, {kind: [] for kind in KINDS}
+				zone_names = list(self.zone_names) if self.zones_changed else None
+				self.zones_changed = False
+			if zone_names is not None:
+				tmp = os.path.join(self.folder, 'zones.json.tmp')
+				with open(tmp, 'w') as f:
+					json.dump(zone_names, f)
+				os.replace(tmp, os.path.join(self.folder, 'zones.json'))
+			for kind, records in pending.items():
+				if not records:
+					continue
+				records = np.array(records, KINDS[kind])
+				days = [day_of(t) for t in records['t']]
+				# records are in time order, so every day is one run
+				start = 0
+				for i in range(1, len(days) + 1):
+					if i == len(days) or days[i] != days[start]:
+						with open(os.path.join(self.folder, f'{kind}-{days[start]}.bin'), 'ab') as f:
+							f.write(records[start:i].tobytes())
+						start = i
+
+	def close(self):
+		self._end_second()
+		self.closed.set()
+		self.writer.join(timeout = 5)
+		self.flush()
+
+	def _write_loop(self):
+		while not self.closed.wait(self.flush_interval):
+			self.flush()
+
+
+def load_zone_names(folder):
+	try:
+		with open(os.path.join(folder, 'zones.json')) as f:
+			return json.load(f)
+	except FileNotFoundError:
+		return []
+
+def read_events(folder, kind, start, end):
+	''' records of a kind with start <= t < end (epoch seconds), from the day files covering the range '''
+	dtype = KINDS[kind]
+	parts = []
+	day = datetime.date.fromtimestamp(start)
+	while day <= datetime.date.fromtimestamp(end):
+		path = os.path.join(folder, f'{kind}-{day:%Y%m%d}.bin')
+		if os.path.exists(path):
+			records = np.fromfile(path, dtype)
+			t = records['t']
+			if kind == 'download': # several camera processes may append to the same file, so it isn't strictly in time order. it's small
+				parts.append(records[(t >= start) & (t < end)])
+			else:
+				parts.append(records[np.searchsorted(t, start):np.searchsorted(t, end)])
+		day += datetime.timedelta(days = 1)
+	return np.concatenate(parts) if parts else np.zeros(0, dtype)
+
+def activity_heatmap(folder, days = 7, end = None, zone = None):
+	''' ([day], array[day, hour]) of the fraction of each local hour with motion in the last days, today included '''
+	last = datetime.date.fromtimestamp(end or time.time())
+	first = last - datetime.timedelta(days = days - 1)
+	records = read_events(folder, 'activity', time.mktime(first.timetuple()), time.mktime((last + datetime.timedelta(days = 1)).timetuple()))
+	if zone is not None:
+		names = load_zone_names(folder)
+		records = records[records['zone'] == (names.index(zone) if zone in names else -1)]
+	heatmap = np.zeros((days, 24))
+	if len(records):
+		share = records['motion_frames'] / np.maximum(records['frames'], 1)
+		t = records['t'].astype(np.int64)
+		# all zones: a second counts once, with its busiest zone
+		starts = np.flatnonzero(np.diff(t, prepend = -1))
+		share, t = np.maximum.reduceat(share, starts), t[starts]
+		# hours counted from each local midnight, which also gets DST days right
+		midnights = np.array([time.mktime((first + datetime.timedelta(days = d)).timetuple()) for d in range(days + 1)])
+		day_index = np.searchsorted(midnights, t, side = 'right') - 1
+		hour = ((t - midnights[day_index]) // 3600).astype(int).clip(0, 23)
+		np.add.at(heatmap, (day_index, hour), share / 3600)
+	return [first + datetime.timedelta(days = d) for d in range(days)], heatmap
+
+def triggers(folder, start, end, hours = None, downloads_folder = None):
+	''' triggers with start <= time < end as dicts, optionally only those in local hours [from, to), with the files they produced '''
+	names = load_zone_names(folder)
+	records = read_events(folder, 'trigger', start, end)
+	downloads = read_events(downloads_folder or folder, 'download', start, end + DEFAULT_EVENT_LOG_DOWNLOAD_WINDOW_SEC)
+	files = {}
+	for d in downloads:
+		files.setdefault(float(d['trigger_time']), []).append(d['file'].decode())
+	result = []
+	for r in records:
+		t = float(r['t'])
+		local = time.localtime(t)
+		if hours and not hours[0] <= local.tm_hour < hours[1]:
+			continue
+		result.append({'time': time.strftime('%Y-%m-%d %H:%M:%S', local), 't': t, 'zone': names[r['zone']] if r['zone'] < len(names) else r['zone'],
+			'boxes': int(r['boxes']), 'box': [int(r['x']), int(r['y']), int(r['w']), int(r['h'])], 'files': files.get(t, [])})
+	return result
+
+def parse_time(text):
+	return time.mktime(datetime.datetime.fromisoformat(text).timetuple())
+
+
+if __name__ == "__main__":
+	ap = argparse.ArgumentParser(
+		   formatter_class=lambda prog: argparse.ArgumentDefaultsHelpFormatter(
+				prog, max_help_position=80, width=150))
+	ap.add_argument("query", choices=('heatmap', 'triggers'))
+	ap.add_argument("--folder", default=DEFAULT_EVENT_LOG_FOLDER, help="event log folder (with --sources, the source's sub folder)")
+	ap.add_argument("--days", type=int, default=7, help="heatmap: number of days, today included")
+	ap.add_argument("--zone", default=None, help="heatmap: only this zone")
+	ap.add_argument("--since", default=None, help="triggers: local time, e.g. 2026-10-17T06:00. default is --days ago")
+	ap.add_argument("--until", default=None, help="triggers: local time. default is now")
+	ap.add_argument("--hours", type=int, nargs=2, default=None, help="triggers: only those between these local hours of every day, e.g. 6 8")
+	ap.add_argument("--downloads-folder", default=None, help="triggers: where the camera logged its downloads, if not --folder (the parent folder with --sources)")
+	ap.add_argument("--json", action="store_true", help="print JSON instead of a table")
+	args = ap.parse_args()
+
+	start_query = time.perf_counter()
+	if args.query == 'heatmap':
+		days, heatmap = activity_heatmap(args.folder, args.days, zone = args.zone)
+		result = {'days': [str(d) for d in days], 'hours': np.round(heatmap, 4).tolist()}
+		if not args.json:
+			print ('            ' + ''.join(f'{h:>4}' for h in range(24)))
+			for day, row in zip(days, heatmap):
+				# percent of the hour with motion
+				print (f'{day}  ' + ''.join(f'{int(round(v * 100)):>4}' if v else '   .' for v in row))
+	else:
+		until = parse_time(args.until) if args.until else time.time()
+		since = parse_time(args.since) if args.since else until - args.days * 86400
+		result = triggers(args.folder, since, until, args.hours, args.downloads_folder)
+		if not args.json:
+			for r in result:
+				print (r['time'], r['zone'], r['box'], ' '.join(r['files']))
+	if args.json:
+		print (json.dumps(result))
+	print (f'query took {(time.perf_counter() - start_query) * 1000:.1f} ms')
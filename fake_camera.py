@@ -0,0 +1,135 @@
+''' A gphoto2 Camera stand-in, so the camera worker can be benchmarked without a DSLR.
+	Delays are configurable and spent in time.sleep, like a real camera spends them on USB:
+	- config calls cost a round trip, plus per widget transfer time when the whole tree is fetched or pushed
+	- a capture takes capture_delay and leaves a file of file_kb on the camera
+	- files are transferred at usb_mb_per_sec, whole (file_get) or in chunks (file_read). their thumbnail (GP_FILE_TYPE_PREVIEW) has preview_kb
+- deleting a file costs a round trip, after which it is gone
+	CameraControlManagerSubProcess(camera_factory = functools.partial(FakeCamera, ...)) runs the real worker on it.
+	libgphoto2 isn't needed to import this: its few constants are libgphoto2's own values, and without the gphoto2 bindings errors
+	are raised as a stand-in GPhoto2Error. The camera worker itself (camera_control.py) still needs the bindings.
+'''
+import time
+import types
+
+# libgphoto2's values
+GP_ERROR_NOT_SUPPORTED = -6
+GP_ERROR_FILE_NOT_FOUND = -108
+GP_FILE_TYPE_PREVIEW = 0
+GP_CAPTURE_IMAGE = 0
+
+try:
+	from gphoto2 import GPhoto2Error
+except ImportError:
+	class GPhoto2Error(Exception):
+		def __init__(self, code):
+			Exception.__init__(self, f'[{code}] gphoto2 error')
+			self.code = code
+
+class FakeWidget:
+	''' a gphoto2 CameraWidget stand-in '''
+	def __init__(self, name, value = 0, choices = (), children = ()):
+		self.name = name
+		self.value = value
+		self.choices = choices
+		self.children = children
+
+	def get_child_by_name(self, name):
+		for child in self.children:
+			if child.name == name:
+				return child
+			try:
+				return child.get_child_by_name(name)
+			except KeyError:
+				pass
+		raise KeyError(name)
+
+	def get_value(self):
+		return self.value
+
+	def set_value(self, value):
+		self.value = value
+
+	def count_choices(self):
+		return len(self.choices)
+
+	def get_choice(self, i):
+		return self.choices[i]
+
+
+class FakeFile:
+	def __init__(self, camera, size):
+		self.camera = camera
+		self.size = size
+
+	def save(self, path):
+		time.sleep(self.size / self.camera.usb_rate)
+		with open(path, 'wb') as f:
+			f.truncate(self.size)
+
+
+class FakeCamera:
+	''' a gphoto2 Camera stand-in. the defaults are roughly those of a DSLR on USB 2.0 '''
+	def __init__(self, round_trip = 0.03, per_widget = 0.001, widgets = 300, single_config = True,
+				capture_delay = 0.3, file_kb = 8000, usb_mb_per_sec = 20, init_delay = 0, preview_kb = 160):
+		self.round_trip = round_trip
+		self.tree_time = round_trip + per_widget * widgets
+		self.single_config = single_config
+		self.capture_delay = capture_delay
+		self.file_size = file_kb * 1024
+		self.preview_size = preview_kb * 1024
+		self.deleted = set()
+		self.usb_rate = usb_mb_per_sec * 1024 * 1024
+		self.init_delay = init_delay
+		self.shots = 0
+		filler = [FakeWidget(f'setting{i}') for i in range(widgets - 2)]
+		self.tree = FakeWidget('main', children = [FakeWidget('actions', children = [FakeWidget('autofocusdrive')]),
+			FakeWidget('settings', children = [FakeWidget('capturetarget', 'Internal RAM', ('Internal RAM', 'Memory card'))] + filler)])
+
+	def init(self):
+		time.sleep(self.init_delay)
+
+	def exit(self):
+		pass
+
+	def set_port_info(self, port_info):
+		pass
+
+	def get_config(self):
+		time.sleep(self.tree_time)
+		return self.tree
+
+	def set_config(self, tree):
+		time.sleep(self.tree_time)
+
+	def set_single_config(self, name, widget):
+		if not self.single_config:
+			raise GPhoto2Error(GP_ERROR_NOT_SUPPORTED)
+		time.sleep(self.round_trip)
+
+	def capture(self, kind):
+		time.sleep(self.capture_delay)
+		self.shots += 1
+		return types.SimpleNamespace(folder = '/store_00010001/DCIM/100CANON', name = f'IMG_{self.shots:04d}.JPG') # like gp.CameraFilePath
+
+	def _check(self, folder, name):
+		if (folder, name) in self.deleted:
+			raise GPhoto2Error(GP_ERROR_FILE_NOT_FOUND)
+
+	def file_get_info(self, folder, name):
+		self._check(folder, name)
+		return types.SimpleNamespace(file = types.SimpleNamespace(size = self.file_size), preview = types.SimpleNamespace(size = self.preview_size))
+
+	def file_read(self, folder, name, kind, offset, buffer):
+		self._check(folder, name)
+		n = max(min(len(buffer), self.file_size - offset), 0)
+		time.sleep(self.round_trip + n / self.usb_rate)
+		return n
+
+	def file_get(self, folder, name, kind):
+		self._check(folder, name)
+		return FakeFile(self, self.preview_size if kind == GP_FILE_TYPE_PREVIEW else self.file_size)
+
+	def file_delete(self, folder, name):
+		self._check(folder, name)
+		time.sleep(self.round_trip)
+		self.deleted.add((folder, name))
@@ -0,0 +1,157 @@
+import threading
+import time
+import cv2
+import numpy as np
+from metrics import Metrics
+from defaults import *
+
+def preview_shape(frames):
+	''' shape of the preview composite of (detection square, threshold, delta, original frame) '''
+	frame, orig_frame = frames[0], frames[3]
+	return (orig_frame.shape[0], orig_frame.shape[1] + frame.shape[1] + 20, 3)
+
+def compose_preview(frames, vis):
+	''' Merging all frames into vis (of preview_shape(frames)): original on the left, detection square / threshold / delta stacked on a grey strip on the right '''
+	(frame, thresh, frameDelta, orig_frame) = frames
+	h, w = orig_frame.shape[:2]
+	fh, fw = frame.shape[:2]
+	if orig_frame.ndim == 2: # grayscale capture
+		orig_frame, frame = orig_frame[:, :, None], frame[:, :, None]
+	vis[:, :w] = orig_frame
+	vis[:, w:] = 128
+	side = vis[:, w + 10:w + 10 + fw]
+	rows = min(fh, h)
+	side[:rows] = frame[:rows]
+	for i, gray in enumerate((thresh, frameDelta), 1):
+		# with a detection scale below 1 these are smaller than the detection square
+		gh, gw = gray.shape[:2]
+		rows = min(gh, h - i * fh)
+		if rows > 0:
+			side[i * fh:i * fh + rows, :gw] = gray[:rows, :, None] # broadcast gray to all 3 channels, no GRAY2BGR temporaries
+	return vis
+
+class FrameHub:
+	''' Broadcasts the detector's preview composite to any number of MJPEG viewers.
+		The detector publishes raw frames and bumps a generation counter. A single encoder thread encodes each new generation
+		exactly once (at most preview_fps times a second) and every viewer gets the same shared bytes.
+		Viewers always jump to the newest encoded generation, so a slow client drops frames instead of pushing back on detection.
+		subscribe() is for thread per client servers. Viewers on an event loop (async_server.py) attach(), get called back by
+		the encoder thread through add_listener() and pick up latest() on the loop instead.
+	'''
+	def __init__(self, preview_fps = DEFAULT_PREVIEW_FPS, jpeg_quality = DEFAULT_PREVIEW_JPEG_QUALITY, metrics = None):
+		self.preview_fps = preview_fps
+		self.encode_time = (metrics or Metrics(False)).histogram('birdwatcher_preview_encode_seconds', 'time to compose and JPEG encode one preview frame')
+		self.jpeg_quality = jpeg_quality
+		self._lock = threading.Lock()
+		self._new_frame = threading.Condition(self._lock)
+		self._new_jpeg = threading.Condition(self._lock)
+		self._frames = None
+		self.generation = 0 # raw frames published by the detector
+		self._jpeg = None
+		self.encoded_frames = 0 # generations actually encoded. a generation published while the encoder is busy is never encoded
+		self.dropped_frames = 0 # sum over all viewers of encoded frames a viewer never got to see
+		self.viewers = 0
+		self._closed = False
+		self._encoder = None
+		self._canvas = None
+		self._listeners = []
+
+	def publish(self, frames):
+		''' called from the detection loop for every processed frame. never blocks on encoding or on viewers '''
+		with self._lock:
+			self._frames = frames
+			self.generation += 1
+			if self.viewers:
+				self._new_frame.notify()
+
+	def subscribe(self):
+		''' generator of multipart MJPEG chunks, one per encoded generation. ends when the hub is closed '''
+		self.attach()
+		try:
+			seen = None
+			while True:
+				with self._lock:
+					while not self._closed and (self._jpeg is None or self.encoded_frames == seen):
+						self._new_jpeg.wait()
+					if self._closed:
+						return
+					if seen is not None:
+						self.dropped_frames += self.encoded_frames - seen - 1
+					seen = self.encoded_frames
+					jpeg = self._jpeg
+				yield jpeg
+		finally:
+			self.detach()
+
+	def attach(self):
+		''' counts a viewer in, starting the encoder on the first one '''
+		with self._lock:
+			self.viewers += 1
+			if self._encoder is None:
+				self._encoder = threading.Thread(target = self._encode_loop, name = 'preview-encoder', daemon = True)
+				self._encoder.start()
+			self._new_frame.notify()
+
+	def detach(self, dropped = 0):
+		''' counts a viewer out, with the encoded frames it skipped since its last latest() '''
+		with self._lock:
+			self.viewers -= 1
+			self.dropped_frames += dropped
+
+	def latest(self, seen = None):
+		''' (encoded frame count, multipart chunk) of the newest encoded frame. seen is what the viewer got last, for the drop count '''
+		with self._lock:
+			if seen is not None and self.encoded_frames > seen:
+				self.dropped_frames += self.encoded_frames - seen - 1
+			return self.encoded_frames, self._jpeg
+
+	@property
+	def closed(self):
+		return self._closed
+
+	def add_listener(self, callback):
+		''' callback() is called from the encoder thread after every encoded frame, and from close(). it must not block '''
+		self._listeners.append(callback)
+
+	def close(self):
+		with self._lock:
+			self._closed = True
+			self._new_frame.notify_all()
+			self._new_jpeg.notify_all()
+		for callback in self._listeners:
+			callback()
+
+	def _encode_loop(self):
+		last = 0
+		while True:
+			with self._lock:
+				while not self._closed and (self.generation == last or self.viewers == 0):
+					self._new_frame.wait()
+				if self._closed:
+					return
+				frames, last = self._frames, self.generation
+			next_time = time.monotonic() + 1 / self.preview_fps if self.preview_fps else 0
+			with self.encode_time.time():
+				jpeg = self._encode(frames)
+			self._set_jpeg(jpeg)
+			delay = next_time - time.monotonic()
+			if delay > 0:
+				time.sleep(delay)
+
+	def _set_jpeg(self, jpeg):
+		with self._lock:
+			self._jpeg = jpeg
+			self.encoded_frames += 1
+			self._new_jpeg.notify_all()
+		for callback in self._listeners:
+			callback()
+
+	def _encode(self, frames):
+		shape = preview_shape(frames)
+		if self._canvas is None or self._canvas.shape != shape:
+			self._canvas = np.empty(shape, np.uint8)
+		return self._to_jpeg(compose_preview(frames, self._canvas))
+
+	def _to_jpeg(self, vis):
+		(flag, encodedImage) = cv2.imencode(".jpg", vis, (cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality))
+		return b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + encodedImage.tobytes() + b'\r\n'
@@ -0,0 +1,234 @@
+''' Frame sources hand the detector each new frame exactly once, together with its capture time.
+	Live cameras run a capture thread that blocks on the camera and publishes frames with a sequence number; read() blocks
+	on a condition variable until a newer frame exists, so detection latency is bounded by capture, not by a poll loop.
+	Frames the detector was too slow to take are counted as dropped, frames the camera delivered twice (same timestamp)
+	as duplicated and are not handed out.
+'''
+import queue
+import sys
+import threading
+import time
+import traceback
+import cv2
+from lazy_import import lazy_import
+from defaults import *
+
+imutils = lazy_import('imutils') # only for --frame-resize. it pulls in urllib and friends
+
+class FrameSource:
+	zero_copy = False # frames are views into camera buffers, only valid until the next read()
+
+	def __init__(self, frame_resize = None, fps = DEFAULT_TARGET_FPS):
+		self.frame_resize = frame_resize
+		self.fps = fps
+		self.captured = 0
+		self.delivered = 0
+		self.dropped = 0
+		self.duplicated = 0
+
+	def _prepare(self, frame):
+		return frame if self.frame_resize is None else imutils.resize(frame, width=self.frame_resize) # resize the frame
+
+	def counters(self):
+		return {'captured': self.captured, 'delivered': self.delivered, 'dropped': self.dropped, 'duplicated': self.duplicated}
+
+
+class CaptureThreadSource(FrameSource):
+	''' base of live camera sources. subclasses implement _grab() -> (frame, camera timestamp or None, release handle or None) '''
+	def __init__(self, frame_resize = None, fps = DEFAULT_TARGET_FPS):
+		FrameSource.__init__(self, frame_resize, fps)
+		self.new_frame = threading.Condition()
+		self.seq = 0
+		self.read_seq = 0
+		self.latest = None
+		self.latest_handle = None
+		self.delivered_handle = None
+		self.running = False
+
+	def start(self):
+		self.running = True
+		self.thread = threading.Thread(target = self._capture_loop, name = 'frame-capture', daemon = True)
+		self.thread.start()
+		return self
+
+	def _capture_loop(self):
+		last_ts = None
+		try:
+			while self.running:
+				frame, ts, handle = self._grab()
+				capture_time = time.time()
+				if frame is None:
+					print ('camera returned no frame, stopping capture')
+					break
+				if ts and ts == last_ts:
+					self.duplicated += 1
+					self._release(handle)
+					continue
+				last_ts = ts
+				frame = self._prepare(frame)
+				with self.new_frame:
+					if self.latest_handle is not None: # the previous frame was never read
+						self._release(self.latest_handle)
+					self.latest = (frame, capture_time)
+					self.latest_handle = handle
+					self.seq += 1
+					self.captured += 1
+					self.new_frame.notify()
+		except Exception:
+			# e.g. the webcam was unplugged. read() returns None, as at the end of a video, instead of waiting forever
+			print ('capture failed, stopping capture')
+			traceback.print_exc(file=sys.stdout)
+		finally:
+			with self.new_frame:
+				self.running = False
+				self.new_frame.notify_all()
+
+	def read(self):
+		''' blocks until a frame newer than the last one read was captured. returns (frame, capture time), or None once capture stopped '''
+		with self.new_frame:
+			if self.delivered_handle is not None: # the caller is done with the frame it read last
+				self._release(self.delivered_handle)
+				self.delivered_handle = None
+			while self.running and self.seq == self.read_seq:
+				self.new_frame.wait()
+			if self.seq == self.read_seq:
+				return None
+			self.dropped += self.seq - self.read_seq - 1
+			self.read_seq = self.seq
+			self.delivered += 1
+			self.delivered_handle, self.latest_handle = self.latest_handle, None
+			return self.latest
+
+	def stop(self):
+		self.running = False
+		self.thread.join(timeout = 2)
+		self._close()
+
+	def _release(self, handle):
+		pass
+
+
+class OpenCVSource(CaptureThreadSource):
+	''' webcam through cv2.VideoCapture. the v4l2 backend keeps a single driver buffer so every read is a fresh frame.
+		gray delivers single channel frames. with v4l2 the camera's raw YUYV is read and its Y plane taken as is, with no color
+		conversion at all; other backends convert in the capture thread.
+	'''
+	def __init__(self, src = 0, backend = 'opencv', frame_resize = None, fps = DEFAULT_TARGET_FPS, gray = False):
+		CaptureThreadSource.__init__(self, frame_resize, fps)
+		self.vs = cv2.VideoCapture(src, cv2.CAP_V4L2 if backend == 'v4l2' else cv2.CAP_ANY)
+		self.vs.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+		self.vs.set(cv2.CAP_PROP_FPS, fps)
+		self.gray = gray
+		self.raw_yuyv = gray and backend == 'v4l2'
+		if self.raw_yuyv:
+			self.vs.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'YUYV'))
+			self.vs.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+			self.size = (int(self.vs.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(self.vs.get(cv2.CAP_PROP_FRAME_WIDTH)))
+
+	def _grab(self):
+		ok, frame = self.vs.read()
+		if not ok:
+			return None, None, None
+		if self.raw_yuyv:
+			h, w = self.size
+			if frame.size == h * w * 2:
+				frame = frame.reshape(h, w, 2)[:, :, 0] # Y0 U Y1 V: luma is every other byte
+			else: # the driver converted anyway
+				print (f'camera did not deliver raw YUYV {frame.shape}, converting to gray')
+				self.raw_yuyv = False
+		if self.gray and frame.ndim == 3:
+			frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+		return frame, self.vs.get(cv2.CAP_PROP_POS_MSEC), None
+
+	def _close(self):
+		self.vs.release()
+
+
+class Picamera2Source(CaptureThreadSource):
+	''' Pi camera through libcamera (picamera2). with zero_copy the detector works directly on the mapped camera buffer,
+		which is handed back to libcamera on the next read(); otherwise each frame is copied out once in the capture thread.
+		gray captures YUV420 and hands out the Y plane, the camera's own grayscale image.
+	'''
+	def __init__(self, frame_resize = None, fps = DEFAULT_TARGET_FPS, size = DEFAULT_PICAMERA_SIZE, zero_copy = False, gray = False, camera_num = 0):
+		from picamera2 import Picamera2, MappedArray # optional dependency, only needed on a Pi with libcamera
+		CaptureThreadSource.__init__(self, frame_resize, fps)
+		self.MappedArray = MappedArray
+		self.zero_copy = zero_copy and frame_resize is None # resizing copies anyway
+		self.picam2 = Picamera2(camera_num)
+		self.gray_rows = size[1] if gray else None # YUV420 arrays are the full Y plane followed by the U and V planes
+		frame_duration = int(1000000 / fps)
+		# 'RGB888' is BGR byte order in memory, which is what OpenCV expects
+		self.picam2.configure(self.picam2.create_video_configuration(main = {'format': 'YUV420' if gray else 'RGB888', 'size': size},
+			controls = {'FrameDurationLimits': (frame_duration, frame_duration)}, buffer_count = 4))
+		self.picam2.start()
+
+	def _grab(self):
+		request = self.picam2.capture_request()
+		ts = request.get_metadata().get('SensorTimestamp')
+		if not self.zero_copy:
+			frame = request.make_array('main')
+			request.release()
+			return frame[:self.gray_rows], ts, None
+		mapped = self.MappedArray(request, 'main')
+		return mapped.__enter__().array[:self.gray_rows], ts, (request, mapped)
+
+	def _release(self, handle):
+		if handle is not None:
+			request, mapped = handle
+			mapped.__exit__(None, None, None)
+			request.release()
+
+	def _close(self):
+		self.picam2.stop()
+		self.picam2.close()
+
+
+class VideoFileSource(FrameSource):
+	''' recorded video. every frame is delivered. realtime plays the file at its own frame rate with wall clock frame times;
+		otherwise frames come as fast as they decode and frame time is the position in the video, optionally decoded on its own thread
+	'''
+	def __init__(self, path, frame_resize = None, realtime = True, decode_thread = False, queue_size = 64):
+		self.vs = cv2.VideoCapture(path)
+		FrameSource.__init__(self, frame_resize, self.vs.get(cv2.CAP_PROP_FPS) or DEFAULT_TARGET_FPS)
+		self.realtime = realtime
+		self.decode_thread = decode_thread
+		self.frames = queue.Queue(queue_size) if decode_thread else None
+		self.next_time = None
+
+	def start(self):
+		if self.decode_thread:
+			self.thread = threading.Thread(target = self._decode_loop, name = 'video-decoder', daemon = True)
+			self.thread.start()
+		return self
+
+	def _decode(self):
+		ok, frame = self.vs.read()
+		if not ok:
+			return None
+		self.captured += 1
+		return (self._prepare(frame), (self.captured - 1) / self.fps)
+
+	def _decode_loop(self):
+		while True:
+			item = self._decode()
+			self.frames.put(item)
+			if item is None:
+				break
+
+	def read(self):
+		item = self.frames.get() if self.decode_thread else self._decode()
+		if item is None:
+			return None
+		self.delivered += 1
+		if not self.realtime:
+			return item
+		# play back at the file's frame rate
+		now = time.time()
+		self.next_time = max(self.next_time or now, now - 1 / self.fps)
+		if self.next_time > now:
+			time.sleep(self.next_time - now)
+		self.next_time += 1 / self.fps
+		return item[0], time.time()
+
+	def stop(self):
+		self.vs.release()
@@ -0,0 +1,25 @@
+''' Modules that are only loaded when first used, to keep them out of startup.
+	python3 -X importtime motion_detector_app.py ... shows what the rest of the imports cost.
+'''
+import importlib.util
+import sys
+import types
+
+class MissingModule(types.ModuleType):
+	''' stands in for a module that isn't installed: using it raises the ImportError importing it would have '''
+	def __getattr__(self, attr):
+		raise ImportError(f'no module named {self.__name__}', name = self.__name__)
+
+def lazy_import(name):
+	''' the module, executed on its first attribute access. an already imported module is returned as is.
+		a module that isn't installed only fails when used, e.g. gphoto2 on a host that runs the benchmarks without a DSLR '''
+	if name in sys.modules:
+		return sys.modules[name]
+	spec = importlib.util.find_spec(name)
+	if spec is None:
+		return MissingModule(name)
+	spec.loader = importlib.util.LazyLoader(spec.loader)
+	module = importlib.util.module_from_spec(spec)
+	sys.modules[name] = module
+	spec.loader.exec_module(module)
+	return module
@@ -0,0 +1,152 @@
+''' Load test of the web UI: many concurrent viewers against a video replayed in real time.
+	Starts motion_detector_app.py on the video with each --server, then for each --viewers count opens that many MJPEG previews,
+	each with a status stream, and measures from /metrics what it does to detection: frames per second, webcam frames dropped
+	because the detector fell behind, frame latency and detection time per frame. Viewers are asyncio connections of this
+	process, so the clients themselves hold no threads. Results are printed and appended as JSON lines to --out.
+'''
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+import cv2
+from motion_detector_app import get_outbound_ip
+from defaults import *
+
+def scrape(host, port):
+	''' {(name, labels): value} of the app's /metrics '''
+	with urllib.request.urlopen(f'http://{host}:{port}/metrics') as r:
+		text = r.read().decode()
+	samples = {}
+	for line in text.splitlines():
+		if line and not line.startswith('#'):
+			series, value = line.rsplit(' ', 1)
+			name, _, labels = series.partition('{')
+			samples[(name, labels.rstrip('}'))] = float(value)
+	return samples
+
+def detection_stats(before, after, elapsed):
+	def delta(name, labels = ''):
+		return after.get((name, labels), 0) - before.get((name, labels), 0)
+	delivered = delta('birdwatcher_frames_total', 'kind="delivered"')
+	# everything but waiting for the next frame
+	busy = sum(after[k] - before.get(k, 0) for k in after if k[0] == 'birdwatcher_detection_stage_seconds_sum' and k[1] != 'stage="read"')
+	latency_count = delta('birdwatcher_frame_latency_seconds_count')
+	return {
+		'detection_fps': round(delivered / elapsed, 2),
+		'dropped_frames': int(delta('birdwatcher_frames_total', 'kind="dropped"')),
+		'frame_latency_mean_ms': round(delta('birdwatcher_frame_latency_seconds_sum') / latency_count * 1000, 3) if latency_count else None,
+		'detection_busy_ms_per_frame': round(busy / delivered * 1000, 3) if delivered else None,
+	}
+
+async def viewer(host, port, path, marker, counts, i, stop):
+	''' reads a stream until stopped, counting markers (a preview frame or a status event) in counts[i] '''
+	try:
+		reader, writer = await asyncio.open_connection(host, port)
+	except OSError:
+		counts[i] = -1
+		return
+	writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+	tail = b''
+	try:
+		while not stop.is_set():
+			try:
+				chunk = await asyncio.wait_for(reader.read(65536), 0.5)
+			except asyncio.TimeoutError:
+				continue
+			if not chunk:
+				break
+			data = tail + chunk
+			counts[i] += data.count(marker)
+			tail = data[-len(marker) + 1:] # a marker split between two reads
+	finally:
+		writer.close()
+
+async def run_phase(host, port, viewers, duration):
+	loop = asyncio.get_running_loop()
+	stop = asyncio.Event()
+	frames, events = [0] * viewers, [0] * viewers
+	tasks = [asyncio.ensure_future(viewer(host, port, '/video_feed_frame', b'--frame', frames, i, stop)) for i in range(viewers)]
+	tasks += [asyncio.ensure_future(viewer(host, port, '/status_text', b'data:', events, i, stop)) for i in range(viewers)]
+	await asyncio.sleep(1) # let the viewers connect
+	before = await loop.run_in_executor(None, scrape, host, port)
+	start = time.monotonic()
+	start_frames = list(frames)
+	await asyncio.sleep(duration)
+	after = await loop.run_in_executor(None, scrape, host, port)
+	elapsed = time.monotonic() - start
+	got = [f - s for f, s in zip(frames, start_frames)]
+	stop.set()
+	await asyncio.gather(*tasks)
+	result = dict(detection_stats(before, after, elapsed), viewers = viewers, duration_sec = round(elapsed, 2))
+	if viewers:
+		result.update(preview_fps_mean = round(sum(got) / viewers / elapsed, 2), preview_fps_min = round(min(got) / elapsed, 2),
+			status_events = sum(max(e, 0) for e in events), failed_viewers = sum(f < 0 for f in frames))
+	return result
+
+def wait_ready(host, port, app, timeout = 60):
+	deadline = time.monotonic() + timeout
+	while time.monotonic() < deadline:
+		if app.poll() is not None:
+			raise RuntimeError(f'the app exited with {app.returncode}')
+		try:
+			urllib.request.urlopen(f'http://{host}:{port}/sources').read()
+			return
+		except OSError:
+			time.sleep(0.5)
+	raise RuntimeError('the app did not come up')
+
+def load_test(args, server):
+	host = get_outbound_ip()
+	app_args = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'motion_detector_app.py'), '-v', args.video,
+		'--server', server, '--ui-port', str(args.ui_port), '--event-log', ''] + args.app_args.split()
+	with open(args.log, 'a') as log:
+		# a session of its own, so it can be stopped like Ctrl-C stops it: the whole process group, camera worker included
+		app = subprocess.Popen(app_args, stdout = log, stderr = subprocess.STDOUT, start_new_session = True)
+	results = []
+	try:
+		wait_ready(host, args.ui_port, app)
+		time.sleep(args.warmup)
+		for viewers in args.viewers:
+			result = dict(server = server, video = args.video, **asyncio.run(run_phase(host, args.ui_port, viewers, args.duration)))
+			print (result)
+			results.append(result)
+	finally:
+		os.killpg(app.pid, signal.SIGINT)
+		try:
+			app.wait(timeout = 15)
+		except subprocess.TimeoutExpired:
+			os.killpg(app.pid, signal.SIGKILL)
+			app.wait()
+	return results
+
+
+if __name__ == "__main__":
+	ap = argparse.ArgumentParser(
+		   formatter_class=lambda prog: argparse.ArgumentDefaultsHelpFormatter(
+				prog, max_help_position=80, width=150))
+	ap.add_argument("video", help="video replayed in real time as the live feed. it must last warmup + (duration + 1) x viewer counts")
+	ap.add_argument("--server", nargs='+', choices=('flask', 'async'), default=['flask', 'async'], help="web servers to test, one after the other")
+	ap.add_argument("--viewers", type=int, nargs='+', default=[0, 10, 50], help="concurrent viewers (preview + status stream each) of every phase")
+	ap.add_argument("--duration", type=float, default=10, help="seconds measured per phase")
+	ap.add_argument("--warmup", type=float, default=3, help="seconds before the first phase")
+	ap.add_argument("--ui-port", type=int, default=DEFAULT_UI_PORT + 1, help="port of the app under test")
+	ap.add_argument("--app-args", default='', help="more arguments for motion_detector_app.py, e.g. '--preview-fps 15'")
+	ap.add_argument("--log", default='load_test.log', help="output of the app under test")
+	ap.add_argument("--out", default='load_test.jsonl', help="JSON lines file the results are appended to")
+	args = ap.parse_args()
+
+	video = cv2.VideoCapture(args.video)
+	video_sec = video.get(cv2.CAP_PROP_FRAME_COUNT) / (video.get(cv2.CAP_PROP_FPS) or 30)
+	video.release()
+	needed = args.warmup + (args.duration + 1) * len(args.viewers) + 5
+	if video_sec < needed:
+		print (f'warning: {args.video} lasts {video_sec:.0f} s, the test needs about {needed:.0f} s')
+	with open(args.out, 'a') as f:
+		for server in args.server:
+			for r in load_test(args, server):
+				f.write(json.dumps(r) + '\n')
@@ -0,0 +1,158 @@
+''' Low overhead latency histograms and gauges, rendered in the Prometheus text format for the /metrics route.
+	Histograms are preallocated bucket counters: observe() is a bisect and two increments, with no allocation.
+	Histograms written by the camera worker process live in shared memory, so the web server process can render them.
+	A disabled registry hands out no-op histograms and timers, so instrumented code runs unchanged with metrics off.
+	Detector processes send a snapshot() of their registry to the web server, which renders all of them together.
+'''
+from bisect import bisect_left
+import multiprocessing
+import time
+
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+CAMERA_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+
+class Histogram:
+	def __init__(self, buckets, shared = False):
+		self.buckets = tuple(buckets)
+		# one counter per bucket, one for +Inf, then the sum of all observed values
+		n = len(self.buckets) + 2
+		self.values = multiprocessing.RawArray('d', n) if shared else [0.0] * n
+
+	def observe(self, value):
+		self.values[bisect_left(self.buckets, value)] += 1
+		self.values[-1] += value
+
+	def time(self):
+		return _Timed(self)
+
+	def samples(self):
+		''' (cumulative count per upper bound including '+Inf', sum, count) '''
+		counts = self.values[:-1]
+		cumulative, total = [], 0
+		for c in counts:
+			total += c
+			cumulative.append(int(total))
+		return list(zip([*map(str, self.buckets), '+Inf'], cumulative)), self.values[-1], int(total)
+
+
+class _Timed:
+	def __init__(self, histogram):
+		self.histogram = histogram
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+
+	def __exit__(self, type, value, traceback):
+		self.histogram.observe(time.perf_counter() - self.start)
+
+
+class _NoHistogram:
+	def observe(self, value):
+		pass
+
+	def time(self):
+		return _NoTimed()
+
+
+class _NoTimed:
+	def __enter__(self):
+		pass
+
+	def __exit__(self, type, value, traceback):
+		pass
+
+
+class StageTimer:
+	''' times consecutive stages of the frame loop: start() once, then lap(stage) after each stage records the time since the previous lap '''
+	def __init__(self, histograms):
+		self.histograms = histograms
+		self.last = 0.0
+
+	def start(self):
+		self.last = time.perf_counter()
+
+	def lap(self, stage):
+		now = time.perf_counter()
+		self.histograms[stage].observe(now - self.last)
+		self.last = now
+
+
+class NoTimer:
+	def start(self):
+		pass
+
+	def lap(self, stage):
+		pass
+
+NO_TIMER = NoTimer()
+
+
+class Metrics:
+	''' registry of metric families. enabled = False turns every histogram, timer and the /metrics output off '''
+	def __init__(self, enabled = True):
+		self.enabled = enabled
+		self.families = {} # name -> (type, help, [(labels, histogram or value function)])
+
+	def _add(self, kind, name, help, labels, metric):
+		self.families.setdefault(name, (kind, help, []))[2].append((labels, metric))
+		return metric
+
+	def histogram(self, name, help, buckets = STAGE_BUCKETS, shared = False, **labels):
+		if not self.enabled:
+			return _NoHistogram()
+		return self._add('histogram', name, help, labels, Histogram(buckets, shared))
+
+	def gauge(self, name, help, value, **labels):
+		''' value() is called when the metrics are rendered '''
+		if self.enabled:
+			self._add('gauge', name, help, labels, value)
+
+	def counter(self, name, help, value, **labels):
+		if self.enabled:
+			self._add('counter', name, help, labels, value)
+
+	def stage_timer(self, name, help, stages):
+		''' a StageTimer with one histogram per stage, labeled stage="..." '''
+		if not self.enabled:
+			return NO_TIMER
+		return StageTimer({stage: self.histogram(name, help, stage = stage) for stage in stages})
+
+	def snapshot(self, **labels):
+		''' current values as plain data, {name: (type, help, [(labels, samples or value)])}. the given labels are added to every series '''
+		families = {}
+		for name, (kind, help, metrics) in self.families.items():
+			values = []
+			for series_labels, metric in metrics:
+				try:
+					values.append((dict(series_labels, **labels), metric.samples() if kind == 'histogram' else metric()))
+				except Exception as e: # e.g. the camera worker is gone
+					print (f'metric {name} unavailable: {e}')
+			families[name] = (kind, help, values)
+		return families
+
+	def render(self):
+		return render(self.snapshot())
+
+def render(*snapshots):
+	''' Prometheus text format of one or more snapshots. families of the same name are merged '''
+	families = {}
+	for snapshot in snapshots:
+		for name, (kind, help, values) in snapshot.items():
+			families.setdefault(name, (kind, help, []))[2].extend(values)
+	lines = []
+	for name, (kind, help, values) in families.items():
+		lines.append(f'# HELP {name} {help}')
+		lines.append(f'# TYPE {name} {kind}')
+		for labels, value in values:
+			if kind != 'histogram':
+				lines.append(f'{name}{_labels(labels)} {value}')
+				continue
+			buckets, total, count = value
+			for le, c in buckets:
+				lines.append(f'{name}_bucket{_labels(dict(labels, le = le))} {c}')
+			lines.append(f'{name}_sum{_labels(labels)} {total}')
+			lines.append(f'{name}_count{_labels(labels)} {count}')
+	return '\n'.join(lines) + '\n'
+
+def _labels(labels):
+	return '{' + ','.join(f'{k}="{v}"' for k, v in labels.items()) + '}' if labels else ''
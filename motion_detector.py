@@ -1,18 +1,63 @@
-from imutils.video import VideoStream
-import datetime
-import imutils
 import time
 import cv2
-import collections
-from functools import reduce
-import gphoto2 as gp
-from camera_control import CameraControlManagerSubProcess, CameraControlMsg, release_camera, CAPTURE_IMAGE
-import concurrent.futures
-import numpy as np 
-import yaml 
+from camera_control import CameraControlManagerSubProcess, CameraControlMsg, CAPTURE_IMAGE
+from frame_hub import FrameHub
+from preroll import PrerollBuffer
+from frame_source import OpenCVSource, Picamera2Source, VideoFileSource
+from detection import FrameDetector, Zone, load_zones, dump_zones, DETECTION_STAGES, BLUR_TYPES, TRIGGER_MODES
+from metrics import Metrics
+from settings_store import SettingsStore
+from status_bus import StatusBus
+from event_log import EventLog
 import threading
 from defaults import *
 
+# settings that can be changed while running (see set_settings), with their types. persisted in the conf file under 'settings'
+RUNTIME_SETTINGS = {'threshold': int, 'blur_kernel': int, 'blur_type': str, 'detection_scale': float, 'background_alpha': float, 'background_max_freeze': float,
+	'capture_square_side': int, 'triggered_area_percent': float, 'frames_to_trigger': int, 'frames_required': int, 'retrigger_interval': float,
+	'autofocus_before_trigger': bool, 'burst_frames': int, 'preview_fps': int, 'preview_jpeg_quality': int,
+	'trigger_mode': str, 'shots_per_minute': float, 'min_trigger_score': float}
+# what each runtime setting must be. a bad value would be persisted and break detection on every later start
+SETTING_CHECKS = {
+	'threshold': (lambda v: 0 <= v <= 255, 'in [0, 255]'),
+	'blur_kernel': (lambda v: v >= 1 and v % 2 == 1, 'odd and at least 1'),
+	'blur_type': (lambda v: v in BLUR_TYPES, f'one of {BLUR_TYPES}'),
+	'detection_scale': (lambda v: 0 < v <= 1, 'in (0, 1]'),
+	'background_alpha': (lambda v: 0 < v <= 1, 'in (0, 1]'),
+	'background_max_freeze': (lambda v: v >= 0, 'at least 0'),
+	'capture_square_side': (lambda v: v > 0, 'positive'),
+	'triggered_area_percent': (lambda v: 0 < v <= 1, 'in (0, 1]'),
+	'frames_to_trigger': (lambda v: v >= 1, 'at least 1'),
+	'frames_required': (lambda v: v is None or v >= 1, 'at least 1'),
+	'retrigger_interval': (lambda v: v >= 0, 'at least 0'),
+	'burst_frames': (lambda v: v >= 1, 'at least 1'),
+	'preview_fps': (lambda v: v >= 1, 'at least 1'),
+	'preview_jpeg_quality': (lambda v: 0 <= v <= 100, 'in [0, 100]'),
+	'trigger_mode': (lambda v: v in TRIGGER_MODES, f'one of {TRIGGER_MODES}'),
+	'shots_per_minute': (lambda v: v >= 0, 'at least 0'),
+	'min_trigger_score': (lambda v: 0 <= v <= 1, 'in [0, 1]'),
+}
+
+def check_settings(values):
+	''' raises ValueError for the first value that isn't a valid runtime setting '''
+	for k, v in values.items():
+		if k not in RUNTIME_SETTINGS:
+			raise ValueError(f'{k} cannot be changed at runtime')
+		check, allowed = SETTING_CHECKS.get(k, (lambda v: True, ''))
+		if not check(v):
+			raise ValueError(f'{k} must be {allowed}, not {v}')
+
+def saved_settings(settings):
+	''' the runtime settings persisted in a SettingsStore, without invalid ones (e.g. saved by an older version) '''
+	valid = {}
+	for k, v in settings.get('settings', {}).items():
+		try:
+			check_settings({k: v})
+			valid[k] = v
+		except (ValueError, TypeError) as e:
+			print (f'ignoring saved setting: {e}')
+	return valid
+
 class MotionDetector:
 	def __init__(self,video, 
 				triggered_area_percent = DEFAULT_TRIGGERED_AREA_PERCENT, 
@@ -20,213 +65,309 @@ class MotionDetector:
 				capture_square_side = DEFAULT_CAPTURE_RECT_SIDE, 
 				retrigger_interval = DEFFAULT_RETRIGGER_INTERVAL_SEC,
 				frames_to_trigger = DEFAULT_FRAMES_TO_TRIGGER, 
+				frames_required = DEFAULT_FRAMES_REQUIRED,
+				trigger_mode = DEFAULT_TRIGGER_MODE,
+				shots_per_minute = DEFAULT_SHOTS_PER_MINUTE,
+				min_trigger_score = DEFAULT_MIN_TRIGGER_SCORE,
 				rebase_interval = REBASE_INTERVAL, 
 				download_photo_folder = DEFAULT_DOWNLOAD_PHOTO_FOLDER,
 				autofocus_before_trigger = DEFAULT_AUTOFOCUS_BEFORE_TRIGGER,
 				capture_target = DEFAULT_CAPTURE_TARGET,
+				burst_frames = DEFAULT_BURST_FRAMES,
+				download_chunk_kb = DEFAULT_DOWNLOAD_CHUNK_KB,
+				transfer = DEFAULT_TRANSFER,
+				transfer_idle_sec = DEFAULT_TRANSFER_IDLE_SEC,
+				transfer_hours = None,
+				delete_after_transfer = False,
+				preroll_seconds = DEFAULT_PREROLL_SEC,
+				postroll_seconds = DEFAULT_POSTROLL_SEC,
+				preroll_format = DEFAULT_PREROLL_FORMAT,
+				event_log = DEFAULT_EVENT_LOG_FOLDER,
+				preview_fps = DEFAULT_PREVIEW_FPS,
+				preview_jpeg_quality = DEFAULT_PREVIEW_JPEG_QUALITY,
+				threshold = DEFAULT_DIFF_THRESHOLD,
+				blur_kernel = DEFAULT_BLUR_KERNEL,
+				blur_type = DEFAULT_BLUR_TYPE,
+				detection_scale = DEFAULT_DETECTION_SCALE,
+				background_model = DEFAULT_BACKGROUND_MODEL,
+				background_alpha = DEFAULT_BACKGROUND_ALPHA,
+				background_max_freeze = DEFAULT_BACKGROUND_MAX_FREEZE_SEC,
+				target_fps = DEFAULT_TARGET_FPS,
+				camera_backend = DEFAULT_CAMERA_BACKEND,
+				device = 0,
+				zero_copy = False,
+				gray_capture = False,
+				realtime = True,
+				decode_thread = False,
+				metrics = DEFAULT_METRICS,
+				settings = None,
+				startup = None,
 				capture_center_x = None, capture_center_y = None):
 		#set all constructor args as member of class
 		self.__dict__.update(locals()) 
-		self.min_triggered_area = triggered_area_percent * capture_square_side ** 2
-		self.firstFrame = None
-		self.conf = yaml.safe_load(open(CONF_FILE))
-		self.conf['coordinates']['x'] = capture_center_x if capture_center_x else self.conf['coordinates']['x']
-		self.conf['coordinates']['y'] = capture_center_y if capture_center_y else self.conf['coordinates']['y']
-		self.currentFrames = None
-		self.currentStatus = 'Undetected'
-		self.status_change_event = threading.Event()
+		self.metrics = Metrics(metrics)
+		self.timer = self.metrics.stage_timer('birdwatcher_detection_stage_seconds', 'time spent in each stage of the detection loop. read includes waiting for the next frame', DETECTION_STAGES)
+		self.frame_latency = self.metrics.histogram('birdwatcher_frame_latency_seconds', 'from webcam frame capture to the end of its detection')
+		self.detector = FrameDetector(threshold = threshold, blur_kernel = blur_kernel,
+			background_model = background_model, background_alpha = background_alpha, background_max_freeze = background_max_freeze,
+			detection_scale = detection_scale, blur_type = blur_type, trigger_mode = trigger_mode, shots_per_minute = shots_per_minute,
+			min_trigger_score = min_trigger_score, timer = self.timer)
+		self.settings = settings or SettingsStore(CONF_FILE)
+		# command line detection settings are the defaults of every zone that doesn't set its own
+		self.zone_defaults = dict(side = capture_square_side, triggered_area_percent = triggered_area_percent,
+			frames_to_trigger = frames_to_trigger, frames_required = frames_required, retrigger_interval = retrigger_interval)
+		self.zones = load_zones(self.settings.data, **self.zone_defaults)
+		self.zones[0].x = capture_center_x if capture_center_x else self.zones[0].x
+		self.zones[0].y = capture_center_y if capture_center_y else self.zones[0].y
+		self.frame_hub = FrameHub(preview_fps, preview_jpeg_quality, self.metrics)
+		self.status_bus = StatusBus()
 		self.rebase_timer = None 
+		self.preroll = None
+		self.log = None
+		self.download_log_folder = event_log # where the DSLR worker logs its downloads
 
 
 	def __enter__(self):
 		# initialize the first frame in the video stream
 		# if the video argument is None, then we are reading from webcam	
 		if self.video is None:
-			self.vs = VideoStream(src=0).start()
-			time.sleep(0.5)
-			self.streaming = True
+			if self.camera_backend == 'picamera2':
+				self.source = Picamera2Source(self.frame_resize, self.target_fps, zero_copy = self.zero_copy, gray = self.gray_capture, camera_num = self.device)
+			else:
+				self.source = OpenCVSource(self.device, self.camera_backend, self.frame_resize, self.target_fps, gray = self.gray_capture)
 		# otherwise, we are reading from a video file
 		else:
-			self.vs = cv2.VideoCapture(self.video)
-			self.streaming = False
+			self.source = VideoFileSource(self.video, self.frame_resize, self.realtime, self.decode_thread)
+		self.source.start()
+		if self.startup:
+			self.startup.mark('camera_open')
+		# replayed video has no wall clock times, it isn't logged
+		if self.event_log and (self.video is None or self.realtime):
+			self.log = EventLog(self.event_log)
+		for kind in ('captured', 'delivered', 'dropped', 'duplicated'):
+			self.metrics.counter('birdwatcher_frames_total', 'webcam frames by what happened to them', lambda kind = kind: getattr(self.source, kind), kind = kind)
 		
+		# blocks until the camera delivered its first frame
 		frame = self._read_frame()
 		self.frame_dim = frame.shape
-		self.set_detect_rect() #set detection rect to middle of frame of size detection_rect_len
+		if self.startup:
+			self.startup.mark('first_frame')
+		self._apply_zones(f'detection zones: {", ".join(z.name for z in self.zones)}')
 		
 
 		return self
 
 	def __exit__(self, type, value, traceback):
 		# cleanup the camera and close all streams
-		self.vs.stop() if self.streaming else self.vs.release()
-		release_camera(self.camera)
-		cv2.destroyAllWindows()
-		self.currentFrames = None
+		self.source.stop()
+		if self.rebase_timer:
+			self.rebase_timer.cancel()
+		if self.preroll:
+			self.preroll.close()
+		if self.log:
+			self.log.close()
+		self.frame_hub.close()
+		self.settings.close()
 		print ("exit. all clear. bye...")
 
 	
 	
 	
-	def _set_current_status(self, new_status,fc=-1):
-		if new_status != self.currentStatus:
-			self.currentStatus = new_status
-			self.status_change_event.set()
+	@property
+	def currentStatus(self):
+		return self.status_bus.current
+
+	def _set_current_status(self, new_status,fc=-1, flip=False):
+		# movement / undetected flips change every few frames, they are coalesced by the bus and not printed
+		if self.status_bus.publish(new_status, flip) and not flip:
 			print (fc,'status change:',new_status)
 	
-	#grab the current frame 
+	#grab the next frame, None at the end of the video
 	def _read_frame(self):
-		frame = self.vs.read()
-		frame = frame if self.streaming else frame[1]
-		frame = frame if self.frame_resize is None else imutils.resize(frame, width=self.frame_resize) # resize the frame
-		return frame
-
-	def _encode_frame(self):
-		h=[x.shape[0] for x in self.currentFrames]
-		w=[x.shape[1] for x in self.currentFrames]
-		# Merging all frames into one image
-		vis = np.vstack((self.currentFrames[0], cv2.cvtColor(self.currentFrames[1],cv2.COLOR_GRAY2BGR),cv2.cvtColor(self.currentFrames[2],cv2.COLOR_GRAY2BGR)))
-		fill = np.zeros((self.currentFrames[3].shape[0], vis.shape[1]+20, 3), np.uint8)
-		fill[:,:,:] = (128,128,128)
-		fill[:vis.shape[0], 10:vis.shape[1]+10, :3]=vis
-		vis = np.hstack((self.currentFrames[3],fill))
-
-		(flag, encodedImage) = cv2.imencode(".jpg", vis)
-		return b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + bytearray(encodedImage) + b'\r\n'
-
-	def set_detect_rect(self, x = None,y = None):
-		# x = int(self.frame_dim[0] / 2) if x is None else x
-		# y = int(self.frame_dim[1] / 2) if y is None else y 
-		x = self.conf['coordinates']['x'] if x is None else x
-		y = self.conf['coordinates']['y'] if y is None else y 
-		drl = int (self.capture_square_side / 2)
-		self.detect_rect_slice = ( slice(
-			max(x - drl, 0),
-			min(x + drl, self.frame_dim[0])),
-		slice(
-			max(y - drl, 0),
-			min(y + drl, self.frame_dim[1]))
-		)
-		
-		self.conf['coordinates']['x']=x
-		self.conf['coordinates']['y']=y
-		with open(CONF_FILE, 'w') as f:
-			yaml.safe_dump(self.conf, f)
-			
-		#Setting timer to rebase the underlying background image used for moition detection comparison, to avoid drift.
+		item = self.source.read()
+		return None if item is None else item[0]
+
+	def set_detect_rect(self, x = None,y = None, zone = None):
+		''' moves a zone (the first one by default) to be centered at (x,y) '''
+		z = self._zone(zone)
+		z.x = z.x if x is None else x
+		z.y = z.y if y is None else y
+		self._apply_zones(f'detection square {z.name} was set to ({z.y},{z.x})')
+
+	def add_zone(self, name, x, y, **settings):
+		''' adds a zone centered at (x,y). settings not given (side, triggered_area_percent, ...) take the command line defaults '''
+		if not name:
+			raise ValueError('zone name is required')
+		if any(z.name == name for z in self.zones):
+			raise ValueError(f'zone {name} already exists')
+		self.zones.append(Zone(name, x, y, **dict(self.zone_defaults, **{k: v for k, v in settings.items() if v is not None})))
+		self._apply_zones(f'detection zone {name} was added at ({y},{x})')
+
+	def remove_zone(self, name):
+		z = self._zone(name)
+		if len(self.zones) == 1:
+			raise ValueError('cannot remove the last detection zone')
+		self.zones.remove(z)
+		self._apply_zones(f'detection zone {name} was removed')
+
+	def _zone(self, name):
+		if name is None:
+			return self.zones[0]
+		for z in self.zones:
+			if z.name == name:
+				return z
+		raise ValueError(f'no such zone {name}')
+
+	def set_settings(self, **values):
+		''' changes runtime settings (RUNTIME_SETTINGS) and persists them. zones that follow a command line default follow the new value '''
+		check_settings(values)
+		zones_changed = False
+		for k, v in values.items():
+			setattr(self, k, v)
+			if k == 'detection_scale': # detection resolution changes, so does the background
+				zones_changed = True
+			zk = 'side' if k == 'capture_square_side' else k
+			if zk in self.zone_defaults:
+				for z in self.zones:
+					if getattr(z, zk) == self.zone_defaults[zk]:
+						setattr(z, zk, v)
+				self.zone_defaults[zk] = v
+				zones_changed = True
+		with self.detector.lock:
+			self.detector.threshold = self.threshold
+			self.detector.blur_kernel = self.blur_kernel
+			self.detector.blur_type = self.blur_type
+			self.detector.trigger_mode = self.trigger_mode
+			self.detector.shots_per_minute = self.shots_per_minute
+			self.detector.min_trigger_score = self.min_trigger_score
+			self.detector.background.alpha = self.background_alpha
+			self.detector.background.max_freeze = self.background_max_freeze
+		self.frame_hub.preview_fps = self.preview_fps
+		self.frame_hub.jpeg_quality = self.preview_jpeg_quality
+		self.settings.set('settings', dict(self.settings.get('settings', {}), **values))
+		status = 'settings changed: ' + ', '.join(f'{k}={v}' for k, v in values.items())
+		if zones_changed:
+			self._apply_zones(status)
+		else:
+			self._set_current_status(status)
+
+	def current_settings(self):
+		return {k: getattr(self, k) for k in RUNTIME_SETTINGS}
+
+	def _apply_zones(self, status):
+		self.detector.set_zones(self.zones, self.frame_dim, self.detection_scale)
+		# kept in memory and written by the settings store in the background
+		self.settings.remove('coordinates')
+		self.settings.set('zones', dump_zones(self.zones, **self.zone_defaults))
+		self._rebase()
+		self._set_current_status(status)
+
+	def _rebase(self):
+		self.detector.rebase()
+		# The static background model needs a timer to rebase the underlying background image used for moition detection comparison, to avoid drift.
+		# adaptive models follow the scene frame by frame and never need one
 		if self.rebase_timer:
 			self.rebase_timer.cancel()
-		self.rebase_timer = threading.Timer(self.rebase_interval, self.set_detect_rect)
-		self.rebase_timer.start()
-
-		self.firstFrame = None #need to retake the base image
-		self._set_current_status(f'detection square was set to ({y},{x})')
-
-	def stream (self):
-		with CameraControlManagerSubProcess('worker-1', target_folder = self.download_photo_folder, capture_target = self.capture_target) as camCtl:    	
-			# Init:
-			last_detected = collections.deque(self.frames_to_trigger*[0], self.frames_to_trigger) # sliding window of last frames_to_trigger frames
-			prev_triggered = False
-			fc=0
-			ts = time.time()
-			triggered_time = frame_time = time.time()
-			curr_fps = TARGET_FPS
-			time.sleep(.5) #it takes the camera feed a few miliseconds to initialize
-			while True:
-				if time.time() - frame_time < 1 / TARGET_FPS: # should be a bit less than 1/32th of a second
-					time.sleep(0.003)
-					continue
-				fc+=1
-				frame_time = time.time()
-
-				# grab the current frame and initialize the occupied/Undetected text		
-				# read next frame from video source
-				frame = self._read_frame()
-				# if the frame could not be grabbed, then we have reached the end of the video
-				if frame is None:
-					break
-				text = "Undetected"
-				# saving original frame to show on video feed
-				orig_frame = frame
-				# slice the frame to the detection area only.
-				frame = frame[self.detect_rect_slice]
-				# convert frame to grayscale, and blur it
-				gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-				gray = cv2.GaussianBlur(gray, (21, 21), 0)
-
-				# if the first frame is None, initialize it
-				if self.firstFrame is None:
-					self.firstFrame = gray
-					prev_triggered = False
-					self._set_current_status('rebasing reference frame',fc)
-					continue
-
-				# compute the absolute difference between the current frame and first frame
-				frameDelta = cv2.absdiff(self.firstFrame, gray)
-				thresh = cv2.threshold(frameDelta, 25, 255, cv2.THRESH_BINARY)[1]
-				# dilate the thresholded image to fill in holes, then find contours on thresholded image
-				thresh = cv2.dilate(thresh, None, iterations=2)
-				cnts = cv2.findContours(thresh.copy(), cv2.RETR_EXTERNAL,
-					cv2.CHAIN_APPROX_SIMPLE)
-				cnts = imutils.grab_contours(cnts)
-
-				# loop over the contours
-				valid_cnts = 0
-				for c in cnts:
-					# if the contour is too small, ignore it
-					if cv2.contourArea(c) < self.min_triggered_area:
-						continue
-					valid_cnts += 1
-					# compute the bounding box for the contour, draw it on the frame, and update the text
-					(x, y, w, h) = cv2.boundingRect(c)
-					cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-					text = "Movement Detected"			
-				last_detected.append (valid_cnts)
-
-
-				# Trigger handling: if motion was detected for NUM_FRAMES_TO_TRIGGER frames and then continously for RETRIGGER_INTERVAL seconds
-				triggered = reduce ((lambda x,y: x>0 and y>0), last_detected) #triggered iff all last NUM_FRAMES_TO_TRIGGER motion was detected
-				if triggered:
-					if not prev_triggered:
-						text='triggered!!!'
-						camCtl.submit_task(CameraControlMsg(CAPTURE_IMAGE, {'autofocus':self.autofocus_before_trigger})) # fire camera
-						triggered_time = frame_time #Setting base time for retrigger
-					elif frame_time - triggered_time > self.retrigger_interval:
-						text='re-triggered!!!'
-						camCtl.submit_task(CameraControlMsg(CAPTURE_IMAGE, {'autofocus':self.autofocus_before_trigger})) # fire camera
-						triggered_time = frame_time #re-Setting base time for retrigger
-				prev_triggered = triggered
-				
-				#FPS calculation
-				
-				if time.time() - ts > 1:
-					curr_fps=fc
-					fc=1
-					ts=time.time()
-
-				#drawing a square around the detection area in original frame				
-				f=self.detect_rect_slice[0]
-				t=self.detect_rect_slice[1]
-				cv2.rectangle(orig_frame, (t.start-1,f.start-1),(t.stop+1,f.stop+1), (0, 255, 0), 1)
-				cv2.putText(orig_frame,f"FPS: {curr_fps}", (10, orig_frame.shape[0] - 10),	cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
+		if not self.detector.background.adaptive:
+			self.rebase_timer = threading.Timer(self.rebase_interval, self._rebase)
+			self.rebase_timer.daemon = True
+			self.rebase_timer.start()
+
+	def stream (self, camCtl = None):
+		''' runs detection until the video ends. triggers go to camCtl (anything with submit_task), by default a DSLR worker of its own '''
+		if camCtl is None:
+			with self.camera_control() as camCtl:
+				return self.stream(camCtl)
+		if self.preroll_seconds:
+			self.preroll = PrerollBuffer(self.frame_dim, self.source.fps, self.download_photo_folder, self.preroll_seconds, self.postroll_seconds, self.preroll_format)
+		self._detect_loop(camCtl)
 
+	def camera_control(self):
+		''' a DSLR worker of this detector's settings, not started yet. entering it starts the camera init in the worker process '''
+		return CameraControlManagerSubProcess('worker-1', target_folder = self.download_photo_folder, capture_target = self.capture_target, metrics = self.metrics,
+			download_chunk_kb = self.download_chunk_kb, event_log = self.event_log or None, transfer = self.transfer, transfer_idle_sec = self.transfer_idle_sec,
+			transfer_hours = self.transfer_hours, delete_after_transfer = self.delete_after_transfer)
 
-				self.currentFrames=(frame, thresh, frameDelta, orig_frame)
-				self._set_current_status(text,fc)
+	def _detect_loop(self, camCtl, on_frame = None):
+		''' Detection and trigger loop. It blocks on the frame source, so each captured frame is processed once, as soon as it arrives.
+			In realtime mode frame times are wall clock capture times and the web UI is fed. Otherwise (offline replay) frames are
+			read back to back, retrigger and rebase timing follow video time, and the preview is skipped.
+			on_frame(frame_time, detection) is called for every frame.
+		'''
+		live = self.video is None or self.realtime
+		if not live: # the rebase timer runs on wall time, replay rebases on video time
+			self.detector.rebase_interval = self.rebase_interval
+		# Init:
+		fc=0
+		ts = time.time()
+		curr_fps = self.source.fps
+		self.metrics.gauge('birdwatcher_detection_fps', 'frames processed by the detection loop in the last second', lambda: curr_fps)
+		timer = self.timer
+		startup = self.startup # until the first frame is processed
+		while True:
+			timer.start()
+			# blocks until the next frame is captured
+			item = self.source.read()
+			# if the frame could not be grabbed, then we have reached the end of the video
+			if item is None:
+				break
+			frame, frame_time = item
+			timer.lap('read')
+			fc+=1
+			if self.preroll:
+				self.preroll.push(frame) # before anything is drawn on it
+			timer.lap('preroll')
+			# saving original frame to show on video feed
+			orig_frame = frame
+			detection = self.detector.process(frame, frame_time, draw = live)
+			if startup:
+				startup.mark('first_detection')
+				startup = None
+			if self.log:
+				self.log.frame(frame_time, detection, self.detector.zones)
+			if detection.fired:
+				camCtl.submit_task(CameraControlMsg(CAPTURE_IMAGE, {'autofocus':self.autofocus_before_trigger, 'frames': self.burst_frames, 'trigger_time': frame_time})) # fire camera
+				if self.log:
+					self.log.trigger(frame_time, detection, self.detector.zones)
+				if self.preroll:
+					self.preroll.save(time.strftime("%Y%m%d-%H%M%S", time.localtime(frame_time)) + f'-{int(frame_time * 1000) % 1000:03d}_preroll')
+			if on_frame:
+				on_frame(frame_time, detection)
+			if detection.valid_cnts is None: # reference frame was just (re)taken
+				self._set_current_status(detection.text,fc)
+				continue
+			if not live:
+				continue
+			self.frame_latency.observe(time.time() - frame_time)
+			
+			#FPS calculation
+			
+			if time.time() - ts > 1:
+				curr_fps=fc
+				fc=1
+				ts=time.time()
+
+			#drawing a square around every detection zone in original frame
+			for i, (z, (f, t)) in enumerate(zip(self.detector.zones, self.detector.zone_rects)):
+				cv2.rectangle(orig_frame, (t.start-1,f.start-1),(t.stop+1,f.stop+1), (0, 255, 0), 1)
+				score = detection.scores[i] if i < len(detection.scores) else 0 # the zones may have just changed
+				cv2.putText(orig_frame, f'{z.name} {score:.2f}' if score else z.name, (t.start, max(f.start - 4, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1)
+			cv2.putText(orig_frame,f"FPS: {curr_fps} dropped: {self.source.dropped} dup: {self.source.duplicated}", (10, orig_frame.shape[0] - 10),	cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
+
+			frames = (detection.frame, detection.thresh, detection.frameDelta, orig_frame)
+			if self.source.zero_copy and self.frame_hub.viewers:
+				frames = tuple(f.copy() for f in frames) # camera buffers go back to the camera on the next read, the preview is encoded later
+			self.frame_hub.publish(frames)
+			self._set_current_status(detection.text,fc, flip = not detection.fired)
+			timer.lap('draw')
 					
 
 	def stream_original_frame(self):
-		while self.currentFrames:	
-			yield self._encode_frame()
+		return self.frame_hub.subscribe()
 
 
-	def stream_status(self):
-		while True:
-			# print ('waiting for status')
-			self.status_change_event.wait()
-			# print ('sending new status',self.currentStatus)
-			t=time.strftime("%y-%m-%d %H:%M:%S")
-			yield f"data: {t}:{self.currentStatus}\n\n"
-			self.status_change_event.clear()			
+	def stream_status(self, last_event_id = None):
+		''' server-sent events of status changes. a client reconnecting with Last-Event-ID resumes after that event '''
+		return self.status_bus.sse(last_event_id)
 
 
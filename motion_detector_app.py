@@ -1,45 +1,151 @@
-from imutils.video import VideoStream
 import argparse
-import datetime
-import imutils
+import os
 import time
-import cv2
-import collections
-from functools import reduce
-import gphoto2 as gp
-#from camera_control import CameraControlManagerSubProcess, CameraControlMsg, release_camera, CAPTURE_IMAGE, DOWNLOAD_IMAGE, DEFAULT_CAPTURE_TARGET, DEFAULT_DOWNLOAD_PHOTO_FOLDER
-import concurrent.futures
 import numpy as np 
-import yaml 
-from motion_detector import MotionDetector
+from motion_detector import MotionDetector, RUNTIME_SETTINGS, saved_settings
+from settings_store import SettingsStore
+from source_process import SourceProcess, parse_source
+from trigger_scheduler import TriggerScheduler
+from camera_control import CameraControlManagerSubProcess
+from startup import StartupReport
+from metrics import Metrics, render
+from replay import run_replay
+from event_log import activity_heatmap, triggers, parse_time
+from background import BACKGROUND_MODELS
+from detection import dump_zones, BLUR_TYPES, TRIGGER_MODES
 from defaults import *
 import threading
+import contextlib
 
-from flask import Flask, Response, request, render_template
+from flask import Flask, Response, request, render_template, jsonify, abort, send_from_directory
+from werkzeug.serving import make_server
 
 flask_app = Flask(__name__)
 
+def _source():
+	# the source a request is for (?source=name), the first one by default
+	name = request.args.get('source')
+	if name is None:
+		return next(iter(flask_app.sources.values()))
+	if name not in flask_app.sources:
+		abort(404, f'no such source {name}')
+	return flask_app.sources[name]
+
+@flask_app.route("/sources")
+def sources():
+	return jsonify({name: s.currentStatus for name, s in flask_app.sources.items()})
+
 @flask_app.route("/video_feed_frame")
 def video_feed_frame():
-	return Response( flask_app.md.stream_original_frame(), mimetype = "multipart/x-mixed-replace; boundary=frame")
+	return Response( _source().stream_original_frame(), mimetype = "multipart/x-mixed-replace; boundary=frame")
 
 @flask_app.route("/status_text")
 def status_text():
-	return Response( flask_app.md.stream_status(), mimetype = "text/event-stream")
+	# EventSource sends the id of the last event it got when it reconnects
+	last_event_id = request.headers.get('Last-Event-ID', type=int)
+	return Response( _source().stream_status(last_event_id), mimetype = "text/event-stream")
 
 @flask_app.route("/get_coord")
 def get_coord():
 	x = request.args.get('x', 0, type=int)
 	y = request.args.get('y', 0, type=int)
-	flask_app.md.set_detect_rect(y,x)
+	try:
+		_source().set_detect_rect(y,x, zone = request.args.get('zone'))
+	except ValueError as e:
+		return Response( str(e), status = 400, mimetype = "text/html")
 	
 	return Response( "ok", mimetype = "text/html")
 
+@flask_app.route("/zones")
+def zones():
+	return jsonify(dump_zones(_source().zones))
+
+@flask_app.route("/add_zone")
+def add_zone():
+	try:
+		_source().add_zone(request.args['name'], request.args.get('y', 0, type=int), request.args.get('x', 0, type=int),
+			side = request.args.get('side', type=int),
+			triggered_area_percent = request.args.get('triggered_area_percent', type=float),
+			frames_to_trigger = request.args.get('frames_to_trigger', type=int),
+			frames_required = request.args.get('frames_required', type=int),
+			retrigger_interval = request.args.get('retrigger_interval', type=float))
+	except (KeyError, ValueError) as e:
+		return Response( str(e), status = 400, mimetype = "text/html")
+	return jsonify(dump_zones(_source().zones))
+
+@flask_app.route("/remove_zone")
+def remove_zone():
+	try:
+		_source().remove_zone(request.args.get('name'))
+	except ValueError as e:
+		return Response( str(e), status = 400, mimetype = "text/html")
+	return jsonify(dump_zones(_source().zones))
+
+@flask_app.route("/settings")
+def settings():
+	# no arguments: the current runtime settings. otherwise sets the given ones, e.g. /settings?threshold=30&preview_fps=5
+	source = _source()
+	try:
+		values = {k: (v.lower() in ('1', 'true', 'yes', 'on') if RUNTIME_SETTINGS.get(k) is bool else RUNTIME_SETTINGS.get(k, str)(v)) for k, v in request.args.items() if k != 'source'}
+		if values:
+			source.set_settings(**values)
+	except ValueError as e:
+		return Response( str(e), status = 400, mimetype = "text/html")
+	return jsonify(source.current_settings())
+
+@flask_app.route("/metrics")
+def metrics():
+	if not flask_app.metrics.enabled:
+		return Response( "metrics are turned off (--no-metrics)", status = 404, mimetype = "text/html")
+	# detector processes report their own, labeled with their source
+	return Response( render(flask_app.metrics.snapshot(), *(p.metrics_snapshot() for p in flask_app.processes)), mimetype = "text/plain; version=0.0.4")
+
+@flask_app.route("/activity")
+def activity():
+	# share of every hour with motion over the last days, e.g. /activity?days=7&zone=feeder
+	source = _source()
+	if not source.event_log:
+		return Response( "the event log is turned off (--event-log '')", status = 404, mimetype = "text/html")
+	days, heatmap = activity_heatmap(source.event_log, request.args.get('days', 7, type=int), zone = request.args.get('zone') or None)
+	return jsonify({'days': [str(d) for d in days], 'hours': np.round(heatmap, 4).tolist()})
+
+@flask_app.route("/triggers")
+def trigger_list():
+	# triggers between two local times, optionally only between two hours of every day, e.g. /triggers?since=2026-10-01&hours=6,8
+	source = _source()
+	if not source.event_log:
+		return Response( "the event log is turned off (--event-log '')", status = 404, mimetype = "text/html")
+	try:
+		until = parse_time(request.args['until']) if request.args.get('until') else time.time()
+		since = parse_time(request.args['since']) if request.args.get('since') else until - 86400
+		hours = [int(h) for h in request.args['hours'].split(',')] if request.args.get('hours') else None
+		if hours is not None and len(hours) != 2:
+			raise ValueError('hours is FROM,TO')
+	except ValueError as e:
+		return Response( str(e), status = 400, mimetype = "text/html")
+	return jsonify(triggers(source.event_log, since, until, hours, source.download_log_folder))
+
+@flask_app.route("/previews")
+def previews():
+	# the DSLR's thumbnails of the latest photos, newest first, and whether the full size photo was transferred yet
+	folder = os.path.join(flask_app.download_folder, DEFAULT_PREVIEW_FOLDER)
+	if not os.path.isdir(folder):
+		return jsonify([])
+	latest = sorted((e for e in os.scandir(folder) if e.name.endswith('.jpg')), key = lambda e: e.stat().st_mtime, reverse = True)
+	latest = latest[:request.args.get('count', DEFAULT_UI_PREVIEWS, type=int)]
+	transferred = {os.path.splitext(name)[0] for name in os.listdir(flask_app.download_folder)}
+	return jsonify([{'preview': e.name, 'transferred': os.path.splitext(e.name)[0] in transferred} for e in latest])
+
+@flask_app.route("/previews/<name>")
+def preview_file(name):
+	# flask resolves relative folders against the app's, not the working directory
+	return send_from_directory(os.path.abspath(os.path.join(flask_app.download_folder, DEFAULT_PREVIEW_FOLDER)), name)
+
 
 @flask_app.route("/")
 def index(): 
 	# return the rendered template
-	return render_template("index.html",status_text=flask_app.md.currentStatus)
+	return render_template("index.html",status_text=_source().currentStatus, sources=list(flask_app.sources))
 
 import socket
 def get_outbound_ip():
@@ -47,35 +153,145 @@ def get_outbound_ip():
 	s.connect(("8.8.8.8", 80))
 	return s.getsockname()[0]
 
+def serve(port, server, startup):
+	ip = get_outbound_ip()
+	if server == 'async':
+		from async_server import serve as serve_async # tornado is only needed for this mode
+		serve_async(flask_app, flask_app.sources, ip, port, on_listen = lambda: startup.mark('web'))
+	else:
+		print ("running flask")
+		web = make_server(ip, port, flask_app, threaded=True)
+		startup.mark('web')
+		web.serve_forever()
+
+def run_sources(sources, args, explicit, settings_store, dslr_ports, global_retrigger_interval, port, server, startup):
+	''' one detector process per source. the DSLRs are shared through a trigger scheduler in this process '''
+	metrics = Metrics(args['metrics'])
+	startup.attach(metrics)
+	# new sources start with the zones of the main conf file
+	initial_conf = {k: v for k, v in settings_store.data.items() if k in ('zones', 'coordinates')}
+	procs = [SourceProcess(name, src, args, initial_conf, explicit).start() for name, src in sources]
+	with contextlib.ExitStack() as stack:
+		stack.callback(settings_store.close)
+		for p in procs:
+			stack.callback(p.stop)
+		cameras = [stack.enter_context(CameraControlManagerSubProcess(f'worker-{i + 1}', target_folder = args['download_photo_folder'],
+			capture_target = args['capture_target'], metrics = metrics, download_chunk_kb = args['download_chunk_kb'], port = dslr_port,
+			event_log = args['event_log'] or None, transfer = args['transfer'], transfer_idle_sec = args['transfer_idle_sec'],
+			transfer_hours = args['transfer_hours'], delete_after_transfer = args['delete_after_transfer']))
+			for i, dslr_port in enumerate(dslr_ports)]
+		scheduler = TriggerScheduler(cameras, [p.name for p in procs], global_retrigger_interval, metrics)
+		# the sources opened their cameras in parallel, wait for all of them
+		for p in procs:
+			p.wait_ready(scheduler)
+		startup.mark('sources')
+		flask_app.sources = {p.name: p for p in procs}
+		flask_app.processes = procs
+		flask_app.metrics = metrics
+		flask_app.download_folder = args['download_photo_folder']
+		serve(port, server, startup)
+
 if __name__ == "__main__":
+	startup = StartupReport(required = ('web',))
+	startup.mark('imports')
 	ap = argparse.ArgumentParser(
 		   formatter_class=lambda prog: argparse.ArgumentDefaultsHelpFormatter(
                     prog, max_help_position=80, width=150))
 		
 
 	ap.add_argument("-v", "--video", default=None, help="path to the video file. leave empty for live feed")
-	ap.add_argument("-x", "--capture-center-x", type=int, default=None, help="x coordinate - center of capture square")
-	ap.add_argument("-y", "--capture-center-y", type=int, default=None, help="y coordinate - center of capture square")
+	ap.add_argument("--sources", nargs='+', default=None, help="several sources, each detected in its own process: NAME=SRC, SRC a webcam number or a video file. e.g. feeder=0 nest=1")
+	ap.add_argument("--dslr", nargs='+', default=None, help="with --sources: gphoto2 ports of the DSLRs to share between the sources (see gphoto2 --auto-detect). default is the first camera found")
+	ap.add_argument("--global-retrigger-interval", type=float, default=DEFAULT_GLOBAL_RETRIGGER_INTERVAL_SEC, help="with --sources: min seconds between two shots of the same DSLR, whichever source triggered")
+	ap.add_argument("-x", "--capture-center-x", type=int, default=None, help="x coordinate - center of capture square (first detection zone)")
+	ap.add_argument("-y", "--capture-center-y", type=int, default=None, help="y coordinate - center of capture square (first detection zone)")
 	ap.add_argument("--triggered-area-percent", type=float, default=DEFAULT_TRIGGERED_AREA_PERCENT, help="minimum percentage of captured square to trigger motion detection")
 	ap.add_argument("--capture-square-side", type=int, default=DEFAULT_CAPTURE_RECT_SIDE, help="side length of the capture square (area will be side*side)")
 	ap.add_argument("--frames-to-trigger", type=int, default=DEFAULT_FRAMES_TO_TRIGGER, help="Number of frames motion is detected in before camera capture is triggered")
+	ap.add_argument("--frames-required", type=int, default=DEFAULT_FRAMES_REQUIRED, help="trigger when motion is seen in this many of the last frames-to-trigger frames. default is all of them")
+	ap.add_argument("--threshold", type=int, default=DEFAULT_DIFF_THRESHOLD, help="min gray level difference from the reference frame for a pixel to count as moving")
+	ap.add_argument("--blur-kernel", type=int, default=DEFAULT_BLUR_KERNEL, help="side of the blur kernel applied before comparing frames, at full resolution (odd)")
+	ap.add_argument("--blur-type", choices=BLUR_TYPES, default=DEFAULT_BLUR_TYPE, help="box blur is cheaper than gaussian, and its cost doesn't grow with the kernel")
+	ap.add_argument("--detection-scale", type=float, default=DEFAULT_DETECTION_SCALE, help="detect on the zones downscaled by this factor (e.g. 0.5). boxes are still drawn at full resolution")
+	ap.add_argument("--background-model", choices=BACKGROUND_MODELS, default=DEFAULT_BACKGROUND_MODEL, help="what frames are compared against. static is the first frame, rebased every rebase interval")
+	ap.add_argument("--background-alpha", type=float, default=DEFAULT_BACKGROUND_ALPHA, help="per frame learning rate of the adaptive background models")
+	ap.add_argument("--background-max-freeze", type=float, default=DEFAULT_BACKGROUND_MAX_FREEZE_SEC, help="seconds adaptive background models may stop learning where motion is present")
+	ap.add_argument("--trigger-mode", choices=TRIGGER_MODES, default=DEFAULT_TRIGGER_MODE, help="window fires once motion filled the trigger window, then every retrigger interval. peak fires at the frames with the best motion score (area, centrality, stillness)")
+	ap.add_argument("--shots-per-minute", type=float, default=DEFAULT_SHOTS_PER_MINUTE, help="max DSLR shots per minute, all zones together. 0 is no limit. with peak, the score a shot needs rises as the budget is used up")
+	ap.add_argument("--min-trigger-score", type=float, default=DEFAULT_MIN_TRIGGER_SCORE, help="with --trigger-mode peak: min motion score (0-1) of a shot")
 	ap.add_argument("--retrigger-interval", type=int, default=DEFFAULT_RETRIGGER_INTERVAL_SEC, help="Seconds to trigger another capture if detection is continous")
 	ap.add_argument("--capture-target", type=int, default=DEFAULT_CAPTURE_TARGET, help="Location of photos saved on camera. 0=internal memory (faster), 1=SD Card")
+	ap.add_argument("--target-fps", type=int, default=DEFAULT_TARGET_FPS, help="frame rate requested from the webcam")
+	ap.add_argument("--camera-backend", choices=('opencv', 'v4l2', 'picamera2'), default=DEFAULT_CAMERA_BACKEND, help="how the live feed is captured. picamera2 needs the picamera2 package (Raspberry Pi camera)")
+	ap.add_argument("--zero-copy", action="store_true", help="with picamera2: detect directly on the camera buffers instead of copying each frame")
+	ap.add_argument("--gray-capture", action="store_true", help="capture grayscale: the Y plane of the camera's YUV output with v4l2 and picamera2. the preview is gray too")
 	ap.add_argument("--frame-resize", type=int, default=DEFAULT_FRAME_RESIZE, help="resize live feed camera. None is not to resize")
 	ap.add_argument("--download-photo-folder", type=str, default=DEFAULT_DOWNLOAD_PHOTO_FOLDER, help="Location of downloaded photos from camera")
 	ap.add_argument("--autofocus-before-trigger",default=DEFAULT_AUTOFOCUS_BEFORE_TRIGGER, action="store_false", help="trigger camera's autofocus before capturign an image")
+	ap.add_argument("--burst-frames", type=int, default=DEFAULT_BURST_FRAMES, help="DSLR frames shot back to back on every trigger. they are transferred after the burst")
+	ap.add_argument("--download-chunk-kb", type=int, default=DEFAULT_DOWNLOAD_CHUNK_KB, help="photos are transferred from the camera in chunks of this size between captures")
+	ap.add_argument("--transfer", choices=('immediate', 'preview-first'), default=DEFAULT_TRANSFER, help="preview-first saves the DSLR's thumbnail of each photo right away (for the web UI) and transfers the full size file later: when the camera is idle or in transfer hours")
+	ap.add_argument("--transfer-idle-sec", type=float, default=DEFAULT_TRANSFER_IDLE_SEC, help="with preview-first: full size transfers start after this many seconds without a capture. 0 only transfers in transfer hours")
+	ap.add_argument("--transfer-hours", type=int, nargs=2, metavar=('FROM', 'TO'), default=None, help="with preview-first: also transfer full size photos between these local hours, e.g. 22 6")
+	ap.add_argument("--delete-after-transfer", action="store_true", help="delete each photo from the camera once its transferred copy has the size the camera reported")
+	ap.add_argument("--preroll-seconds", type=float, default=DEFAULT_PREROLL_SEC, help="seconds of webcam frames before each trigger to save in the download folder. 0 disables it")
+	ap.add_argument("--postroll-seconds", type=float, default=DEFAULT_POSTROLL_SEC, help="seconds of webcam frames after each trigger to add to the pre-trigger clip")
+	ap.add_argument("--preroll-format", choices=('jpg', 'avi'), default=DEFAULT_PREROLL_FORMAT, help="save the pre-trigger clip as a JPEG burst or an MJPG video")
+	ap.add_argument("--event-log", type=str, default=DEFAULT_EVENT_LOG_FOLDER, help="folder of the activity, trigger and download log (see event_log.py). empty disables it")
 	ap.add_argument("--ui-port",type=int, default=DEFAULT_UI_PORT, help="UI web server listening port")
+	ap.add_argument("--server", choices=('flask', 'async'), default=DEFAULT_UI_SERVER, help="web server. async serves the preview and status streams from one event loop (needs tornado) instead of a thread per viewer")
+	ap.add_argument("--preview-fps",type=int, default=DEFAULT_PREVIEW_FPS, help="max frames per second encoded for the web UI preview (shared by all viewers)")
+	ap.add_argument("--preview-jpeg-quality",type=int, default=DEFAULT_PREVIEW_JPEG_QUALITY, help="JPEG quality (0-100) of the web UI preview")
+	ap.add_argument("--no-metrics", dest="metrics", action="store_false", help="turn off the per-stage latency histograms served on /metrics")
+	ap.add_argument("--replay-report", type=str, default=None, help="with --video: replay the file headless, as fast as possible, with no DSLR or UI, and write a JSON report to this path")
+	ap.add_argument("--decode-thread", action="store_true", help="with --replay-report: decode the video on a separate thread")
 	
 
+	# settings changed at runtime from the web UI were saved in the conf file. they replace the defaults, explicit arguments still win
+	settings_store = SettingsStore(CONF_FILE)
+	ap.set_defaults(**saved_settings(settings_store))
 	args = vars(ap.parse_args())
 	print (args)
+	explicit = {k for k, v in args.items() if v != ap.get_default(k)}
 	port = args.pop('ui_port')
-	# loop over the frames of the video
-	with MotionDetector(**args) as md:
-		flask_app.md = md
-		thread = threading.Thread(target = md.stream, args = (), daemon=True)
-		thread.start()
-		print ("running flask")
-		ip = get_outbound_ip()
-		flask_app.run(host=ip, port=port, debug=False, threaded=True, use_reloader=False)
+	server = args.pop('server')
+	source_specs = args.pop('sources')
+	dslr_ports = args.pop('dslr') or [None]
+	global_retrigger_interval = args.pop('global_retrigger_interval')
+	replay_report = args.pop('replay_report')
+	if args['transfer'] == 'preview-first':
+		if args['capture_target'] == 0:
+			ap.error('--transfer preview-first needs --capture-target 1: photos in the camera\'s RAM can\'t wait to be transferred')
+		if not args['transfer_idle_sec'] and not args['transfer_hours']:
+			ap.error('--transfer preview-first needs --transfer-idle-sec or --transfer-hours, or the full size photos are never transferred')
+	if source_specs:
+		if args.pop('video') or replay_report:
+			ap.error('--sources replaces --video and --replay-report')
+		startup.required.add('sources')
+		run_sources([parse_source(s) for s in source_specs], args, explicit, settings_store, dslr_ports, global_retrigger_interval, port, server, startup)
+		exit(0)
+	if replay_report:
+		if args['video'] is None:
+			ap.error('--replay-report requires --video')
+		# an offline experiment: the zones and settings it runs with stay in memory, the conf file is left as it is
+		settings_store.close()
+		with MotionDetector(**args, settings = SettingsStore(CONF_FILE, write_delay = None), realtime = False) as md:
+			run_replay(md, replay_report)
+		exit(0)
+	startup.required.add('first_detection')
+	md = MotionDetector(**args, settings = settings_store, startup = startup)
+	startup.attach(md.metrics)
+	# the DSLR worker process is started first, so the DSLR initializes while the webcam opens
+	with md.camera_control() as camCtl:
+		startup.mark('dslr_worker')
+		threading.Thread(target = lambda: camCtl.wait_ready() and startup.mark('dslr'), name = 'dslr-ready', daemon = True).start()
+		with md:
+			flask_app.sources = {DEFAULT_SOURCE_NAME: md}
+			flask_app.processes = []
+			flask_app.metrics = md.metrics
+			flask_app.download_folder = md.download_photo_folder
+			# loop over the frames of the video
+			thread = threading.Thread(target = md.stream, args = (camCtl,), daemon=True)
+			thread.start()
+			serve(port, server, startup)
 		
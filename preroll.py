@@ -0,0 +1,90 @@
+import os
+import queue
+import threading
+import cv2
+import numpy as np
+from defaults import *
+
+class PrerollBuffer:
+	''' Keeps the last seconds of full-resolution frames in a fixed, preallocated ring so the moments before a trigger can be saved.
+		push() only copies the frame into the next slot: no allocation and no waiting on the writer.
+		save() queues a clip of preroll_sec before the trigger plus postroll_sec after it. A writer thread encodes it as a JPEG burst
+		or an MJPG clip while the ring keeps filling. The ring holds slack_sec more than a clip, which is how long the writer may
+		lag behind. Frames overwritten before they were written are skipped and counted in self.skipped_frames.
+	'''
+	def __init__(self, frame_shape, fps, folder, preroll_sec = DEFAULT_PREROLL_SEC, postroll_sec = DEFAULT_POSTROLL_SEC,
+				file_format = DEFAULT_PREROLL_FORMAT, slack_sec = DEFAULT_PREROLL_SLACK_SEC):
+		self.fps = fps
+		self.folder = folder
+		os.makedirs(folder, exist_ok = True)
+		self.file_format = file_format
+		self.preroll_frames = int(preroll_sec * fps)
+		self.postroll_frames = int(postroll_sec * fps)
+		self.capacity = self.preroll_frames + self.postroll_frames + int(slack_sec * fps)
+		self.frames = np.empty((self.capacity,) + tuple(frame_shape), np.uint8)
+		self.seq = 0 # number of frames pushed so far. frame s lives in slot s % capacity until frame s + capacity is pushed
+		self.skipped_frames = 0
+		self.new_frame = threading.Condition()
+		self.requests = queue.Queue()
+		self.writer = threading.Thread(target = self._write_loop, name = 'preroll-writer', daemon = True)
+		self.writer.start()
+		print (f'pre-trigger buffer: {self.capacity} frames, {self.frames.nbytes / 2**20:.0f} MB')
+
+	def push(self, frame):
+		np.copyto(self.frames[self.seq % self.capacity], frame)
+		with self.new_frame:
+			self.seq += 1
+			self.new_frame.notify()
+
+	def save(self, name):
+		''' queue a clip around the most recently pushed frame, written to folder/name.avi or folder/name/*.jpg. returns immediately '''
+		last = self.seq - 1
+		self.requests.put((name, max(last - self.preroll_frames, self.seq - self.capacity, 0), last + self.postroll_frames))
+
+	def close(self):
+		self.requests.put(None)
+		self.writer.join(timeout = 5)
+
+	def _available(self, s):
+		# frame s was pushed and its slot is not being overwritten
+		return s < self.seq < s + self.capacity
+
+	def _write_loop(self):
+		while True:
+			request = self.requests.get()
+			if request is None:
+				break
+			name, first, last = request
+			path = os.path.join(self.folder, name)
+			writer = None
+			written = 0
+			for s in range(first, last + 1):
+				with self.new_frame:
+					while self.seq <= s: # wait for the post-roll to be captured
+						if not self.new_frame.wait(timeout = 2):
+							break
+				if not self._available(s):
+					self.skipped_frames += 1
+					continue
+				frame = self.frames[s % self.capacity]
+				if self.file_format == 'avi':
+					if writer is None:
+						writer = cv2.VideoWriter(path + '.avi', cv2.VideoWriter_fourcc(*'MJPG'), self.fps, (frame.shape[1], frame.shape[0]), isColor = frame.ndim == 3)
+					snapshot = frame.copy()
+					if self._available(s): # the slot may have been overwritten while it was copied
+						writer.write(snapshot)
+						written += 1
+					else:
+						self.skipped_frames += 1
+				else:
+					ok, jpeg = cv2.imencode('.jpg', frame)
+					if self._available(s):
+						os.makedirs(path, exist_ok = True)
+						with open(os.path.join(path, f'{s - first:04d}.jpg'), 'wb') as f:
+							f.write(jpeg.tobytes())
+						written += 1
+					else:
+						self.skipped_frames += 1
+			if writer is not None:
+				writer.release()
+			print (f'pre-trigger clip {path}: {written} frames')
@@ -0,0 +1,67 @@
+import json
+import time
+from camera_control import CAPTURE_IMAGE
+from detection import dump_zones
+
+class ReplayCameraControl:
+	''' Stands in for CameraControlManagerSubProcess during offline replay: no DSLR, no worker process.
+		Submitted tasks are only recorded, so the detector's trigger logic runs unchanged.
+	'''
+	def __init__(self):
+		self.tasks = []
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, type, value, traceback):
+		pass
+
+	def submit_task(self, msg):
+		self.tasks.append(msg)
+
+	def empty(self):
+		return True
+
+
+def run_replay(md, report_file):
+	''' Runs a video file through md's detection and trigger logic as fast as it can be decoded, with a stubbed camera.
+		md must be opened with realtime = False, so frame times are video time.
+		Writes a JSON report with the run summary (including frames/sec processed), every trigger with the motion score of the frame
+		it was for, and per-frame contour counts of each zone.
+	'''
+	if md.rebase_timer: # rebasing follows video time during replay
+		md.rebase_timer.cancel()
+	video_fps = md.source.fps
+	zones = [z.name for z in md.zones]
+	frames = []
+	triggers = []
+
+	def on_frame(frame_time, detection):
+		for (zone, kind), score in zip(detection.fired, detection.fired_scores):
+			triggers.append({'frame': len(frames), 'time_sec': round(frame_time, 3), 'type': kind, 'zone': zone, 'score': score})
+		frames.append(detection.valid_cnts)
+
+	camCtl = ReplayCameraControl()
+	start = time.time()
+	md._detect_loop(camCtl, on_frame = on_frame)
+	elapsed = time.time() - start
+
+	summary = {
+		'video': md.video,
+		'video_fps': video_fps,
+		'frames': len(frames),
+		'video_duration_sec': round(len(frames) / video_fps, 3),
+		'elapsed_sec': round(elapsed, 3),
+		'frames_per_sec': round(len(frames) / elapsed, 1) if elapsed else None,
+		'triggers': len(triggers),
+		'captures_submitted': sum(1 for t in camCtl.tasks if t.cmd == CAPTURE_IMAGE),
+		'mean_trigger_score': round(sum(t['score'] for t in triggers) / len(triggers), 3) if triggers else None,
+		'params': dict({k: getattr(md, k) for k in ('frame_resize', 'rebase_interval', 'threshold', 'blur_kernel', 'background_model',
+			'trigger_mode', 'shots_per_minute', 'min_trigger_score')}, zones = dump_zones(md.zones)),
+	}
+	# per zone contour count of every frame, None for frames where the reference was (re)taken
+	contours = {zone: [None if c is None else int(c[i]) for c in frames] for i, zone in enumerate(zones)}
+	with open(report_file, 'w') as f:
+		json.dump({'summary': summary, 'triggers': triggers, 'contours_per_frame': contours}, f)
+	print ('replay done:', summary)
+	return summary
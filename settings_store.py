@@ -0,0 +1,108 @@
+import os
+import copy
+import threading
+import yaml
+from defaults import *
+
+class SettingsStore:
+	''' The conf file, held in memory. set() and remove() only change the in-memory copy and return immediately.
+		A writer thread persists the latest state write_delay seconds after the first change, so bursts of changes
+		(clicks in the web UI, zone edits) become one write, and nothing is written when the content ends up unchanged.
+		Writes go to a temporary file that is fsynced and atomically renamed over the conf file, so a power cut leaves
+		either the old or the new file, never a torn one.
+		A missing file starts out as a copy of initial and is written right away.
+		write_delay None keeps every change in memory and never writes the file, e.g. for an offline replay.
+	'''
+	def __init__(self, path = CONF_FILE, write_delay = DEFAULT_SETTINGS_WRITE_DELAY_SEC, initial = None):
+		self.path = path
+		self.write_delay = write_delay
+		missing = initial is not None and not os.path.exists(path)
+		if missing:
+			self.saved = ''
+			self.data = copy.deepcopy(initial)
+		else:
+			with open(path) as f:
+				self.saved = f.read()
+			self.data = yaml.safe_load(self.saved) or {}
+		self.lock = threading.Lock()
+		self.write_lock = threading.Lock() # flush() runs on the writer thread and on close()
+		self.changed = threading.Condition(self.lock)
+		self.dirty = missing
+		self.closed = False
+		self.writes = 0
+		self.writer = None
+		if write_delay is not None:
+			self.writer = threading.Thread(target = self._write_loop, name = 'settings-writer', daemon = True)
+			self.writer.start()
+
+	def get(self, key, default = None):
+		with self.lock:
+			return copy.deepcopy(self.data.get(key, default))
+
+	def set(self, key, value):
+		with self.lock:
+			if self.data.get(key) == value:
+				return
+			self.data[key] = copy.deepcopy(value)
+			self._mark_dirty()
+
+	def remove(self, key):
+		with self.lock:
+			if key in self.data:
+				del self.data[key]
+				self._mark_dirty()
+
+	def _mark_dirty(self):
+		self.dirty = True
+		self.changed.notify()
+
+	def flush(self):
+		''' writes pending changes now '''
+		if self.writer is None:
+			return
+		with self.write_lock:
+			with self.lock:
+				if not self.dirty:
+					return
+				self.dirty = False
+				text = yaml.safe_dump(self.data)
+			self._write(text)
+
+	def close(self):
+		with self.lock:
+			self.closed = True
+			self.changed.notify()
+		if self.writer:
+			self.writer.join(timeout = 5)
+		self.flush()
+
+	def _write_loop(self):
+		while True:
+			with self.lock:
+				while not self.dirty and not self.closed:
+					self.changed.wait()
+				if self.closed:
+					return
+				# let more changes pile up before writing
+				self.changed.wait_for(lambda: self.closed, timeout = self.write_delay)
+				if self.closed:
+					return
+			self.flush()
+
+	def _write(self, text):
+		if text == self.saved:
+			return
+		tmp = self.path + '.tmp'
+		with open(tmp, 'w') as f:
+			f.write(text)
+			f.flush()
+			os.fsync(f.fileno())
+		os.replace(tmp, self.path)
+		# make the rename itself durable
+		dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+		try:
+			os.fsync(dir_fd)
+		finally:
+			os.close(dir_fd)
+		self.saved = text
+		self.writes += 1
@@ -0,0 +1,153 @@
+''' Preview frames of a detector running in another process, passed through shared memory instead of being pickled over a pipe.
+	The detector process composes its preview into one of two slots of a memory mapped file (in /dev/shm when there is one),
+	the web server maps the same file and JPEG encodes from it. Each slot has a sequence number that is odd while the slot is
+	being written (a seqlock) and the generation it holds: the writer never waits for readers, and a reader that raced the writer
+	copies again.
+	Python has no memory barriers, so on a weakly ordered CPU (the Pi's ARM cores) the reader may see the writer's stores out of
+	order, e.g. a new generation before the frame. The reader therefore only accepts a copy if, re-read after the copy, the slot's
+	sequence number is still the same even number, the slot still holds the generation it was read for, and the writer has not
+	moved on to that slot again. That rejects odd (being written) and torn slots, it can't rule out every stale pixel: the cost
+	of a miss is one glitched preview frame.
+	A plain mmap'd file rather than multiprocessing.shared_memory, which is Python 3.8+: the repo runs on 3.7, the Pi's Python.
+'''
+import mmap
+import os
+import tempfile
+import time
+import numpy as np
+from frame_hub import FrameHub, compose_preview, preview_shape
+from defaults import *
+
+# header: int64 generation, sequence number of slot 0 and 1, composite width in slot 0 and 1, viewer count, generation in slot 0 and 1
+GENERATION, SEQ, WIDTH, VIEWERS, SLOT_GENERATION = 0, 1, 3, 5, 6
+HEADER_BYTES = 64
+
+def shm_folder():
+	''' where files that are only mapped are created: in memory when there is /dev/shm '''
+	return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+def preview_path(name):
+	return os.path.join(shm_folder(), f'birdwatcher-{os.getpid()}-{name}')
+
+class SharedPreview:
+	''' double buffered preview composite of a detector. the detector process creates it for its frame shape, the web server opens
+		it by path. slots are sized for the widest possible composite, with a detection area as wide as the frame, so zone
+		changes never resize the file
+	'''
+	def __init__(self, path, frame_shape, create = False, preview_fps = DEFAULT_PREVIEW_FPS, jpeg_quality = DEFAULT_PREVIEW_JPEG_QUALITY):
+		self.path = path
+		self.preview_fps = preview_fps
+		self.jpeg_quality = jpeg_quality # encoding happens in the web server. kept so set_settings works the same on both sides
+		h, w = frame_shape[:2]
+		self.slot_shape = (h, 2 * w + 20, 3)
+		slot_bytes = int(np.prod(self.slot_shape))
+		size = HEADER_BYTES + 2 * slot_bytes
+		fd = os.open(path, os.O_RDWR | (os.O_CREAT | os.O_TRUNC if create else 0), 0o600)
+		try:
+			if create:
+				os.ftruncate(fd, size)
+			self.mm = mmap.mmap(fd, size)
+		finally:
+			os.close(fd)
+		self.header = np.ndarray(8, np.int64, buffer = self.mm)
+		self.slots = [np.ndarray(self.slot_shape, np.uint8, buffer = self.mm, offset = HEADER_BYTES + i * slot_bytes) for i in (0, 1)]
+		self.next_time = 0
+
+	@property
+	def viewers(self):
+		return int(self.header[VIEWERS])
+
+	@viewers.setter
+	def viewers(self, n):
+		self.header[VIEWERS] = n
+
+	@property
+	def generation(self):
+		return int(self.header[GENERATION])
+
+	def publish(self, frames):
+		''' called by the detector for every frame, in place of FrameHub.publish. composes only while somebody watches, at most preview_fps times a second '''
+		if not self.viewers:
+			return
+		now = time.monotonic()
+		if now < self.next_time:
+			return
+		self.next_time = now + 1 / self.preview_fps if self.preview_fps else 0
+		slot = (self.generation + 1) % 2 # readers are on the other one
+		width = preview_shape(frames)[1]
+		self.header[SEQ + slot] += 1
+		compose_preview(frames, self.slots[slot][:, :width])
+		self.header[WIDTH + slot] = width
+		self.header[SLOT_GENERATION + slot] = self.generation + 1
+		self.header[SEQ + slot] += 1
+		self.header[GENERATION] += 1
+
+	def read(self):
+		''' (generation, copy of the newest composite). (0, None) before the first one '''
+		while True:
+			generation = self.generation
+			if not generation:
+				return 0, None
+			slot = generation % 2
+			seq = int(self.header[SEQ + slot])
+			if seq % 2 == 0 and self.header[SLOT_GENERATION + slot] == generation:
+				vis = self.slots[slot][:, :int(self.header[WIDTH + slot])].copy()
+				# everything the copy depends on, re-read after it (see the module docstring)
+				if self.header[SEQ + slot] == seq and self.header[SLOT_GENERATION + slot] == generation and self.generation - generation < 2:
+					return generation, vis
+			time.sleep(0.001) # being written, torn, or the writer got around to this slot again
+
+	def close(self):
+		self.header = self.slots = None
+		try:
+			self.mm.close()
+		except BufferError: # a reader still holds a view, the mapping goes with the process
+			pass
+		try:
+			os.unlink(self.path)
+		except FileNotFoundError: # the other side was first
+			pass
+
+
+class SharedFrameHub(FrameHub):
+	''' FrameHub of the web server for a detector in another process. Instead of being handed frames, the encoder thread
+		picks up new generations of the shared preview at preview_fps. The viewer count lives in the shared header,
+		so the detector only composes previews while somebody watches.
+	'''
+	def __init__(self, preview, preview_fps = DEFAULT_PREVIEW_FPS, jpeg_quality = DEFAULT_PREVIEW_JPEG_QUALITY, metrics = None):
+		self.preview = preview
+		FrameHub.__init__(self, preview_fps, jpeg_quality, metrics)
+
+	@property
+	def viewers(self):
+		return self.preview.viewers if self.preview.header is not None else 0
+
+	@viewers.setter
+	def viewers(self, n):
+		if self.preview.header is not None:
+			self.preview.viewers = n
+
+	def publish(self, frames):
+		''' does nothing: frames of a detector process arrive through the shared preview, which the encoder thread reads '''
+
+	def _encode_loop(self):
+		last = 0
+		while True:
+			with self._lock:
+				while not self._closed and self.viewers == 0:
+					self._new_frame.wait()
+				if self._closed:
+					return
+			next_time = time.monotonic() + (1 / self.preview_fps if self.preview_fps else 0.01)
+			if self.preview.generation != last:
+				last, vis = self.preview.read()
+				with self.encode_time.time():
+					jpeg = self._to_jpeg(vis)
+				self._set_jpeg(jpeg)
+			delay = next_time - time.monotonic()
+			if delay > 0:
+				time.sleep(delay)
+
+	def close(self):
+		FrameHub.close(self)
+		self.preview.close()
@@ -0,0 +1,197 @@
+''' Several video sources on one host, each detected in a process of its own so detection spreads over the cores.
+	The web server talks to every detector process through a SourceProcess, which the routes use like a MotionDetector:
+	- previews come back through shared memory (shared_preview.py), they are never pickled
+	- status changes and captures come up an event pipe. captures go to the TriggerScheduler, which owns the DSLRs
+	- web UI calls (zones, settings) go down a control pipe and are answered with the result or the error
+'''
+import os
+import sys
+import threading
+import traceback
+from functools import reduce
+from multiprocessing import Pipe, Process
+from motion_detector import MotionDetector, saved_settings
+from settings_store import SettingsStore
+from shared_preview import SharedPreview, SharedFrameHub, preview_path
+from status_bus import StatusBus
+from defaults import *
+
+def parse_source(spec):
+	''' (name, src) of NAME=SRC, or of just SRC. SRC is a webcam number or a video file '''
+	name, sep, src = spec.partition('=')
+	if not sep:
+		name, src = os.path.splitext(os.path.basename(spec))[0], spec
+	return name, int(src) if src.isdigit() else src
+
+def source_conf_file(name):
+	return os.path.join(os.path.dirname(CONF_FILE), f'{name}.yaml')
+
+
+class TriggerLink:
+	''' the detector process end of the trigger scheduler: captures go up the event pipe '''
+	def __init__(self, events, send_lock):
+		self.events = events
+		self.send_lock = send_lock
+
+	def submit_task(self, msg):
+		with self.send_lock:
+			self.events.send(('capture', msg))
+
+
+class SourceProcess:
+	''' One video source with its MotionDetector running in a child process.
+		Each source keeps its zones and runtime settings in a conf file of its own (conf/<name>.yaml), started from the zones of
+		the main conf file. Runtime settings saved there replace the arguments shared by all sources, except the ones given explicitly.
+	'''
+	def __init__(self, name, src, args, initial_conf = None, explicit = ()):
+		self.name = name
+		self.src = src
+		self.args = args # MotionDetector arguments shared by all sources
+		self.initial_conf = initial_conf or {}
+		self.explicit = set(explicit)
+		# every source logs its detections in a sub folder of its own, the shared DSLRs log their downloads in the parent folder
+		self.event_log = os.path.join(args['event_log'], name) if args.get('event_log') else ''
+		self.download_log_folder = args.get('event_log')
+		self.status_bus = StatusBus(status = 'starting')
+		self.frame_hub = None
+		self.lock = threading.Lock() # one web UI call at a time on the control pipe
+		self.control, self.child_control = Pipe()
+		self.events, self.child_events = Pipe(duplex = False)
+
+	def start(self):
+		self.process = Process(target = self._run, name = f'detector-{self.name}', daemon = True)
+		self.process.start()
+		# the child's ends, so a dead child reads as EOF here
+		self.child_control.close()
+		self.child_events.close()
+		return self
+
+	def wait_ready(self, scheduler):
+		''' blocks until the detector read its first frame. captures of this source go to scheduler from then on '''
+		try:
+			kind, (path, frame_dim, settings) = self.events.recv()
+		except EOFError:
+			raise RuntimeError(f'source {self.name} failed to start')
+		preview = SharedPreview(path, frame_dim)
+		os.unlink(path) # both processes have it mapped, nothing is left behind however they exit
+		self.frame_hub = SharedFrameHub(preview, settings['preview_fps'], settings['preview_jpeg_quality'])
+		self.thread = threading.Thread(target = self._event_loop, args = (scheduler,), name = f'events-{self.name}', daemon = True)
+		self.thread.start()
+
+	def _event_loop(self, scheduler):
+		while True:
+			try:
+				kind, value = self.events.recv()
+			except (EOFError, OSError):
+				break
+			if kind == 'status':
+				self.status_bus.publish(value)
+			elif kind == 'capture':
+				scheduler.submit_task(value, self.name)
+		self.status_bus.publish('detector process exited')
+
+	def _call(self, method, *args, **kwargs):
+		with self.lock:
+			try:
+				self.control.send((method, args, kwargs))
+				ok, result = self.control.recv()
+			except (EOFError, OSError):
+				raise ValueError(f'source {self.name} is not running')
+		if not ok:
+			raise result
+		return result
+
+	def stop(self):
+		try:
+			self._call('stop')
+		except ValueError: # already gone
+			pass
+		self.process.join(timeout = 5)
+		if self.process.is_alive():
+			self.process.terminate()
+		if self.frame_hub:
+			self.frame_hub.close()
+
+	# the MotionDetector interface used by the web UI
+	@property
+	def currentStatus(self):
+		return self.status_bus.current
+
+	@property
+	def zones(self):
+		return self._call('zones')
+
+	def set_detect_rect(self, x = None, y = None, zone = None):
+		return self._call('set_detect_rect', x, y, zone)
+
+	def add_zone(self, name, x, y, **settings):
+		return self._call('add_zone', name, x, y, **settings)
+
+	def remove_zone(self, name):
+		return self._call('remove_zone', name)
+
+	def set_settings(self, **values):
+		self._call('set_settings', **values)
+		# the preview is encoded on this side
+		self.frame_hub.preview_fps = values.get('preview_fps', self.frame_hub.preview_fps)
+		self.frame_hub.jpeg_quality = values.get('preview_jpeg_quality', self.frame_hub.jpeg_quality)
+
+	def current_settings(self):
+		return self._call('current_settings')
+
+	def metrics_snapshot(self):
+		return self._call('metrics.snapshot', source = self.name)
+
+	def stream_original_frame(self):
+		return self.frame_hub.subscribe()
+
+	def stream_status(self, last_event_id = None):
+		return self.status_bus.sse(last_event_id)
+
+	# the detector process
+	def _run(self):
+		self.control.close()
+		self.events.close()
+		send_lock = threading.Lock() # the detection loop and the status thread both send events
+		settings = SettingsStore(source_conf_file(self.name), initial = self.initial_conf)
+		args = dict(self.args, **{k: v for k, v in saved_settings(settings).items() if k not in self.explicit})
+		args['event_log'] = self.event_log
+		live = not isinstance(self.src, str)
+		try:
+			with MotionDetector(None if live else self.src, device = self.src if live else 0, settings = settings, **args) as md:
+				md.frame_hub.close()
+				md.frame_hub = SharedPreview(preview_path(self.name), md.frame_dim, create = True, preview_fps = md.preview_fps, jpeg_quality = md.preview_jpeg_quality)
+				with send_lock:
+					self.child_events.send(('ready', (md.frame_hub.path, md.frame_dim, md.current_settings())))
+				threading.Thread(target = self._forward_status, args = (md, send_lock), name = 'status-forward', daemon = True).start()
+				threading.Thread(target = md.stream, args = (TriggerLink(self.child_events, send_lock),), name = 'detect', daemon = True).start()
+				self._serve(md)
+		except KeyboardInterrupt: # Ctrl-C reaches the whole process group, the web server stops the sources
+			pass
+
+	def _forward_status(self, md, send_lock):
+		for seq, t, text in md.status_bus.subscribe():
+			try:
+				with send_lock:
+					self.child_events.send(('status', text))
+			except OSError: # the web server is gone
+				return
+
+	def _serve(self, md):
+		''' answers web UI calls until stopped '''
+		while True:
+			try:
+				method, args, kwargs = self.child_control.recv()
+			except EOFError:
+				return
+			if method == 'stop':
+				self.child_control.send((True, None))
+				return
+			try:
+				value = reduce(getattr, method.split('.'), md)
+				self.child_control.send((True, value(*args, **kwargs) if callable(value) else value))
+			except ValueError as e:
+				self.child_control.send((False, e))
+			except Exception as e:
+				traceback.print_exc(file=sys.stdout)
+				self.child_control.send((False, ValueError(f'{method} failed on source {self.name}: {e}')))
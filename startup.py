@@ -0,0 +1,82 @@
+''' Startup timing and readiness.
+	StartupReport records when each startup phase was reached, in seconds since the process started (from /proc, so the
+	interpreter start and the imports are included), prints it and serves it on /metrics as birdwatcher_startup_seconds{phase=...}.
+	Phases are marked from whichever thread reaches them, e.g. in the single source app:
+	- imports: the app's modules are imported
+	- dslr_worker / dslr: the camera worker process was started / its camera is initialized
+	- camera_open / first_frame / first_detection: the webcam was opened / delivered its first frame / the first frame was processed
+	- web: the web server is listening
+	- ready: all the required phases are reached. systemd is notified then (Type=notify services), so a watchdog restart is
+	  over when the detector is actually running, not after a fixed delay
+'''
+import os
+import socket
+import threading
+import time
+
+def process_age():
+	''' seconds since this process started, None where /proc isn't there '''
+	try:
+		with open('/proc/self/stat') as f:
+			start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+		with open('/proc/uptime') as f:
+			uptime = float(f.read().split()[0])
+		return max(uptime - start_ticks / os.sysconf('SC_CLK_TCK'), 0)
+	except (OSError, ValueError, IndexError):
+		return None
+
+def notify_ready():
+	''' READY=1 to systemd, when started by it with a notify socket '''
+	address = os.environ.get('NOTIFY_SOCKET')
+	if not address:
+		return
+	if address.startswith('@'): # abstract socket
+		address = '\0' + address[1:]
+	try:
+		with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as s:
+			s.connect(address)
+			s.sendall(b'READY=1')
+	except OSError as e:
+		print (f'could not notify systemd: {e}')
+
+
+class StartupReport:
+	''' phases in the order they were reached. ready is marked once all of required are '''
+	def __init__(self, required = ()):
+		age = process_age()
+		self.start = time.monotonic() - (age or 0)
+		self.required = set(required)
+		self.phases = {}
+		self.metrics = None
+		self.ready = threading.Event()
+		self.lock = threading.Lock()
+
+	def attach(self, metrics):
+		''' serves the phases reached so far, and those to come, on metrics '''
+		with self.lock:
+			self.metrics = metrics
+			for phase in self.phases:
+				self._gauge(phase)
+
+	def _gauge(self, phase):
+		self.metrics.gauge('birdwatcher_startup_seconds', 'seconds from process start to each startup phase', lambda: self.phases[phase], phase = phase)
+
+	def mark(self, phase):
+		''' the first time a phase is reached counts '''
+		with self.lock:
+			if phase in self.phases:
+				return
+			self.phases[phase] = round(time.monotonic() - self.start, 3)
+			print (f'startup: {phase} after {self.phases[phase]:.2f} s')
+			if self.metrics:
+				self._gauge(phase)
+			ready = not self.ready.is_set() and self.required <= set(self.phases)
+			if ready:
+				self.ready.set()
+		if ready:
+			self.mark('ready')
+			print ('startup report:', self.report())
+			notify_ready()
+
+	def report(self):
+		return ', '.join(f'{phase} {t:.2f} s' for phase, t in self.phases.items())
@@ -0,0 +1,109 @@
+import threading
+import time
+from defaults import *
+
+class StatusBus:
+	''' Fans status changes out to any number of SSE subscribers.
+		publish() stores a timestamped event with the next sequence number in a bounded ring and returns; it never waits for subscribers.
+		Every subscriber keeps its own cursor (the last sequence number it got), so no subscriber consumes events for the others,
+		and a client reconnecting with Last-Event-ID gets what it missed, as long as it is still in the ring.
+		Flips between "Movement Detected" and "Undetected" are coalesced: a flip less than coalesce_sec after the previously
+		published one is held back, and only the latest held flip is published once the interval has passed
+		(or dropped, if another status comes first).
+		Subscribers on an event loop (async_server.py) get called back through add_listener() and poll events_after() instead of blocking.
+	'''
+	def __init__(self, history = DEFAULT_STATUS_HISTORY, coalesce_sec = DEFAULT_STATUS_COALESCE_SEC, status = 'Undetected'):
+		self.history = history
+		self.coalesce_sec = coalesce_sec
+		self.ring = [None] * history # (seq, time, text). event seq lives in slot seq % history
+		self.seq = 0 # sequence number of the newest event, 0 before the first one
+		self.current = status
+		self.pending = None # held back flip (time, text)
+		self.last_flip = 0
+		self.coalesced = 0
+		self.changed = threading.Condition()
+		self._listeners = []
+
+	def publish(self, text, flip = False):
+		''' flip marks detection state changes that may be coalesced. returns False if text is already the current status '''
+		now = time.time()
+		with self.changed:
+			self._release_pending()
+			if text == self.current:
+				return False
+			self.current = text
+			if not flip:
+				self.pending = None
+				self._append(now, text)
+			elif now - self.last_flip < self.coalesce_sec:
+				if self.pending:
+					self.coalesced += 1
+				self.pending = (now, text)
+				self._notify() # waiting subscribers start timing the interval
+			else:
+				self.pending = None
+				self.last_flip = now
+				self._append(now, text)
+			return True
+
+	def _append(self, t, text):
+		self.seq += 1
+		self.ring[self.seq % self.history] = (self.seq, t, text)
+		self._notify()
+
+	def _notify(self):
+		self.changed.notify_all()
+		for callback in self._listeners:
+			callback()
+
+	def add_listener(self, callback):
+		''' callback() is called on every new or held back event, with the bus locked. it must not block '''
+		self._listeners.append(callback)
+
+	def _release_pending(self):
+		# publish the held back flip once its coalescing interval passed
+		if self.pending and time.time() - self.last_flip >= self.coalesce_sec:
+			t, text = self.pending
+			self.pending = None
+			if self.seq and self.ring[self.seq % self.history][2] == text: # flipped back to what subscribers already have
+				return
+			self.last_flip = time.time()
+			self._append(t, text)
+
+	def cursor(self, last_id = None):
+		''' where a subscriber starts: after sequence number last_id. without it, with the newest event '''
+		with self.changed:
+			return max(self.seq - 1, 0) if last_id is None else min(last_id, self.seq)
+
+	def _events_after(self, cursor):
+		# events older than the ring are gone
+		return [self.ring[s % self.history] for s in range(max(cursor, self.seq - self.history, 0) + 1, self.seq + 1)]
+
+	def events_after(self, cursor):
+		''' (events after cursor, new cursor, seconds to check again for a held back flip or None). never blocks '''
+		with self.changed:
+			self._release_pending()
+			return self._events_after(cursor), self.seq, self.coalesce_sec if self.pending else None
+
+	def subscribe(self, last_id = None):
+		''' generator of (seq, time, text) events after sequence number last_id. without it, starts with the newest event '''
+		cursor = self.cursor(last_id)
+		while True:
+			with self.changed:
+				self._release_pending()
+				while cursor == self.seq:
+					self.changed.wait(timeout = self.coalesce_sec if self.pending else None)
+					self._release_pending()
+				events = self._events_after(cursor)
+				cursor = self.seq
+			yield from events
+
+	def sse(self, last_id = None):
+		''' the events as server-sent events text. a client reconnecting with Last-Event-ID resumes after that event '''
+		for event in self.subscribe(last_id):
+			yield sse_event(*event)
+
+
+def sse_event(seq, t, text):
+	t = time.strftime("%y-%m-%d %H:%M:%S", time.localtime(t))
+	return f"id: {seq}\ndata: {t}:{text}\n\n"
@@ -0,0 +1,225 @@
+''' Parameter sweep: evaluates a grid of detection settings against recorded clips and labeled "bird present" intervals.
+	Each clip is decoded and converted to grayscale once, cropped to the union of all tested detection squares, and streamed
+	in chunks through two memory mapped files (the double buffer, in /dev/shm when there is one) to a set of worker processes. Each worker keeps one FrameDetector per
+	configuration it owns, so decode work is shared by every configuration.
+'''
+import argparse
+import collections
+import csv
+import itertools
+import mmap
+import os
+import tempfile
+import time
+from multiprocessing import Process, Pipe
+import cv2
+import imutils
+import numpy as np
+import yaml
+from detection import FrameDetector, Zone, detect_rect, local_rect, load_zones, BLUR_TYPES
+from background import BACKGROUND_MODELS
+from shared_preview import shm_folder
+from defaults import *
+
+SWEEP_PARAMS = ('triggered_area_percent', 'frames_to_trigger', 'frames_required', 'threshold', 'blur_kernel', 'capture_square_side', 'background_model', 'detection_scale', 'blur_type')
+CHUNK_FRAMES = 256
+
+def map_buffer(path, shape):
+	''' the frame buffer file at path, mapped. (mmap, array of shape) '''
+	fd = os.open(path, os.O_RDWR)
+	try:
+		mm = mmap.mmap(fd, int(np.prod(shape)))
+	finally:
+		os.close(fd)
+	return mm, np.ndarray(shape, np.uint8, buffer = mm)
+
+def sweep_worker(conn, paths, configs, center, retrigger_interval, rebase_interval):
+	mms = []
+	buffers = []
+	try:
+		while True:
+			msg = conn.recv()
+			if msg[0] == 'clip':
+				_, fps, union, frame_dim, shape = msg
+				if not mms:
+					mms, buffers = zip(*(map_buffer(path, shape) for path in paths))
+				detectors = []
+				for c in configs:
+					zone = Zone('sweep', *center, c['capture_square_side'], c['triggered_area_percent'], c['frames_to_trigger'], retrigger_interval, c['frames_required'])
+					det = FrameDetector([zone], frame_dim, c['threshold'], c['blur_kernel'], rebase_interval, c['background_model'],
+						detection_scale = c['detection_scale'], blur_type = c['blur_type'])
+					detectors.append((local_rect(det.union, union), det))
+				triggers = [[] for c in configs]
+			elif msg[0] == 'chunk':
+				_, b, start, n = msg
+				for (rect, det), trig in zip(detectors, triggers):
+					for i in range(n):
+						t = (start + i) / fps
+						if det.process_gray(buffers[b][i][rect], t).fired:
+							trig.append(t)
+				conn.send(b)
+			elif msg[0] == 'end_clip':
+				conn.send(triggers)
+			else:
+				break
+	finally:
+		del buffers
+		for mm in mms:
+			mm.close()
+
+def submit_chunk(pending, workers, b, start, n):
+	for conn, p in workers:
+		conn.send(('chunk', b, start, n))
+	pending.append(b)
+
+def release_oldest(pending, workers):
+	# workers handle chunks in order, so each one's next reply is for the oldest pending buffer
+	pending.popleft()
+	for conn, p in workers:
+		conn.recv()
+
+def decode_clip(path, center, side, frame_resize):
+	''' yields (fps, union rect, frame dim) once, then the grayscale union crop of every frame '''
+	vs = cv2.VideoCapture(path)
+	fps = vs.get(cv2.CAP_PROP_FPS) or DEFAULT_TARGET_FPS
+	union = None
+	while True:
+		ok, frame = vs.read()
+		if not ok:
+			break
+		frame = frame if frame_resize is None else imutils.resize(frame, width = frame_resize)
+		if union is None:
+			union = detect_rect(*center, side, frame.shape)
+			yield fps, union, frame.shape
+		yield cv2.cvtColor(frame[union], cv2.COLOR_BGR2GRAY)
+	vs.release()
+
+def score(triggers, intervals, tolerance):
+	''' a trigger is a true positive if it falls within tolerance seconds of a labeled interval, an interval is found if any trigger hits it '''
+	tp = sum(1 for t in triggers if any(s - tolerance <= t <= e + tolerance for s, e in intervals))
+	found = sum(1 for s, e in intervals if any(s - tolerance <= t <= e + tolerance for t in triggers))
+	return tp, found
+
+def run_sweep(clips, labels, grid, center, processes, retrigger_interval, rebase_interval, frame_resize = None, tolerance = 0.0):
+	configs = [dict(zip(SWEEP_PARAMS, values)) for values in itertools.product(*(grid[p] for p in SWEEP_PARAMS))]
+	side = max(grid['capture_square_side'])
+	shape = (CHUNK_FRAMES, side, side)
+	processes = max(1, min(processes, len(configs)))
+	owned = [range(len(configs))[i::processes] for i in range(processes)]
+	stats = [{'triggers': 0, 'tp': 0, 'intervals': 0, 'found': 0} for c in configs]
+	frames = 0
+	start_time = time.time()
+	paths, mms, buffers, workers = [], [], [], []
+	try:
+		for _ in range(2):
+			fd, path = tempfile.mkstemp(prefix = 'birdwatcher-sweep-', dir = shm_folder())
+			paths.append(path)
+			os.ftruncate(fd, int(np.prod(shape)))
+			os.close(fd)
+			mm, buffer = map_buffer(path, shape)
+			mms.append(mm)
+			buffers.append(buffer)
+		for ids in owned:
+			conn, child_conn = Pipe()
+			p = Process(target = sweep_worker, args = (child_conn, paths, [configs[i] for i in ids], center, retrigger_interval, rebase_interval), daemon = True)
+			p.start()
+			workers.append((conn, p))
+		for clip in clips:
+			frames_iter = decode_clip(clip, center, side, frame_resize)
+			first = next(frames_iter, None)
+			if first is None:
+				print (f'{clip}: no frames could be read, skipped')
+				continue
+			fps, union, frame_dim = first
+			h, w = union[0].stop - union[0].start, union[1].stop - union[1].start
+			for conn, p in workers:
+				conn.send(('clip', fps, union, frame_dim, shape))
+			pending = collections.deque() # buffers handed to the workers, oldest first
+			b, start, n = 0, 0, 0
+			for gray in frames_iter:
+				if n == 0 and b in pending: # wait for every worker to release this buffer before overwriting it
+					release_oldest(pending, workers)
+				buffers[b][n, :h, :w] = gray
+				n += 1
+				if n == CHUNK_FRAMES:
+					submit_chunk(pending, workers, b, start, n)
+					b, start, n = 1 - b, start + n, 0
+			if n:
+				submit_chunk(pending, workers, b, start, n)
+			while pending:
+				release_oldest(pending, workers)
+			frames += start + n
+			intervals = labels.get(clip, [])
+			for (conn, p), ids in zip(workers, owned):
+				conn.send(('end_clip',))
+				for i, trig in zip(ids, conn.recv()):
+					tp, found = score(trig, intervals, tolerance)
+					stats[i]['triggers'] += len(trig)
+					stats[i]['tp'] += tp
+					stats[i]['intervals'] += len(intervals)
+					stats[i]['found'] += found
+	finally:
+		for conn, p in workers:
+			try:
+				conn.send(('stop',))
+			except OSError: # the worker died
+				pass
+			p.join(timeout = 5)
+			if p.is_alive():
+				p.terminate()
+		del buffers
+		for mm in mms:
+			mm.close()
+		for path in paths:
+			os.unlink(path)
+	elapsed = time.time() - start_time
+	print (f'{frames} frames x {len(configs)} configurations in {elapsed:.1f}s ({frames * len(configs) / elapsed:.0f} detector-frames/sec)')
+	results = []
+	for c, s in zip(configs, stats):
+		precision = s['tp'] / s['triggers'] if s['triggers'] else None
+		recall = s['found'] / s['intervals'] if s['intervals'] else None
+		results.append(dict(c, trigger_count = s['triggers'], precision = precision, recall = recall))
+	return results
+
+def load_labels(labels_file):
+	''' YAML or JSON mapping of clip path to a list of [start_sec, end_sec] intervals where a bird is present '''
+	if labels_file is None:
+		return {}
+	with open(labels_file) as f:
+		return {clip: [tuple(i) for i in intervals] for clip, intervals in (yaml.safe_load(f) or {}).items()}
+
+if __name__ == "__main__":
+	ap = argparse.ArgumentParser(
+		   formatter_class=lambda prog: argparse.ArgumentDefaultsHelpFormatter(
+				prog, max_help_position=80, width=150))
+	ap.add_argument("clips", nargs='+', help="recorded video files")
+	ap.add_argument("--labels", default=None, help="YAML/JSON file mapping each clip to a list of [start_sec, end_sec] intervals where a bird is present")
+	ap.add_argument("-x", "--capture-center-x", type=int, default=None, help="x coordinate - center of capture square. defaults to the first zone in the conf file")
+	ap.add_argument("-y", "--capture-center-y", type=int, default=None, help="y coordinate - center of capture square. defaults to the first zone in the conf file")
+	ap.add_argument("--triggered-area-percent", type=float, nargs='+', default=[DEFAULT_TRIGGERED_AREA_PERCENT])
+	ap.add_argument("--frames-to-trigger", type=int, nargs='+', default=[DEFAULT_FRAMES_TO_TRIGGER])
+	ap.add_argument("--frames-required", type=int, nargs='+', default=[DEFAULT_FRAMES_REQUIRED])
+	ap.add_argument("--threshold", type=int, nargs='+', default=[DEFAULT_DIFF_THRESHOLD])
+	ap.add_argument("--blur-kernel", type=int, nargs='+', default=[DEFAULT_BLUR_KERNEL])
+	ap.add_argument("--capture-square-side", type=int, nargs='+', default=[DEFAULT_CAPTURE_RECT_SIDE])
+	ap.add_argument("--background-model", nargs='+', choices=BACKGROUND_MODELS, default=[DEFAULT_BACKGROUND_MODEL])
+	ap.add_argument("--detection-scale", type=float, nargs='+', default=[DEFAULT_DETECTION_SCALE])
+	ap.add_argument("--blur-type", nargs='+', choices=BLUR_TYPES, default=[DEFAULT_BLUR_TYPE])
+	ap.add_argument("--retrigger-interval", type=int, default=DEFFAULT_RETRIGGER_INTERVAL_SEC)
+	ap.add_argument("--rebase-interval", type=int, default=REBASE_INTERVAL)
+	ap.add_argument("--frame-resize", type=int, default=DEFAULT_FRAME_RESIZE)
+	ap.add_argument("--tolerance", type=float, default=0.0, help="seconds around a labeled interval in which a trigger still counts as a hit")
+	ap.add_argument("--processes", type=int, default=4, help="number of worker processes")
+	ap.add_argument("--out", default='sweep.csv', help="CSV file for the results")
+	args = ap.parse_args()
+
+	zone = load_zones(yaml.safe_load(open(CONF_FILE)))[0]
+	center = (args.capture_center_x or zone.x, args.capture_center_y or zone.y)
+	grid = {p: getattr(args, p) for p in SWEEP_PARAMS}
+	results = run_sweep(args.clips, load_labels(args.labels), grid, center, args.processes, args.retrigger_interval, args.rebase_interval, args.frame_resize, args.tolerance)
+	with open(args.out, 'w', newline='') as f:
+		writer = csv.DictWriter(f, fieldnames = list(results[0].keys()))
+		writer.writeheader()
+		writer.writerows(results)
+	for r in results:
+		print (r)
@@ -0,0 +1,143 @@
+''' Synthetic feeder scenes, so detection can be benchmarked without a webcam, against a known ground truth of when a bird is present.
+	- birds: bird-sized blobs that fly in to the perch, stay a while moving a little, optionally hopping around, and fly off
+	- lighting drift: slow brightness change of the whole frame, like passing clouds
+	- foliage: small leaf patches flickering at random, like leaves in the wind
+	- sensor noise
+	python3 synthetic_scene.py scene.avi writes one as a video, with its labels in the format of sweep.py, for replay, sweeps and load tests.
+'''
+import argparse
+import math
+import cv2
+import numpy as np
+import yaml
+from defaults import *
+
+HOP_SECONDS = 0.2
+
+class SyntheticScene:
+	''' BGR frames of shape (rows, cols, 3). perch is the (row, column) the birds fly to, the frame center by default.
+		visits birds come, evenly spread over the scene, each present for visit_seconds (labels()). with hop_every, a perched bird
+		hops hop_distance pixels right or left of the perch and back every hop_every seconds, quickly enough to come out blurred.
+		drift is the amplitude of the brightness change (0.3 = +-30%) over drift_period seconds.
+		leaves is the number of leaf patches, flickering by up to leaf_contrast gray levels in a fraction wind of the frames.
+	'''
+	def __init__(self, shape = (480, 640), fps = DEFAULT_TARGET_FPS, seconds = 20, perch = None, bird_radius = 25,
+				visits = 3, visit_seconds = 3, hop_every = 0, hop_distance = 40, drift = 0.3, drift_period = 20, leaves = 150, leaf_contrast = 40, wind = 0.3, noise = 4, seed = 0):
+		self.shape = shape
+		self.fps = fps
+		self.seconds = seconds
+		self.perch = perch or (shape[0] // 2, shape[1] // 2)
+		self.bird_radius = bird_radius
+		self.visits = visits
+		self.visit_seconds = visit_seconds
+		self.hop_every = hop_every
+		self.hop_distance = hop_distance
+		self.drift = drift
+		self.drift_period = drift_period
+		self.leaf_contrast = leaf_contrast
+		self.wind = wind
+		self.seed = seed
+		rng = np.random.default_rng(seed)
+		self.background = cv2.GaussianBlur(rng.integers(40, 200, shape + (3,), np.uint8), (15, 15), 0).astype(np.int16)
+		# leaf patches as a label image, 0 where there is no leaf
+		self.leaf_labels = np.zeros(shape, np.int32)
+		for i in range(1, leaves + 1):
+			cv2.circle(self.leaf_labels, (int(rng.integers(0, shape[1])), int(rng.integers(0, shape[0]))), int(rng.integers(3, 7)), i, -1)
+		self.leaves = leaves
+		# a few noise frames, cycled: drawing fresh noise every frame would cost more than the detection being measured
+		self.noise = [rng.integers(-noise, noise + 1, shape + (3,), np.int16) for i in range(8)] if noise else [np.zeros(shape + (3,), np.int16)]
+
+	def labels(self):
+		''' [start_sec, end_sec] of every bird visit '''
+		return [[round(start, 3), round(start + self.visit_seconds, 3)] for start in self._visit_starts()]
+
+	def _visit_starts(self):
+		return [(k + 0.5) * self.seconds / self.visits - self.visit_seconds / 2 for k in range(self.visits)]
+
+	def bird_position(self, t):
+		''' (row, column) of the bird at t seconds, None when there is none '''
+		bird = self.bird(t)
+		return bird and bird[:2]
+
+	def bird(self, t):
+		''' (row, column, still) of the bird at t seconds, None when there is none. still is False while it flies or hops '''
+		for start in self._visit_starts():
+			if start <= t < start + self.visit_seconds:
+				since, left = t - start, start + self.visit_seconds - t
+				flight = min(0.5, self.visit_seconds / 4)
+				row, col = self.perch
+				still = False
+				if since < flight: # flying in from the left edge
+					col = col * since / flight
+				elif left < flight: # flying off to the right edge
+					col = col + (self.shape[1] - col) * (1 - left / flight)
+				else: # on the perch, pecking around
+					row += 3 * math.sin(7 * t)
+					col += 3 * math.cos(5 * t)
+					still = True
+					if self.hop_every:
+						hop, into = divmod(since - flight, self.hop_every)
+						offsets = (0, self.hop_distance, 0, -self.hop_distance)
+						col += offsets[int(hop) % 4]
+						if hop and into < HOP_SECONDS: # on the way from the previous spot
+							col += (offsets[int(hop - 1) % 4] - offsets[int(hop) % 4]) * (1 - into / HOP_SECONDS)
+							still = False
+				return int(row), int(col), still
+		return None
+
+	def frames(self, count = None):
+		''' generator of frames, count of them or the whole scene '''
+		rng = np.random.default_rng(self.seed + 1)
+		for i in range(count if count is not None else int(self.seconds * self.fps)):
+			t = i / self.fps
+			gain = 1 + self.drift * math.sin(2 * math.pi * t / self.drift_period)
+			frame = (self.background * gain).astype(np.int16)
+			if self.leaves:
+				offsets = rng.normal(0, self.leaf_contrast / 2, self.leaves + 1).astype(np.int16) * (rng.random(self.leaves + 1) < self.wind)
+				offsets[0] = 0
+				frame += offsets[self.leaf_labels][:, :, None]
+			frame += self.noise[i % len(self.noise)]
+			bird = self.bird(t)
+			if bird:
+				# lit by the same light as the rest of the scene
+				cv2.ellipse(frame, (bird[1], bird[0]), (self.bird_radius, int(self.bird_radius * 0.7)), 0, 0, 360, tuple(c * gain for c in (40, 60, 90)), -1)
+				cv2.circle(frame, (bird[1] + self.bird_radius // 2, bird[0] - self.bird_radius // 3), self.bird_radius // 3, tuple(c * gain for c in (30, 40, 60)), -1)
+			yield np.clip(frame, 0, 255).astype(np.uint8)
+
+	def write(self, path):
+		''' the scene as an MJPG video '''
+		out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), self.fps, (self.shape[1], self.shape[0]))
+		for frame in self.frames():
+			out.write(frame)
+		out.release()
+
+
+if __name__ == "__main__":
+	ap = argparse.ArgumentParser(
+		   formatter_class=lambda prog: argparse.ArgumentDefaultsHelpFormatter(
+				prog, max_help_position=80, width=150))
+	ap.add_argument("video", help="video file to write (MJPG .avi)")
+	ap.add_argument("--labels", default=None, help="labels file to write, for sweep.py and benchmark.py. default is the video name with .yaml")
+	ap.add_argument("--seconds", type=float, default=60)
+	ap.add_argument("--fps", type=int, default=DEFAULT_TARGET_FPS)
+	ap.add_argument("--width", type=int, default=640)
+	ap.add_argument("--height", type=int, default=480)
+	ap.add_argument("-x", "--perch-x", type=int, default=None, help="row the birds fly to. default is the middle, and the first zone should be there")
+	ap.add_argument("-y", "--perch-y", type=int, default=None, help="column the birds fly to")
+	ap.add_argument("--visits", type=int, default=3, help="bird visits, evenly spread")
+	ap.add_argument("--visit-seconds", type=float, default=3)
+	ap.add_argument("--hop-every", type=float, default=0, help="seconds between two hops of a perched bird. 0 is no hopping")
+	ap.add_argument("--drift", type=float, default=0.3, help="amplitude of the lighting drift, a fraction of the brightness")
+	ap.add_argument("--leaves", type=int, default=150, help="flickering leaf patches")
+	ap.add_argument("--noise", type=int, default=4, help="sensor noise, in gray levels")
+	ap.add_argument("--seed", type=int, default=0)
+	args = ap.parse_args()
+
+	perch = (args.perch_x if args.perch_x is not None else args.height // 2, args.perch_y if args.perch_y is not None else args.width // 2)
+	scene = SyntheticScene((args.height, args.width), args.fps, args.seconds, perch, visits = args.visits, visit_seconds = args.visit_seconds, hop_every = args.hop_every,
+		drift = args.drift, leaves = args.leaves, noise = args.noise, seed = args.seed)
+	scene.write(args.video)
+	labels = args.labels or args.video.rsplit('.', 1)[0] + '.yaml'
+	with open(labels, 'w') as f:
+		yaml.safe_dump({args.video: scene.labels()}, f)
+	print (f'wrote {args.video} and {labels}: birds at {scene.labels()}, perch {perch}')
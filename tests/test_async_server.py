@@ -0,0 +1,60 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+import numpy as np
+import pytest
+pytest.importorskip('tornado')
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop
+from tornado.testing import bind_unused_port
+from async_server import Notifier, make_app
+from frame_hub import FrameHub
+from status_bus import StatusBus
+
+def wsgi_app(environ, start_response):
+	start_response('200 OK', [('Content-Type', 'text/plain')])
+	return [b'flask']
+
+async def get(port, path, headers = ''):
+	reader, writer = await asyncio.open_connection('127.0.0.1', port)
+	writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n{headers}\r\n'.encode())
+	return reader, writer
+
+async def read_until(reader, marker):
+	data = b''
+	while marker not in data:
+		chunk = await asyncio.wait_for(reader.read(65536), 5)
+		assert chunk, data
+		data += chunk
+	return data
+
+def test_viewers_hold_no_thread():
+	async def run():
+		loop = IOLoop.current()
+		hub, bus = FrameHub(preview_fps = 0), StatusBus(coalesce_sec = 0)
+		live = {'main': (SimpleNamespace(frame_hub = hub, status_bus = bus), Notifier(loop), Notifier(loop))}
+		hub.add_listener(live['main'][1].notify)
+		bus.add_listener(live['main'][2].notify)
+		sock, port = bind_unused_port()
+		server = HTTPServer(make_app(wsgi_app, live))
+		server.add_sockets([sock])
+		threads = threading.active_count()
+		status = [await get(port, '/status_text', 'Last-Event-ID: 0\r\n') for i in range(3)]
+		video = [await get(port, '/video_feed_frame?source=main') for i in range(3)]
+		bus.publish('Capturing')
+		hub.publish((np.zeros((20, 20, 3), np.uint8), np.zeros((20, 20), np.uint8), np.zeros((20, 20), np.uint8), np.zeros((60, 80, 3), np.uint8)))
+		for reader, writer in status:
+			assert b'text/event-stream' in await read_until(reader, b'Capturing')
+		for reader, writer in video:
+			await read_until(reader, b'Content-Type: image/jpeg')
+		assert hub.viewers == 3 and hub.encoded_frames == 1
+		assert threading.active_count() == threads + 1 # the preview encoder
+		reader, writer = await get(port, '/video_feed_frame?source=garden')
+		assert (await read_until(reader, b'\r\n')).startswith(b'HTTP/1.1 404')
+		reader, writer = await get(port, '/zones')
+		assert (await read_until(reader, b'flask')).startswith(b'HTTP/1.1 200')
+		for reader, writer in status + video:
+			writer.close()
+		hub.close()
+		server.stop()
+	asyncio.run(run())
@@ -0,0 +1,45 @@
+import cv2
+import numpy as np
+import pytest
+from background import make_background
+
+def moving_pixels(background, frames, fps = 30):
+	''' feeds the frames to a background model as FrameDetector does. the thresholded difference of the last one '''
+	for i, gray in enumerate(frames):
+		delta = background.delta(gray)
+		thresh = np.zeros_like(gray) if delta is None else cv2.threshold(delta, 25, 255, cv2.THRESH_BINARY)[1]
+		background.update(gray, cv2.countNonZero(thresh) > 0, thresh, i / fps)
+	return thresh
+
+def drift(count = 300, gain = 60):
+	# the whole scene brightens by gain gray levels, as a cloud passes
+	return [np.full((100, 100), 80 + gain * i / count, np.uint8) for i in range(count)]
+
+def test_running_average_follows_a_lighting_drift():
+	assert cv2.countNonZero(moving_pixels(make_background('static'), drift())) == 100 * 100
+	assert cv2.countNonZero(moving_pixels(make_background('running-average', alpha = 0.05), drift())) == 0
+
+def test_running_average_sees_a_subject():
+	frames = drift(100, 0)
+	frames[-1] = frames[-1].copy()
+	frames[-1][40:60, 40:60] = 20
+	thresh = moving_pixels(make_background('running-average', alpha = 0.05), frames)
+	assert cv2.countNonZero(thresh) == cv2.countNonZero(thresh[40:60, 40:60]) == 400
+
+def test_unknown_model_is_rejected():
+	with pytest.raises(ValueError):
+		make_background('median')
+
+def test_running_average_leaves_no_ghost_after_drift_under_a_subject():
+	# the scene brightens by 40 gray levels while a dark subject sits in its middle for 100 frames, then leaves
+	background = make_background('running-average', alpha = 0.02, max_freeze = 30)
+	for i in range(300):
+		gray = np.full((100, 100), 80 + 40 * i / 300, np.uint8)
+		if 100 <= i < 200:
+			gray[40:60, 40:60] = 20
+		delta = background.delta(gray)
+		thresh = np.zeros_like(gray) if delta is None else cv2.threshold(delta, 25, 255, cv2.THRESH_BINARY)[1]
+		if 150 <= i < 200:
+			assert cv2.countNonZero(thresh[40:60, 40:60]) == 400 # the subject is still seen
+		background.update(gray, cv2.countNonZero(thresh) > 0, thresh, i / 30)
+	assert cv2.countNonZero(thresh) == 0
@@ -0,0 +1,49 @@
+import pytest
+gp = pytest.importorskip('gphoto2')
+from camera_control import CameraConfig
+
+class Widget:
+	def __init__(self, value):
+		self.value = value
+
+	def get_value(self):
+		return self.value
+
+	def set_value(self, value):
+		self.value = value
+
+class Camera:
+	''' counts the config round trips. single = False is a camera whose driver has no set_single_config '''
+	def __init__(self, single = True):
+		self.tree = Widget(None)
+		self.tree.get_child_by_name = {'capturetarget': Widget(0), 'autofocusdrive': Widget(0)}.__getitem__
+		self.single = single
+		self.calls = []
+
+	def get_config(self):
+		self.calls.append('get_config')
+		return self.tree
+
+	def set_single_config(self, name, widget):
+		if not self.single:
+			raise gp.GPhoto2Error(gp.GP_ERROR_NOT_SUPPORTED)
+		self.calls.append(f'set_single_config {name}={widget.get_value()}')
+
+	def set_config(self, tree):
+		self.calls.append('set_config')
+
+def test_config_is_fetched_once_and_only_changes_are_pushed():
+	camera = Camera()
+	config = CameraConfig(camera)
+	assert not config.set('capturetarget', 0) # the camera already has it
+	assert config.set('capturetarget', 1) and not config.set('capturetarget', 1)
+	for i in range(3):
+		config.set('autofocusdrive', 1, action = True) # actions are sent every time
+	assert camera.calls == ['get_config', 'set_single_config capturetarget=1'] + ['set_single_config autofocusdrive=1'] * 3
+
+def test_cached_tree_is_pushed_without_single_widget_support():
+	camera = Camera(single = False)
+	config = CameraConfig(camera)
+	config.set('capturetarget', 1)
+	config.set('autofocusdrive', 1, action = True)
+	assert camera.calls == ['get_config', 'set_config', 'set_config'] and not config.single
@@ -0,0 +1,105 @@
+import functools
+import json
+import os
+import queue
+from types import SimpleNamespace
+import pytest
+gp = pytest.importorskip('gphoto2')
+from camera_control import CAPTURE_IMAGE, INIT_CAMERA, RELEASE_CAMERA, CameraControlManagerSubProcess, CameraControlMsg, ChunkedDownload, CommandChannel, preview_path
+from fake_camera import FakeCamera
+
+PHOTO = bytes(range(256)) * 40
+
+class Camera:
+	''' one photo, read in pieces. partial = False is a camera whose driver has no file_read '''
+	def __init__(self, partial = True):
+		self.partial = partial
+		self.reads = 0
+
+	def file_get_info(self, folder, name):
+		return SimpleNamespace(file = SimpleNamespace(size = len(PHOTO)))
+
+	def file_read(self, folder, name, kind, offset, buffer):
+		if not self.partial:
+			raise gp.GPhoto2Error(gp.GP_ERROR_NOT_SUPPORTED)
+		self.reads += 1
+		data = PHOTO[offset:offset + len(buffer)]
+		buffer[:len(data)] = data
+		return len(data)
+
+	def file_get(self, folder, name, kind):
+		def save(path):
+			with open(path, 'wb') as f:
+				f.write(PHOTO)
+		return SimpleNamespace(save = save)
+
+def transfer(download, camera, chunk_size):
+	chunk = bytearray(chunk_size)
+	steps = 1
+	while not download.step(camera, chunk):
+		assert os.path.exists(download.target + '.part') and not os.path.exists(download.target)
+		steps += 1
+	return steps
+
+def test_photo_is_transferred_in_chunks(tmp_path):
+	camera = Camera()
+	download = ChunkedDownload('/store_00010001/DCIM/100CANON/IMG_0001.JPG', str(tmp_path))
+	assert transfer(download, camera, 4096) == 3
+	assert (tmp_path / 'IMG_0001.JPG').read_bytes() == PHOTO
+	assert not os.path.exists(download.target + '.part')
+
+def test_whole_file_without_partial_reads(tmp_path):
+	download = ChunkedDownload('/DCIM/IMG_0002.JPG', str(tmp_path))
+	assert transfer(download, Camera(partial = False), 4096) == 1
+	assert (tmp_path / 'IMG_0002.JPG').read_bytes() == PHOTO
+
+def test_restart_after_the_session_ended(tmp_path):
+	camera = Camera()
+	download = ChunkedDownload('/DCIM/IMG_0003.JPG', str(tmp_path))
+	download.step(camera, bytearray(1000))
+	download.restart()
+	transfer(download, camera, 4096)
+	assert (tmp_path / 'IMG_0003.JPG').read_bytes() == PHOTO
+
+def test_commands_are_served_by_priority_then_in_order():
+	channel = CommandChannel()
+	for cmd, args in [(CAPTURE_IMAGE, 1), (RELEASE_CAMERA, None), (CAPTURE_IMAGE, 2), (INIT_CAMERA, 'sd')]:
+		channel.put(CameraControlMsg(cmd, args))
+	assert channel.qsize() == 4
+	served = []
+	for i in range(3):
+		served.append(channel.get().args)
+		channel.task_done()
+		if i == 0:
+			channel.put_local(CameraControlMsg(CAPTURE_IMAGE, 3)) # requeued by the worker, after the captures already sent
+	assert served == [None, 'sd', 1]
+	assert [m.args for m in channel.discard()] == [2, 3]
+	assert channel.empty()
+	channel.join() # returns at once, everything is done
+	with pytest.raises(queue.Empty):
+		channel.get(block = False)
+
+def test_worker_shoots_a_burst_and_transfers_it_before_release(tmp_path):
+	camera = functools.partial(FakeCamera, 0, 0, 10, capture_delay = 0, file_kb = 100, usb_mb_per_sec = 1000)
+	with CameraControlManagerSubProcess('test', target_folder = str(tmp_path), camera_factory = camera, download_chunk_kb = 16) as camCtl:
+		camCtl.submit_task(CameraControlMsg(CAPTURE_IMAGE, {'frames': 3}))
+		camCtl.pq.join() # the release would be served before a capture still waiting
+	assert camCtl.download_backlog() == 0
+	photos = sorted(tmp_path.glob('IMG_*'))
+	assert [p.name for p in photos] == ['IMG_0001.JPG', 'IMG_0002.JPG', 'IMG_0003.JPG']
+	assert all(p.stat().st_size == 100 * 1024 for p in photos)
+
+def test_preview_first_defers_full_size_files_across_a_restart(tmp_path):
+	camera = functools.partial(FakeCamera, 0, 0, 10, capture_delay = 0, file_kb = 100, usb_mb_per_sec = 1000, preview_kb = 4)
+	with CameraControlManagerSubProcess('test', target_folder = str(tmp_path), camera_factory = camera, transfer = 'preview-first', transfer_idle_sec = 3600) as camCtl:
+		camCtl.submit_task(CameraControlMsg(CAPTURE_IMAGE, {'frames': 2}))
+		camCtl.pq.join()
+	# thumbnails right away, the full size files are left on the camera and listed for the next start
+	assert [os.path.getsize(preview_path(str(tmp_path), f'IMG_000{i}.JPG')) for i in (1, 2)] == [4 * 1024] * 2
+	assert not list(tmp_path.glob('IMG_*'))
+	manifest = tmp_path / 'transfers-test.json'
+	assert [e['name'] for e in json.loads(manifest.read_text())] == ['IMG_0001.JPG', 'IMG_0002.JPG']
+	with CameraControlManagerSubProcess('test', target_folder = str(tmp_path), camera_factory = camera) as camCtl:
+		camCtl.pq.join()
+	assert sorted(p.name for p in tmp_path.glob('IMG_*')) == ['IMG_0001.JPG', 'IMG_0002.JPG']
+	assert json.loads(manifest.read_text()) == []
@@ -0,0 +1,101 @@
+import pytest
+import numpy as np
+from detection import FrameDetector, TriggerWindow, Zone, dump_zones, find_boxes, load_zones
+
+def test_zones_trigger_independently():
+	# motion in both zones from frame 2 on: each fires after its own frames_to_trigger
+	zones = [Zone('left', 50, 50, 60, 0.05, 3), Zone('right', 50, 150, 60, 0.05, 5)]
+	detector = FrameDetector(zones, (100, 200), background_model = 'static', blur_kernel = 3)
+	fired = []
+	for i in range(12):
+		frame = np.full((100, 200, 3), 100, np.uint8)
+		if i >= 2:
+			frame[35:65, 35:65] = frame[35:65, 135:165] = 220
+		detection = detector.process(frame, i / 10, draw = False)
+		fired += [(i, name, kind) for name, kind in detection.fired]
+	assert fired == [(4, 'left', 'triggered'), (6, 'right', 'triggered')]
+
+def test_motion_outside_a_zone_is_ignored():
+	detector = FrameDetector([Zone('left', 50, 50, 60, 0.05, 3), Zone('right', 50, 150, 60, 0.05, 3)], (100, 200), background_model = 'static', blur_kernel = 3)
+	for i in range(12):
+		frame = np.full((100, 200, 3), 100, np.uint8)
+		if i >= 2:
+			frame[35:65, 135:165] = 220
+		detection = detector.process(frame, i / 10, draw = False)
+		assert all(name == 'right' for name, kind in detection.fired)
+	assert detection.valid_cnts.tolist() == [0, 1]
+
+def test_legacy_coordinates_become_one_zone():
+	zones = load_zones({'coordinates': {'x': 10, 'y': 20}}, side = 80)
+	assert zones == [Zone('default', 10, 20, 80)]
+	# settings that follow the command line defaults are not saved with the zone
+	assert 'side' not in dump_zones(zones, side = 80)['default'] and dump_zones(zones)['default']['side'] == 80
+	assert load_zones({'zones': dump_zones(zones, side = 80)}, side = 80) == zones
+
+def test_trigger_window_k_of_n():
+	# zone 0: 3 of the last 5 frames, zone 1: all of the last 2
+	window = TriggerWindow([5, 2], [3, 2])
+	motion = [(1, 1), (0, 1), (1, 0), (0, 1), (1, 1), (1, 0), (0, 0), (0, 0), (0, 0), (0, 0)]
+	triggered = [window.update(np.array(d, bool)).tolist() for d in motion]
+	# the third motion frame fills the window, which empties again as they fall out of it
+	assert [t[0] for t in triggered] == [False, False, False, False, True, True, True, False, False, False]
+	assert [t[1] for t in triggered] == [False, True, False, False, True, False, False, False, False, False]
+
+def test_trigger_window_defaults_to_all_frames_and_caps_required():
+	window = TriggerWindow([3, 2], [5, 1])
+	assert window.frames_required == [3, 1]
+	assert TriggerWindow([4]).frames_required == [4]
+
+def test_small_components_are_filtered_out():
+	thresh = np.zeros((100, 100), np.uint8)
+	thresh[10:40, 10:30] = 255 # 600 pixels
+	thresh[70:73, 70:73] = 255 # 9 pixels
+	boxes = find_boxes(thresh, 50)
+	assert boxes.tolist() == [[10, 10, 20, 30, 600]]
+	assert len(find_boxes(np.zeros((100, 100), np.uint8), 50)) == 0
+
+@pytest.mark.parametrize('scale, blur_type, gray', [(1, 'gaussian', False), (0.5, 'box', False), (0.5, 'gaussian', True)])
+def test_downscaled_detection_fires_like_full_resolution(scale, blur_type, gray):
+	zones = [Zone('left', 50, 50, 60, 0.05, 3), Zone('right', 50, 150, 60, 0.05, 5)]
+	detector = FrameDetector(zones, (100, 200), background_model = 'static', blur_kernel = 5, detection_scale = scale, blur_type = blur_type)
+	fired = []
+	for i in range(12):
+		frame = np.full((100, 200) if gray else (100, 200, 3), 100, np.uint8) # gray: the Y plane of a YUV camera
+		if i >= 2:
+			frame[35:65, 35:65] = frame[35:65, 135:165] = 220
+		detection = detector.process(frame, i / 10, draw = not gray)
+		fired += [(i, name, kind) for name, kind in detection.fired]
+	assert fired == [(4, 'left', 'triggered'), (6, 'right', 'triggered')]
+	assert detection.thresh.shape == (int(60 * scale), int(160 * scale))
+
+def test_unknown_blur_type_is_rejected():
+	with pytest.raises(ValueError):
+		FrameDetector(blur_type = 'median')
+
+# half sizes of a square that grows to a quarter of the zone, the full area score, and shrinks
+VISIT = [5, 10, 15, 20, 25, 20, 15, 10, 5, 0]
+
+def growing_square(halves):
+	''' 100x100 gray frames: the still reference, then a bright square in the middle of each half size '''
+	yield np.full((100, 100), 100, np.uint8)
+	for half in halves:
+		frame = np.full((100, 100), 100, np.uint8)
+		if half:
+			frame[50 - half:50 + half, 50 - half:50 + half] = 220
+		yield frame
+
+def test_peak_mode_shoots_the_best_frame_once():
+	# one shot, on the frame after the peak, for the peak's score
+	detector = FrameDetector([Zone('a', 50, 50, 100, 0.01, 3, 10)], (100, 100), background_model = 'static', blur_kernel = 3, trigger_mode = 'peak')
+	detections = [detector.process(frame, 1_700_000_000 + i / 10, draw = False) for i, frame in enumerate(growing_square(VISIT))]
+	shots = [i for i, d in enumerate(detections) if d.fired]
+	scores = [d.scores[0] if d.scores is not None else 0 for d in detections]
+	peak = int(np.argmax(scores))
+	assert VISIT[peak - 1] == 25
+	assert shots == [peak + 1]
+	assert detections[peak + 1].fired_scores == [round(scores[peak], 3)]
+
+def test_window_mode_shoots_when_the_window_fills():
+	detector = FrameDetector([Zone('a', 50, 50, 100, 0.01, 3, 10)], (100, 100), background_model = 'static', blur_kernel = 3, trigger_mode = 'window')
+	detections = [detector.process(frame, 1_700_000_000 + i / 10, draw = False) for i, frame in enumerate(growing_square(VISIT))]
+	assert [i for i, d in enumerate(detections) if d.fired] == [3]
@@ -0,0 +1,75 @@
+import datetime
+import time
+import numpy as np
+import pytest
+from detection import FrameDetector, Zone
+from event_log import EventLog, activity_heatmap, load_zone_names, read_events, triggers
+
+def moving_frames(count, motion):
+	''' 100x100 gray frames, a bright square in the middle on the frames where motion(i) is true '''
+	for i in range(count):
+		frame = np.full((100, 100), 100, np.uint8)
+		if motion(i):
+			frame[35:65, 35:65] = 220
+		yield frame
+
+def log_triggers(tmp_path, detector, motion, count = 200):
+	''' runs the detector over the frames and logs the zones that fired to an EventLog, like MotionDetector's loop.
+		(number of zones fired, trigger records read back from the log) '''
+	log = EventLog(str(tmp_path))
+	fired = 0
+	for i, frame in enumerate(moving_frames(count, motion)):
+		t = 1_700_000_000 + i / 10
+		detection = detector.process(frame, t, draw = False)
+		if detection.valid_cnts is not None:
+			log.trigger(t, detection, detector.zones)
+			fired += len(detection.fired)
+	log.close()
+	return fired, read_events(str(tmp_path), 'trigger', 0, 2e9)
+
+def test_k_of_n_retrigger_on_a_frame_without_motion(tmp_path):
+	# 5 of 10 frames with motion: the window stays full on the still frames in between, so retriggers come without boxes
+	detector = FrameDetector([Zone('a', 50, 50, 100, 0.05, 10, 1, 5)], (100, 100), background_model = 'static', blur_kernel = 3)
+	fired, records = log_triggers(tmp_path, detector, lambda i: i % 2)
+	assert fired and len(records) == fired
+	empty = records[records['boxes'] == 0]
+	assert len(empty) and not empty['w'].any() and not empty['h'].any()
+
+def test_peak_mode_fires_on_the_frame_after_the_peak(tmp_path):
+	# a visit that ends abruptly: the frame after the peak has no motion
+	detector = FrameDetector([Zone('a', 50, 50, 100, 0.05, 10, 1, 5)], (100, 100), background_model = 'static', blur_kernel = 3, trigger_mode = 'peak')
+	fired, records = log_triggers(tmp_path, detector, lambda i: 5 <= i < 20, count = 40)
+	assert fired and len(records) == fired
+	assert (records['boxes'] == 0).any()
+
+def test_new_zone_names_are_written_by_the_writer_thread(tmp_path):
+	log = EventLog(str(tmp_path), flush_interval = 3600)
+	assert log.zone_id('feeder') == 0 and log.zone_id('nest') == 1 and log.zone_id('feeder') == 0
+	assert not (tmp_path / 'zones.json').exists()
+	log.close()
+	assert load_zone_names(str(tmp_path)) == ['feeder', 'nest']
+	reopened = EventLog(str(tmp_path))
+	assert reopened.zone_id('nest') == 1
+	reopened.close()
+
+def test_activity_and_triggers_round_trip(tmp_path):
+	# 100 s from 7:00 local time at 10 fps, with a visit from 10 to 40 s
+	start = time.mktime((2026, 10, 17, 7, 0, 0, 0, 0, -1))
+	detector = FrameDetector([Zone('feeder', 50, 50, 100, 0.05, 5, 60)], (100, 100), background_model = 'static', blur_kernel = 3)
+	log = EventLog(str(tmp_path))
+	for i, frame in enumerate(moving_frames(1000, lambda i: 100 <= i < 400)):
+		t = start + i / 10
+		detection = detector.process(frame, t, draw = False)
+		log.frame(t, detection, detector.zones)
+		log.trigger(t, detection, detector.zones)
+		if detection.fired:
+			log.download(t + 2, t, 'IMG_0001.JPG')
+	log.close()
+	days, heatmap = activity_heatmap(str(tmp_path), days = 1, end = start)
+	assert days == [datetime.date(2026, 10, 17)]
+	assert heatmap[0, 7] == pytest.approx(30 / 3600, abs = 1 / 3600) and heatmap.sum() == heatmap[0, 7]
+	listed = triggers(str(tmp_path), start, start + 3600)
+	assert len(listed) == 1 and listed[0]['zone'] == 'feeder' and listed[0]['files'] == ['IMG_0001.JPG']
+	x, y, w, h = listed[0]['box']
+	assert x <= 35 and y <= 35 and x + w >= 65 and y + h >= 65
+	assert triggers(str(tmp_path), start, start + 3600, hours = (8, 9)) == []
@@ -0,0 +1,23 @@
+import numpy as np
+from frame_hub import FrameHub
+
+def frames():
+	# (detection square, threshold, delta, original frame)
+	return (np.zeros((20, 20, 3), np.uint8), np.zeros((20, 20), np.uint8), np.zeros((20, 20), np.uint8), np.zeros((60, 80, 3), np.uint8))
+
+def test_viewers_share_one_encoding():
+	hub = FrameHub(preview_fps = 0)
+	hub.publish(frames())
+	a, b = hub.subscribe(), hub.subscribe()
+	jpeg = next(a)
+	assert jpeg.startswith(b'--frame\r\nContent-Type: image/jpeg') and next(b) is jpeg
+	assert hub.encoded_frames == 1 and hub.viewers == 2
+	hub.close()
+	assert list(a) == [] and list(b) == [] and hub.viewers == 0
+
+def test_nothing_is_encoded_without_viewers():
+	hub = FrameHub(preview_fps = 0)
+	for i in range(10):
+		hub.publish(frames())
+	assert hub.generation == 10 and hub.encoded_frames == 0
+	hub.close()
@@ -0,0 +1,46 @@
+import threading
+import numpy as np
+from frame_source import CaptureThreadSource
+
+class ScriptedSource(CaptureThreadSource):
+	''' a camera delivering frames with the given timestamps, then none '''
+	def __init__(self, timestamps):
+		CaptureThreadSource.__init__(self)
+		self.timestamps = list(timestamps)
+
+	def _grab(self):
+		if not self.timestamps:
+			return None, None, None
+		return np.zeros((10, 10), np.uint8), self.timestamps.pop(0), None
+
+	def _close(self):
+		pass
+
+class FailingSource(ScriptedSource):
+	''' delivers its frames, then its camera goes away '''
+	def _grab(self):
+		if not self.timestamps:
+			raise OSError('camera unplugged')
+		return ScriptedSource._grab(self)
+
+def read_all(source):
+	frames = []
+	reader = threading.Thread(target = lambda: frames.extend(iter(source.read, None)), daemon = True)
+	reader.start()
+	reader.join(timeout = 5)
+	assert not reader.is_alive()
+	return frames
+
+def test_every_frame_is_delivered_once_or_counted():
+	# the camera repeats frame 2. frames the reader was too slow for are dropped, never handed out twice
+	source = ScriptedSource([1, 2, 2, 3, 4]).start()
+	frames = read_all(source)
+	source.stop()
+	assert source.captured == 4 and source.duplicated == 1
+	assert len(frames) == source.delivered and source.delivered + source.dropped == 4
+	assert len(set(t for frame, t in frames)) == len(frames)
+
+def test_read_returns_none_when_capture_fails():
+	source = FailingSource([1, 2, 3]).start()
+	assert len(read_all(source)) <= 3 and not source.running
+	source.stop()
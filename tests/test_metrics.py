@@ -0,0 +1,32 @@
+from metrics import Metrics
+
+def test_histogram_renders_in_prometheus_format():
+	metrics = Metrics()
+	histogram = metrics.histogram('birdwatcher_test_seconds', 'time of a test stage', buckets = (0.1, 1), stage = 'blur')
+	for value in (0.05, 0.5, 2):
+		histogram.observe(value)
+	metrics.gauge('birdwatcher_test_viewers', 'viewers of a test', lambda: 3)
+	lines = metrics.render().splitlines()
+	assert '# TYPE birdwatcher_test_seconds histogram' in lines
+	assert [line for line in lines if line.startswith('birdwatcher_test_seconds_bucket')] == [
+		'birdwatcher_test_seconds_bucket{stage="blur",le="0.1"} 1',
+		'birdwatcher_test_seconds_bucket{stage="blur",le="1"} 2',
+		'birdwatcher_test_seconds_bucket{stage="blur",le="+Inf"} 3']
+	assert 'birdwatcher_test_seconds_sum{stage="blur"} 2.55' in lines and 'birdwatcher_test_seconds_count{stage="blur"} 3' in lines
+	assert 'birdwatcher_test_viewers 3' in lines
+
+def test_stage_timer_observes_every_lap():
+	metrics = Metrics()
+	timer = metrics.stage_timer('birdwatcher_test_stage_seconds', 'time of each test stage', ('read', 'detect'))
+	for i in range(5):
+		timer.start()
+		timer.lap('read')
+		timer.lap('detect')
+	assert 'birdwatcher_test_stage_seconds_count{stage="read"} 5' in metrics.render().splitlines()
+
+def test_disabled_metrics_record_nothing():
+	metrics = Metrics(False)
+	with metrics.histogram('birdwatcher_test_seconds', 'time of a test stage').time():
+		pass
+	metrics.stage_timer('birdwatcher_test_stage_seconds', 'time of each test stage', ('read',)).lap('read')
+	assert not metrics.families
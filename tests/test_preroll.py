@@ -0,0 +1,17 @@
+import os
+import cv2
+import numpy as np
+from preroll import PrerollBuffer
+
+def test_clip_holds_the_seconds_around_the_trigger(tmp_path):
+	# 10 fps, 1 second before the trigger and half a second after it. frame i is all gray level 5 * i
+	preroll = PrerollBuffer((40, 60, 3), 10, str(tmp_path), preroll_sec = 1, postroll_sec = 0.5, file_format = 'jpg', slack_sec = 1)
+	for i in range(40):
+		preroll.push(np.full((40, 60, 3), 5 * i, np.uint8))
+		if i == 29:
+			preroll.save('trigger')
+	preroll.close()
+	names = sorted(os.listdir(tmp_path / 'trigger'))
+	assert len(names) == 16 and preroll.skipped_frames == 0
+	levels = [int(round(cv2.imread(str(tmp_path / 'trigger' / name)).mean() / 5)) for name in names]
+	assert levels == list(range(19, 35))
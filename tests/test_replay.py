@@ -0,0 +1,31 @@
+import json
+import os
+import cv2
+import numpy as np
+from motion_detector import MotionDetector
+from replay import run_replay
+
+def write_clip(path, frames = 90, fps = 30):
+	''' 160x120 clip of a still scene, with a bright square in the middle from the first to the second second '''
+	out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (160, 120))
+	for i in range(frames):
+		frame = np.full((120, 160, 3), 100, np.uint8)
+		if fps <= i < 2 * fps:
+			frame[45:75, 65:95] = 220
+		out.write(frame)
+	out.release()
+	return path
+
+def test_replay_reports_the_triggers_in_video_time(tmp_path, monkeypatch):
+	monkeypatch.chdir(tmp_path) # the detector reads its zone from conf/conf.yaml
+	os.mkdir('conf')
+	with open('conf/conf.yaml', 'w') as f:
+		f.write('coordinates: {x: 60, y: 80}\n')
+	clip = write_clip('clip.avi')
+	with MotionDetector(clip, capture_square_side = 60, frames_to_trigger = 5, frame_resize = None, realtime = False) as md:
+		summary = run_replay(md, 'report.json')
+	with open('report.json') as f:
+		report = json.load(f)
+	assert summary['frames'] >= 88 and summary['video_fps'] == 30
+	assert summary['triggers'] == summary['captures_submitted'] == 1
+	assert 1 <= report['triggers'][0]['time_sec'] < 1.5
@@ -0,0 +1,85 @@
+import time
+import yaml
+import pytest
+from motion_detector import MotionDetector, check_settings, saved_settings
+from settings_store import SettingsStore
+import motion_detector_app
+
+@pytest.fixture
+def detector(tmp_path):
+	settings = SettingsStore(str(tmp_path / 'conf.yaml'), write_delay = 0, initial = {'zones': {'feeder': {'x': 50, 'y': 50}}})
+	md = MotionDetector(None, settings = settings, background_model = 'static')
+	md.frame_dim = (100, 100)
+	yield md
+	settings.close()
+
+@pytest.mark.parametrize('values', [{'frames_to_trigger': 0}, {'frames_required': 0}, {'threshold': 256}, {'threshold': -1},
+	{'triggered_area_percent': 0}, {'triggered_area_percent': 1.5}, {'capture_square_side': 0}, {'retrigger_interval': -1},
+	{'blur_kernel': 4}, {'detection_scale': 0}, {'trigger_mode': 'burst'}, {'zones': 1}])
+def test_invalid_settings_are_rejected_and_not_saved(detector, values):
+	with pytest.raises(ValueError):
+		detector.set_settings(**values)
+	assert 'settings' not in detector.settings.data
+
+def test_valid_settings_apply_to_the_zones(detector):
+	detector.set_settings(frames_to_trigger = 4, frames_required = 2, threshold = 30)
+	assert detector.zones[0].frames_to_trigger == 4
+	assert detector.settings.get('settings') == {'frames_to_trigger': 4, 'frames_required': 2, 'threshold': 30}
+
+def test_settings_route_answers_400(detector):
+	motion_detector_app.flask_app.sources = {'main': detector}
+	client = motion_detector_app.flask_app.test_client()
+	assert client.get('/settings?frames_to_trigger=0').status_code == 400
+	assert client.get('/settings?threshold=300').status_code == 400
+	assert client.get('/settings?threshold=30').json['threshold'] == 30
+
+def test_invalid_saved_settings_are_ignored(tmp_path):
+	settings = SettingsStore(str(tmp_path / 'conf.yaml'), initial = {'settings': {'frames_to_trigger': 0, 'threshold': 30}})
+	assert saved_settings(settings) == {'threshold': 30}
+	settings.close()
+	check_settings({'frames_required': None})
+
+def test_replay_store_never_writes(tmp_path):
+	# zone edits move coordinates to zones, and command line zone settings are saved: not with write_delay None
+	path = tmp_path / 'conf.yaml'
+	path.write_text('coordinates: {x: 50, y: 50}\n')
+	settings = SettingsStore(str(path), write_delay = None)
+	md = MotionDetector(None, settings = settings, background_model = 'static', triggered_area_percent = 0.2)
+	md.frame_dim = (100, 100)
+	md._apply_zones('replay')
+	settings.close()
+	assert 'zones' in settings.data and path.read_text() == 'coordinates: {x: 50, y: 50}\n'
+
+def test_bursts_of_changes_become_one_atomic_write(tmp_path):
+	path = tmp_path / 'conf.yaml'
+	path.write_text('threshold: 20\n')
+	store = SettingsStore(str(path), write_delay = 60)
+	for threshold in range(21, 31):
+		store.set('threshold', threshold)
+	store.set('zones', {'feeder': {'x': 50, 'y': 50}})
+	store.remove('zones')
+	assert store.writes == 0 and path.read_text() == 'threshold: 20\n' # still waiting for more changes
+	store.close()
+	assert store.writes == 1 and yaml.safe_load(path.read_text()) == {'threshold': 30}
+	assert [p.name for p in tmp_path.iterdir()] == ['conf.yaml']
+
+def test_writer_thread_saves_after_the_delay(tmp_path):
+	path = tmp_path / 'conf.yaml'
+	path.write_text('{}\n')
+	store = SettingsStore(str(path), write_delay = 0.05)
+	store.set('threshold', 30)
+	deadline = time.monotonic() + 5
+	while store.writes == 0 and time.monotonic() < deadline:
+		time.sleep(0.01)
+	assert yaml.safe_load(path.read_text()) == {'threshold': 30}
+	store.close()
+	assert store.writes == 1
+
+def test_unchanged_content_is_not_written(tmp_path):
+	path = tmp_path / 'conf.yaml'
+	path.write_text('threshold: 20\n')
+	store = SettingsStore(str(path), write_delay = 60)
+	store.set('threshold', 30)
+	store.set('threshold', 20)
+	store.close()
+	assert store.writes == 0
@@ -0,0 +1,34 @@
+import threading
+import numpy as np
+from shared_preview import SharedPreview
+
+def frames(value):
+	# (frame, thresh, delta, union) of a preview, all of one gray level
+	return (np.full((60, 80, 3), value, np.uint8), np.full((60, 80), value, np.uint8), np.full((60, 80), value, np.uint8), np.full((60, 80, 3), value, np.uint8))
+
+def test_reader_never_gets_a_torn_composite(tmp_path):
+	writer = SharedPreview(str(tmp_path / 'preview'), (60, 80), create = True, preview_fps = 0)
+	reader = SharedPreview(str(tmp_path / 'preview'), (60, 80))
+	assert reader.read() == (0, None)
+	writer.viewers = 1
+	writer.publish(frames(1))
+	stop = threading.Event()
+	def publish():
+		i = 0
+		while not stop.is_set():
+			i += 1
+			writer.publish(frames(i % 250))
+	thread = threading.Thread(target = publish)
+	thread.start()
+	try:
+		last = 0
+		for i in range(1000):
+			generation, vis = reader.read()
+			assert generation >= last
+			last = generation
+			assert len(np.unique(vis[:, :80])) == 1 # the frame part of the composite comes from one frame
+	finally:
+		stop.set()
+		thread.join()
+	reader.close()
+	writer.close()
@@ -0,0 +1,47 @@
+import socket
+import sys
+import pytest
+from lazy_import import lazy_import
+from metrics import Metrics
+from startup import StartupReport
+
+@pytest.fixture
+def probe(tmp_path, monkeypatch):
+	''' name of a module that counts its executions in sys.lazy_probe '''
+	(tmp_path / 'lazy_probe.py').write_text("import sys\nsys.lazy_probe = getattr(sys, 'lazy_probe', 0) + 1\nVALUE = 42\n")
+	monkeypatch.syspath_prepend(str(tmp_path))
+	monkeypatch.setattr(sys, 'lazy_probe', 0, raising = False)
+	yield 'lazy_probe'
+	sys.modules.pop('lazy_probe', None)
+
+def test_lazy_module_runs_on_first_use(probe):
+	module = lazy_import(probe)
+	assert sys.lazy_probe == 0
+	assert module.VALUE == 42 and sys.lazy_probe == 1
+	assert lazy_import(probe) is module and sys.lazy_probe == 1
+
+def test_missing_module_fails_only_when_used():
+	module = lazy_import('no_such_module_here')
+	with pytest.raises(ImportError):
+		module.anything
+
+def test_ready_once_every_required_phase_is_reached(tmp_path, monkeypatch):
+	# systemd's notify socket
+	server = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+	server.bind(str(tmp_path / 'notify'))
+	monkeypatch.setenv('NOTIFY_SOCKET', str(tmp_path / 'notify'))
+	report = StartupReport(required = ('first_detection', 'web'))
+	report.mark('imports')
+	metrics = Metrics()
+	report.attach(metrics)
+	report.mark('web')
+	assert not report.ready.is_set()
+	first = report.phases['web']
+	report.mark('web')
+	report.mark('first_detection')
+	assert report.ready.is_set() and report.phases['web'] == first
+	assert list(report.phases) == ['imports', 'web', 'first_detection', 'ready']
+	assert server.recv(64) == b'READY=1'
+	server.close()
+	lines = metrics.render().splitlines()
+	assert all(any(line.startswith(f'birdwatcher_startup_seconds{{phase="{phase}"}}') for line in lines) for phase in report.phases)
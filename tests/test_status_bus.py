@@ -0,0 +1,31 @@
+from itertools import islice
+from status_bus import StatusBus
+
+def texts(subscriber, n):
+	return [text for seq, t, text in islice(subscriber, n)]
+
+def test_every_subscriber_gets_every_event():
+	bus = StatusBus(history = 8, coalesce_sec = 0)
+	first, second = bus.subscribe(0), bus.subscribe(0)
+	for text in ['Camera ready', 'Capturing', 'Camera ready']:
+		assert bus.publish(text)
+	assert not bus.publish('Camera ready') # already the current status
+	assert texts(first, 3) == texts(second, 3) == ['Camera ready', 'Capturing', 'Camera ready']
+
+def test_reconnect_gets_what_it_missed_while_in_the_ring():
+	bus = StatusBus(history = 4, coalesce_sec = 0)
+	for i in range(6):
+		bus.publish(f'status {i}')
+	assert [seq for seq, t, text in islice(bus.subscribe(last_id = 4), 2)] == [5, 6]
+	# events 1 and 2 fell out of the ring
+	assert texts(bus.subscribe(last_id = 0), 4) == ['status 2', 'status 3', 'status 4', 'status 5']
+	assert texts(bus.subscribe(), 1) == ['status 5']
+
+def test_quick_detection_flips_are_coalesced():
+	bus = StatusBus(history = 8, coalesce_sec = 60)
+	bus.publish('Movement Detected', flip = True)
+	bus.publish('Undetected', flip = True) # held back for the interval
+	bus.publish('Movement Detected', flip = True) # replaces the held flip
+	bus.publish('Capturing') # any other status drops it
+	assert bus.coalesced == 1
+	assert texts(bus.subscribe(0), 2) == ['Movement Detected', 'Capturing']
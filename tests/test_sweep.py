@@ -0,0 +1,33 @@
+import cv2
+import numpy as np
+from sweep import SWEEP_PARAMS, run_sweep
+
+SETTINGS = {'triggered_area_percent': 0.05, 'frames_to_trigger': 5, 'frames_required': None, 'threshold': 25, 'blur_kernel': 5,
+	'capture_square_side': 60, 'background_model': 'static', 'detection_scale': 1, 'blur_type': 'gaussian'}
+
+def grid(**values):
+	''' one configuration of SETTINGS, except for the given lists of values '''
+	return {p: values.get(p, [SETTINGS[p]]) for p in SWEEP_PARAMS}
+
+def write_clip(path, frames = 90, fps = 30):
+	''' 160x120 clip of a still scene, with a bright square in the middle from the first to the second second '''
+	out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (160, 120))
+	for i in range(frames):
+		frame = np.full((120, 160, 3), 100, np.uint8)
+		if fps <= i < 2 * fps:
+			frame[45:75, 65:95] = 220
+		out.write(frame)
+	out.release()
+	return path
+
+def test_every_configuration_is_scored(tmp_path):
+	clip = write_clip(str(tmp_path / 'clip.avi'))
+	results = run_sweep([clip], {clip: [(1, 2)]}, grid(threshold = [25, 200]), (60, 80), 2, 10, 60)
+	found, missed = sorted(results, key = lambda r: r['threshold'])
+	assert (found['trigger_count'], found['precision'], found['recall']) == (1, 1, 1)
+	assert (missed['trigger_count'], missed['precision'], missed['recall']) == (0, None, 0)
+
+def test_unreadable_clip_is_skipped(tmp_path):
+	clip = write_clip(str(tmp_path / 'clip.avi'))
+	results = run_sweep([str(tmp_path / 'missing.avi'), clip], {clip: [(1, 2)]}, grid(), (60, 80), 1, 10, 60)
+	assert len(results) == 1 and results[0]['recall'] == 1
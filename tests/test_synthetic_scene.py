@@ -0,0 +1,20 @@
+import numpy as np
+from detection import FrameDetector, Zone
+from synthetic_scene import SyntheticScene
+
+def test_labels_are_the_ground_truth():
+	scene = SyntheticScene((120, 160), fps = 10, seconds = 12, bird_radius = 10, visits = 2, visit_seconds = 3)
+	assert scene.labels() == [[1.5, 4.5], [7.5, 10.5]]
+	present = [scene.bird_position(i / 10) is not None for i in range(120)]
+	assert present == [any(start <= i / 10 < end for start, end in scene.labels()) for i in range(120)]
+	# the same seed renders the same scene
+	first, again = SyntheticScene((120, 160), seed = 3).frames(5), SyntheticScene((120, 160), seed = 3).frames(5)
+	assert all(np.array_equal(a, b) for a, b in zip(first, again))
+
+def test_detector_fires_during_the_visits_only():
+	scene = SyntheticScene((120, 160), fps = 10, seconds = 12, bird_radius = 10, visits = 2, visit_seconds = 3, drift = 0, leaves = 0)
+	detector = FrameDetector([Zone('perch', 60, 80, 60, 0.05, 3, 2)], (120, 160), background_model = 'static')
+	fired = [i / 10 for i, frame in enumerate(scene.frames()) if detector.process(frame, i / 10, draw = False).fired]
+	assert fired
+	assert all(any(start <= t <= end + 0.5 for start, end in scene.labels()) for t in fired)
+	assert {int(t > 6) for t in fired} == {0, 1} # both visits
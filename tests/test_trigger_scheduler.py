@@ -0,0 +1,32 @@
+from trigger_scheduler import TriggerScheduler
+
+class Camera:
+	''' a DSLR worker that records the captures sent to it. busy = True has a command waiting '''
+	def __init__(self):
+		self.busy = False
+		self.shots = []
+
+	def empty(self):
+		return not self.busy
+
+	def submit_task(self, msg):
+		self.shots.append(msg)
+
+def test_captures_go_to_the_camera_that_fired_longest_ago():
+	cameras = [Camera(), Camera()]
+	scheduler = TriggerScheduler(cameras, ['garden', 'feeder'], retrigger_interval = 0)
+	for i in range(4):
+		assert scheduler.submit_task(i, 'garden') is cameras[i % 2]
+	cameras[0].busy = True
+	assert scheduler.submit_task(4, 'feeder') is cameras[1]
+	cameras[1].busy = True
+	assert scheduler.submit_task(5, 'feeder') is None
+	assert [c.shots for c in cameras] == [[0, 2], [1, 3, 4]]
+	assert scheduler.counts == {('garden', 'accepted'): 4, ('garden', 'dropped'): 0, ('feeder', 'accepted'): 1, ('feeder', 'dropped'): 1}
+
+def test_sources_watching_one_scene_shoot_it_once():
+	camera = Camera()
+	scheduler = TriggerScheduler([camera], ['garden', 'feeder'], retrigger_interval = 60)
+	assert scheduler.submit_task('first', 'garden') is camera
+	assert scheduler.submit_task('second', 'feeder') is None # the same visit, seen by the other source
+	assert camera.shots == ['first']
@@ -0,0 +1,36 @@
+import threading
+import time
+from metrics import Metrics
+from defaults import *
+
+class TriggerScheduler:
+	''' Arbitrates the DSLRs between all video sources: every source sends its captures here instead of to a camera of its own.
+		A capture goes to the camera that fired longest ago among those with no command waiting (a camera transferring photos
+		counts as free, captures preempt transfers). It is dropped when no camera is free or every free one fired less than
+		retrigger_interval ago, whichever source it came from, so sources watching the same scene don't shoot it twice.
+	'''
+	def __init__(self, cameras, sources = (), retrigger_interval = DEFAULT_GLOBAL_RETRIGGER_INTERVAL_SEC, metrics = None):
+		self.cameras = cameras # entered CameraControlManagerSubProcess
+		self.retrigger_interval = retrigger_interval
+		self.last_shot = [0.0] * len(cameras)
+		self.lock = threading.Lock()
+		self.counts = {(source, result): 0 for source in sources for result in ('accepted', 'dropped')}
+		metrics = metrics or Metrics(False)
+		for source, result in self.counts:
+			metrics.counter('birdwatcher_triggers_total', 'captures requested by each video source, by what the scheduler did with them',
+				lambda key = (source, result): self.counts[key], source = source, result = result)
+
+	def submit_task(self, msg, source = None):
+		''' returns the camera the capture was sent to, None if it was dropped '''
+		with self.lock:
+			now = time.time()
+			ready = [i for i, camera in enumerate(self.cameras) if camera.empty() and now - self.last_shot[i] >= self.retrigger_interval]
+			key = (source, 'accepted' if ready else 'dropped')
+			self.counts[key] = self.counts.get(key, 0) + 1
+			if not ready:
+				print (f'capture from {source} dropped: no camera ready')
+				return None
+			i = min(ready, key = lambda i: self.last_shot[i])
+			self.last_shot[i] = now
+		self.cameras[i].submit_task(msg)
+		return self.cameras[i]